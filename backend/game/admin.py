@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, GameSession, HighScore, OnlinePlayer
+from .models import User, UserStats, GameSession, ArchivedGameSession, HighScore, PeriodBest, OnlinePlayer
 
 
 @admin.register(User)
@@ -17,6 +17,13 @@ class CustomUserAdmin(UserAdmin):
     )
 
 
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'games_played', 'days_played', 'current_streak', 'longest_streak', 'last_played_on']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+
 @admin.register(GameSession)
 class GameSessionAdmin(admin.ModelAdmin):
     list_display = ['user', 'score', 'is_active', 'created_at', 'ended_at']
@@ -26,6 +33,15 @@ class GameSessionAdmin(admin.ModelAdmin):
     raw_id_fields = ['user']
 
 
+@admin.register(ArchivedGameSession)
+class ArchivedGameSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'score', 'created_at', 'ended_at', 'verified']
+    list_filter = ['verified', 'ended_at']
+    search_fields = ['user__username']
+    readonly_fields = ['created_at', 'ended_at']
+    raw_id_fields = ['user']
+
+
 @admin.register(HighScore)
 class HighScoreAdmin(admin.ModelAdmin):
     list_display = ['user', 'score', 'date_achieved']
@@ -35,6 +51,14 @@ class HighScoreAdmin(admin.ModelAdmin):
     raw_id_fields = ['user']
 
 
+@admin.register(PeriodBest)
+class PeriodBestAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period', 'starts_on', 'score', 'date_achieved']
+    list_filter = ['period', 'starts_on']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+
 @admin.register(OnlinePlayer)
 class OnlinePlayerAdmin(admin.ModelAdmin):
     list_display = ['user', 'last_ping', 'current_game_score']
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        # Connects the token cache invalidation signals
+        from . import authentication  # noqa: F401
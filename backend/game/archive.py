@@ -0,0 +1,83 @@
+"""
+Hot/cold archival of ended game sessions.
+
+``GameSession`` holds live games and recent history. Sessions that have
+been over for ``AFTER_DAYS`` move in batches to ``ArchivedGameSession``, a
+narrow table keyed by the original id whose final ``game_data`` is stored
+zlib-compressed. The hot table then only grows with recent traffic, which
+keeps its indexes and the ``is_active`` lookups small.
+
+Each batch is one transaction: bulk insert into the archive, then delete the
+hot rows, so every session is in exactly one table at any time. Inserts
+ignore ids that are already archived, which makes an interrupted run safe to
+repeat. Sessions left inactive by ``start_game`` never got an ``ended_at``,
+so their last update decides when they go; they keep a null ``ended_at``
+in the archive, which is how they stay out of the per-user statistics.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedGameSession, GameSession
+
+DEFAULTS = {
+    'AFTER_DAYS': 30,
+    'BATCH_SIZE': 1000,
+}
+
+_COLUMNS = ('id', 'user_id', 'score', 'created_at', 'ended_at', 'seed', 'game_data', 'replay', 'verified')
+
+
+def get_setting(name):
+    return getattr(settings, 'GAME_ARCHIVE', {}).get(name, DEFAULTS[name])
+
+
+def archivable(cutoff=None):
+    """Ended sessions last touched before ``cutoff`` (default ``AFTER_DAYS`` ago)"""
+    if cutoff is None:
+        cutoff = timezone.now() - timedelta(days=get_setting('AFTER_DAYS'))
+    return GameSession.objects.filter(is_active=False, updated_at__lt=cutoff)
+
+
+def archive_sessions(cutoff=None, batch_size=None, limit=None):
+    """
+    Move archivable sessions to the archive, oldest first.
+
+    Returns ``(sessions moved, JSON bytes before, compressed bytes after)``.
+    """
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    candidates = archivable(cutoff).order_by('updated_at', 'id')
+    moved = raw = packed = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic():
+            rows = list(candidates.values_list(*_COLUMNS)[:size])
+            if not rows:
+                break
+            archived = []
+            for session_id, user_id, score, created_at, ended_at, seed, game_data, replay, verified in rows:
+                # Compact JSON, read back by ArchivedGameSession.game_data
+                encoded = json.dumps(game_data, separators=(',', ':')).encode()
+                state = zlib.compress(encoded)
+                raw += len(encoded)
+                packed += len(state)
+                archived.append(ArchivedGameSession(
+                    id=session_id,
+                    user_id=user_id,
+                    score=score,
+                    created_at=created_at,
+                    ended_at=ended_at,
+                    seed=seed,
+                    state=state,
+                    replay=replay,
+                    verified=verified,
+                ))
+            ArchivedGameSession.objects.bulk_create(archived, ignore_conflicts=True)
+            # only('id'): the delete collector loads the rows it removes
+            GameSession.objects.filter(id__in=[row[0] for row in rows]).only('id').delete()
+        moved += len(rows)
+    return moved, raw, packed
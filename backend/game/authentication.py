@@ -0,0 +1,139 @@
+"""
+Token authentication with an in-process token -> user cache.
+
+DRF's ``TokenAuthentication`` joins ``authtoken_token`` to ``game_user`` on
+every request, including each ping and game move. ``CachedTokenAuthentication``
+keeps recent lookups in a bounded LRU with a TTL. Entries are dropped when
+the token is deleted (logout) or the user row is saved (profile changes,
+finished games), and ``invalidate_user`` covers writes that bypass
+``save()``.
+
+The cache is per process, so another worker may accept a deleted token for
+up to ``TOKEN_CACHE['TTL']`` seconds; keep the TTL short.
+"""
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+DEFAULTS = {
+    'TTL': 30.0,
+    'MAX_SIZE': 10000,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'TOKEN_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class TokenCache:
+    """Bounded LRU of ``key -> (user, token, expires_at)``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._miss_seconds = 0.0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, key, user, token):
+        with self._lock:
+            self._entries[key] = (user, token, time.monotonic() + get_setting('TTL'))
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > get_setting('MAX_SIZE'):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def record_lookup(self, seconds):
+        with self._lock:
+            self._miss_seconds += seconds
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user.get(entry[0].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[0].pk]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_miss = self._miss_seconds / self.misses if self.misses else None
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'avg_db_lookup_ms': round(avg_miss * 1000, 3) if avg_miss is not None else None,
+                # Each hit skips one DB lookup of roughly the average miss cost
+                'estimated_ms_saved': round(self.hits * avg_miss * 1000, 1) if avg_miss is not None else None,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that consults ``token_cache`` before the database"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            user, token = cached
+            # Hand each request its own copy so attribute changes don't leak
+            return copy.copy(user), token
+        start = time.perf_counter()
+        user, token = super().authenticate_credentials(key)
+        token_cache.record_lookup(time.perf_counter() - start)
+        token_cache.set(key, user, token)
+        return copy.copy(user), token
+
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _user_saved(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
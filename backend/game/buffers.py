@@ -0,0 +1,270 @@
+"""
+In-memory write-behind buffers.
+
+Hot rows (in-progress game sessions, users' activity timestamps) are
+updated many times per second but only the latest value matters. A buffer
+keeps the newest value per key and writes the whole batch in one query when
+the flush budget is reached:
+
+* ``FLUSH_INTERVAL`` (``ACTIVITY_FLUSH_INTERVAL`` for activity) seconds
+  since the last flush; a daemon thread also flushes idle buffers,
+* ``MAX_PENDING`` distinct keys waiting,
+* an explicit ``flush()``, and interpreter shutdown via ``atexit``.
+
+Buffers are per process. With several workers, route a game's requests to
+one worker (or use the WebSocket channel) so reads see the buffered state.
+"""
+from abc import ABC, abstractmethod
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 1.0,
+    'ACTIVITY_FLUSH_INTERVAL': 5.0,
+    'MAX_PENDING': 256,
+}
+
+_buffers = []
+
+
+def get_setting(name):
+    return getattr(settings, 'GAME_WRITE_BEHIND', {}).get(name, DEFAULTS[name])
+
+
+class WriteBehindBuffer(ABC):
+    """Coalesce values per key and hand each batch to ``write()``"""
+    interval_setting = 'FLUSH_INTERVAL'
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        # The batch being written; still readable until the write lands
+        self._inflight = {}
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+        _buffers.append(self)
+
+    @abstractmethod
+    def write(self, batch):
+        """Persist ``{key: value}``"""
+
+    def merge(self, older, newer):
+        """What a key keeps when ``newer`` arrives before ``older`` was written"""
+        return newer
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._pending:
+                value = self.merge(self._pending[key], value)
+            self._pending[key] = value
+            self.updates += 1
+            due = (
+                len(self._pending) >= get_setting('MAX_PENDING')
+                or time.monotonic() - self._last_flush >= get_setting(self.interval_setting)
+            )
+        self._ensure_thread()
+        if due:
+            self.flush()
+
+    def get(self, key):
+        with self._lock:
+            value = self._pending.get(key)
+            return value if value is not None else self._inflight.get(key)
+
+    def pop(self, key):
+        with self._lock:
+            return self._pending.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def flush(self):
+        """Write everything pending; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            try:
+                self.write(batch)
+            except Exception:
+                # Keep the batch, merged with anything newer that arrived meanwhile
+                with self._lock:
+                    for key, value in batch.items():
+                        if key in self._pending:
+                            value = self.merge(value, self._pending[key])
+                        self._pending[key] = value
+                    self._inflight = {}
+                raise
+            with self._lock:
+                self._inflight = {}
+            self.flushes += 1
+            self.rows_written += len(batch)
+            logger.debug('%s buffer flushed %d rows', self.name, len(batch))
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'updates': self.updates,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            # Buffered updates per row actually written; higher is better
+            'coalescing_ratio': round(self.updates / self.rows_written, 2) if self.rows_written else None,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f'{self.name}-flusher', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(get_setting(self.interval_setting))
+            if time.monotonic() - self._last_flush < get_setting(self.interval_setting):
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('%s buffer flush failed', self.name)
+            finally:
+                close_old_connections()
+
+
+class SessionStateBuffer(WriteBehindBuffer):
+    """
+    Latest ``(game_data, score)`` per in-progress ``GameSession``, plus the
+    replay segments saved since the last flush.
+
+    State is replaced by newer state, while segments are appends: they
+    accumulate (contiguous ones joined) and are inserted as ``ReplaySegment``
+    rows in the same transaction as the state.
+    """
+
+    def merge(self, older, newer):
+        game_data, score, segments = newer
+        return game_data, score, join_segments(older[2] + segments)
+
+    def write(self, batch):
+        from .models import GameSession
+        now = timezone.now()
+        sessions = []
+        segments = []
+        for session_id, (game_data, score, pieces) in batch.items():
+            sessions.append(GameSession(id=session_id, game_data=game_data, score=score, updated_at=now))
+            segments += [(session_id, offset, data) for offset, data in pieces]
+        with transaction.atomic():
+            # A session finished while its batch was in flight keeps its final state
+            GameSession.objects.filter(is_active=True).bulk_update(sessions, ['game_data', 'score', 'updated_at'])
+            self._insert_segments(segments)
+
+    def _insert_segments(self, segments):
+        from .models import GameSession, ReplaySegment
+        if not segments:
+            return
+        # A finished session's log was already joined by finish_game. The row
+        # lock makes this wait for a finish_game in progress and then skip it
+        active = set(GameSession.objects.select_for_update().filter(
+            id__in={session_id for session_id, _, _ in segments}, is_active=True
+        ).values_list('id', flat=True))
+        ReplaySegment.objects.bulk_create([
+            ReplaySegment(session_id=session_id, offset=offset, data=data)
+            for session_id, offset, data in segments
+            if session_id in active
+        ], ignore_conflicts=True)
+
+    def save(self, game_session, segment=None):
+        """
+        Buffer the session's state and an ``(offset, bytes)`` replay segment,
+        or write both through when disabled.
+        """
+        segments = [segment] if segment and segment[1] else []
+        if get_setting('ENABLED'):
+            self.put(game_session.id, (game_session.game_data, game_session.score, segments))
+        else:
+            with transaction.atomic():
+                game_session.save(update_fields=['game_data', 'score', 'updated_at'])
+                self._insert_segments([(game_session.id, offset, data) for offset, data in segments])
+
+    def overlay(self, game_session):
+        """Apply buffered state to a session loaded from the database"""
+        pending = self.get(game_session.id)
+        if pending is not None:
+            game_session.game_data, game_session.score, _ = pending
+        return game_session
+
+    def take_segments(self, session_id):
+        """Drop the session's buffered state; returns its replay segments not yet written"""
+        with self._lock:
+            pending = self._pending.pop(session_id, None)
+            inflight = self._inflight.get(session_id)
+        # An in-flight batch may still be writing; finish_game joins by offset
+        return (inflight[2] if inflight else []) + (pending[2] if pending else [])
+
+
+class ActivityBuffer(WriteBehindBuffer):
+    """Latest activity timestamp per user, written with one bulk UPDATE"""
+    interval_setting = 'ACTIVITY_FLUSH_INTERVAL'
+
+    def write(self, batch):
+        from .models import User
+        users = [User(id=user_id, is_online=True, last_activity=when) for user_id, when in batch.items()]
+        # bulk_update writes a single CASE ... WHEN per column and leaves the
+        # rest of the row (bio, photo, stats) alone
+        User.objects.bulk_update(users, ['is_online', 'last_activity'], batch_size=500)
+
+    def touch(self, user):
+        """Mark ``user`` online now, buffered unless write-behind is disabled"""
+        if get_setting('ENABLED'):
+            self.put(user.id, user.last_activity)
+        else:
+            user.save(update_fields=['is_online', 'last_activity'])
+
+
+def join_segments(segments):
+    """Merge ``(offset, bytes)`` segments that continue one another"""
+    joined = []
+    for offset, data in segments:
+        if joined and joined[-1][0] + len(joined[-1][1]) == offset:
+            joined[-1] = (joined[-1][0], joined[-1][1] + data)
+        else:
+            joined.append((offset, data))
+    return joined
+
+
+def flush_all():
+    for buffer in _buffers:
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception('%s buffer flush failed at shutdown', buffer.name)
+
+
+atexit.register(flush_all)
+
+session_buffer = SessionStateBuffer('game_session')
+activity_buffer = ActivityBuffer('user_activity')
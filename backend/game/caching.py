@@ -0,0 +1,173 @@
+"""
+Version-keyed response caching with single-flight rebuilds.
+
+The leaderboard and online-players endpoints are polled by every open
+client. They used to sit behind ``cache_page``, so a finished game could
+take up to 10 seconds to show up, and whenever an entry expired every
+request in flight recomputed it at once.
+
+``VersionedCache`` stores each value together with the version of the data
+it was built from: ``LeaderboardIndex.version`` changes as soon as a
+committed score changes the board, and ``PresenceTracker.version`` when
+someone comes online, leaves or switches game. A matching version is a hit;
+anything else is rebuilt. Only one thread rebuilds a key at a time; the
+others get the previous value meanwhile (or wait for the builder when
+there is none), so an invalidation costs one computation per process, not
+one per request. ``max_age`` bounds how long a value may live when it also
+shows data the version does not track (current scores of live games).
+
+Like the indexes its versions come from, the cache lives in the process.
+
+Every stored value also gets an ETag so polling clients can revalidate:
+``check`` answers an ``If-None-Match`` from the current entry before the
+view queries or serializes anything. The versions are per process, so the
+tag is ``make_etag`` of the key and the built value instead: every worker
+showing the same data hands out the same tag, and a ``max_age`` rebuild
+that finds nothing changed keeps it. ``make_etag`` also tags views that
+hash their inputs themselves (profiles).
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.utils.http import parse_etags
+
+DEFAULTS = {
+    'MAX_ENTRIES': 1000,
+    # How long a request without a previous value waits for the builder
+    'BUILD_TIMEOUT': 5.0,
+    'ONLINE_PLAYERS_MAX_AGE': 5.0,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def make_etag(*parts):
+    """Weak ETag naming the data ``parts`` a response is rendered from"""
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def etag_matches(request, etag):
+    """Whether ``If-None-Match`` names ``etag`` (weak comparison, as RFC 9110 asks for GET)"""
+    header = request.headers.get('If-None-Match')
+    if not header or etag is None:
+        return False
+    candidates = parse_etags(header)
+    return '*' in candidates or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in candidates}
+
+
+class VersionedCache:
+    """Bounded LRU of ``key -> (version, value, built_at, etag)`` with one builder per key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # key -> Event set when the running build finishes
+        self._building = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.not_modified = 0
+        self._build_seconds = 0.0
+
+    @staticmethod
+    def _fresh(entry, version, max_age, now):
+        return entry is not None and entry[0] == version and (max_age is None or now - entry[2] < max_age)
+
+    def check(self, request, key, version, max_age=None):
+        """ETag of the current entry if the request already has it, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self._fresh(entry, version, max_age, time.monotonic()) or not etag_matches(request, entry[3]):
+                return None
+            self._entries.move_to_end(key)
+            self.not_modified += 1
+            return entry[3]
+
+    def get_or_build(self, key, version, build, max_age=None):
+        """The value cached for ``key`` at ``version``, building it if needed"""
+        return self.fetch(key, version, build, max_age)[0]
+
+    def fetch(self, key, version, build, max_age=None):
+        """
+        ``(value, etag)`` for ``key`` at ``version``; etag is None if nothing was stored.
+
+        Read ``version`` before ``build`` touches the data: a change made
+        during the build then just causes one more rebuild later.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if self._fresh(entry, version, max_age, time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[3]
+            done = self._building.get(key)
+            builder = done is None
+            if builder:
+                done = self._building[key] = threading.Event()
+            elif entry is not None:
+                # Someone is already rebuilding; serve what we have
+                self.stale_hits += 1
+                return entry[1], entry[3]
+            else:
+                self.waits += 1
+        if not builder:
+            return self._wait(key, done, build)
+        try:
+            start = time.perf_counter()
+            value = build()
+            elapsed = time.perf_counter() - start
+            etag = make_etag(key, value)
+            with self._lock:
+                self.misses += 1
+                self._build_seconds += elapsed
+                self._entries[key] = (version, value, time.monotonic(), etag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > get_setting('MAX_ENTRIES'):
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return value, etag
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            done.set()
+
+    def _wait(self, key, done, build):
+        done.wait(get_setting('BUILD_TIMEOUT'))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry[1], entry[3]
+        # The build failed or timed out; don't leave the request empty-handed
+        return build(), None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            reused = self.hits + self.stale_hits + self.not_modified
+            served = reused + self.misses + self.waits
+            avg_build = self._build_seconds / self.misses if self.misses else None
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+                'hit_rate': round(reused / served, 4) if served else None,
+                'avg_build_ms': round(avg_build * 1000, 3) if avg_build is not None else None,
+            }
+
+
+high_scores_cache = VersionedCache()
+online_players_cache = VersionedCache()
@@ -0,0 +1,346 @@
+"""
+Server-side snake simulation.
+
+The engine mirrors the rules of the React client (20x20 board, snake starts
+at [10, 10] heading up, +10 points per food) and is the source of truth for
+``GameSession.score``. State is kept in flat arrays so a worker can hold and
+step thousands of sessions without allocating per tick:
+
+* the body is a ring buffer of cell indices (``y * width + x``) in an
+  ``array('H')`` sized to the board, so moving is two index updates;
+* a ``bytearray`` occupancy map gives O(1) self-collision checks.
+
+Food is deterministic per game: placement number ``n`` is a pure function
+of the game's 32-bit ``seed``, ``n`` and the board (see ``food_hash``), so
+the client can place food itself (``frontend/src/utils/food.js`` mirrors
+this) and a replay can be checked against its seed.
+"""
+from array import array
+import base64
+import random
+
+BOARD_SIZE = 20
+FOOD_POINTS = 10
+INITIAL_SNAKE = ((10, 10), (10, 11), (10, 12))
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+UP, DOWN, LEFT, RIGHT = range(4)
+DIRECTION_INDEX = {name: i for i, name in enumerate(DIRECTIONS)}
+
+_DX = (0, 0, -1, 1)
+_DY = (-1, 1, 0, 0)
+_OPPOSITE = (DOWN, UP, RIGHT, LEFT)
+
+
+# Ticks a single input batch may advance, so one request cannot pin a worker
+MAX_TICKS_PER_UPDATE = 2000
+
+# Random probes before food falls back to picking among the free cells
+FOOD_ATTEMPTS = 32
+
+_MASK = 0xFFFFFFFF
+
+
+def food_hash(seed, n, attempt):
+    """32-bit hash of (seed, food number, attempt); integer-only so JS matches"""
+    h = (seed ^ (n * 0x9E3779B1) ^ (attempt * 0x85EBCA77)) & _MASK
+    h ^= h >> 16
+    h = (h * 0x7FEB352D) & _MASK
+    h ^= h >> 15
+    h = (h * 0x846CA68B) & _MASK
+    h ^= h >> 16
+    return h
+
+
+class InvalidState(ValueError):
+    """Raised when a posted game state cannot exist on the board."""
+
+
+class Snake:
+    """Ring buffer of body cells, head first."""
+    __slots__ = ('cells', 'capacity', 'head', 'length', 'occupied')
+
+    def __init__(self, capacity):
+        self.cells = array('H', bytes(2 * capacity))
+        self.capacity = capacity
+        self.head = 0
+        self.length = 0
+        self.occupied = bytearray(capacity)
+
+    def push_head(self, cell):
+        self.head = (self.head + 1) % self.capacity
+        self.cells[self.head] = cell
+        self.occupied[cell] = 1
+        self.length += 1
+
+    def pop_tail(self):
+        tail = self.cells[(self.head - self.length + 1) % self.capacity]
+        self.occupied[tail] = 0
+        self.length -= 1
+        return tail
+
+    def head_cell(self):
+        return self.cells[self.head]
+
+    def __iter__(self):
+        """Yield cells from head to tail."""
+        cells, capacity, head = self.cells, self.capacity, self.head
+        for i in range(self.length):
+            yield cells[(head - i) % capacity]
+
+    def __len__(self):
+        return self.length
+
+
+class SnakeGame:
+    """A single game on a ``width`` x ``height`` board."""
+    __slots__ = ('width', 'height', 'snake', 'food', 'direction', 'score',
+                 'tick', 'game_over', 'seed', 'recorder')
+
+    def __init__(self, width=BOARD_SIZE, height=BOARD_SIZE, seed=None):
+        self.width = width
+        self.height = height
+        self.snake = Snake(width * height)
+        self.food = -1
+        self.direction = UP
+        self.score = 0
+        self.tick = 0
+        self.game_over = False
+        self.seed = random.getrandbits(32) if seed is None else seed & _MASK
+        # Optional replay.ReplayRecorder logging turns and food placements
+        self.recorder = None
+
+    @classmethod
+    def new(cls, width=BOARD_SIZE, height=BOARD_SIZE, seed=None):
+        """Create a game in the standard starting position."""
+        game = cls(width, height, seed)
+        # Push tail first so the head ends up at the front of the ring
+        for x, y in reversed(INITIAL_SNAKE):
+            game.snake.push_head(y * width + x)
+        game.spawn_food()
+        return game
+
+    @classmethod
+    def from_state(cls, state, width=BOARD_SIZE, height=BOARD_SIZE, seed=None):
+        """
+        Rebuild a game from a ``game_data`` dict.
+
+        The body must be in bounds and contiguous; the score is derived from
+        the body length rather than trusted from the payload. A ``seed`` in
+        the state wins over the argument.
+        """
+        if isinstance(state.get('seed'), int):
+            seed = state['seed']
+        game = cls(width, height, seed)
+        if 'body' in state:
+            segments = unpack_body(state['head'], state['length'], state['body'])
+        else:
+            segments = state.get('snake') or []
+        if not segments:
+            raise InvalidState('Snake must have at least one segment')
+        previous = None
+        for x, y in reversed(segments):
+            if not (0 <= x < width and 0 <= y < height):
+                raise InvalidState('Snake segment out of bounds')
+            if previous is not None and abs(x - previous[0]) + abs(y - previous[1]) != 1:
+                raise InvalidState('Snake segments are not contiguous')
+            cell = y * width + x
+            if game.snake.occupied[cell]:
+                raise InvalidState('Snake overlaps itself')
+            game.snake.push_head(cell)
+            previous = (x, y)
+        game.score = max(0, len(segments) - len(INITIAL_SNAKE)) * FOOD_POINTS
+        game.direction = DIRECTION_INDEX.get(state.get('direction'), UP)
+        game.tick = int(state.get('tick', 0))
+        game.game_over = bool(state.get('game_over', False))
+        food = state.get('food')
+        if food and 0 <= food[0] < width and 0 <= food[1] < height:
+            game.food = food[1] * width + food[0]
+        else:
+            game.spawn_food()
+        return game
+
+    def to_state(self):
+        """Serialize to the ``game_data`` format the client understands."""
+        width = self.width
+        return {
+            'snake': [[cell % width, cell // width] for cell in self.snake],
+            'food': [self.food % width, self.food // width] if self.food >= 0 else None,
+            'direction': DIRECTIONS[self.direction],
+            'score': self.score,
+            'game_over': self.game_over,
+            'tick': self.tick,
+            'seed': self.seed,
+        }
+
+    def to_compact(self):
+        """
+        Serialize with the body packed as 2-bit moves (see ``pack_body``).
+
+        Used by the input-event protocol so long snakes cost a few bytes per
+        save instead of a JSON pair per segment.
+        """
+        width = self.width
+        head = self.snake.head_cell()
+        return {
+            'head': [head % width, head // width],
+            'length': self.snake.length,
+            'body': pack_body(self.snake, width),
+            'food': [self.food % width, self.food // width] if self.food >= 0 else None,
+            'direction': DIRECTIONS[self.direction],
+            'score': self.score,
+            'game_over': self.game_over,
+            'tick': self.tick,
+            'seed': self.seed,
+        }
+
+    def spawn_food(self):
+        """
+        Place the next food, or clear it if the board is full.
+
+        Probes ``food_hash`` cells until one is free, which takes O(1) tries
+        while the board is mostly empty; after ``FOOD_ATTEMPTS`` misses the
+        hash picks among the free cells in board order instead.
+        """
+        size = self.width * self.height
+        snake = self.snake
+        occupied = snake.occupied
+        if snake.length >= size:
+            self.food = -1
+        else:
+            seed = self.seed
+            n = snake.length - len(INITIAL_SNAKE)
+            for attempt in range(FOOD_ATTEMPTS):
+                cell = food_hash(seed, n, attempt) % size
+                if not occupied[cell]:
+                    break
+            else:
+                k = food_hash(seed, n, FOOD_ATTEMPTS) % (size - snake.length)
+                for cell in range(size):
+                    if not occupied[cell]:
+                        if k == 0:
+                            break
+                        k -= 1
+            self.food = cell
+        if self.recorder is not None:
+            self.recorder.food(self.tick, self.food)
+
+    def turn(self, direction):
+        """Change heading; reversing into the body is ignored."""
+        if direction != _OPPOSITE[self.direction] or self.snake.length == 1:
+            self.direction = direction
+
+    def step(self, direction=None):
+        """Advance one tick. Returns ``True`` while the game is still running."""
+        if self.game_over:
+            return False
+        if direction is not None:
+            if self.recorder is not None:
+                self.recorder.turn(self.tick + 1, direction)
+            self.turn(direction)
+        snake = self.snake
+        width = self.width
+        head = snake.cells[snake.head]
+        x = head % width + _DX[self.direction]
+        y = head // width + _DY[self.direction]
+        self.tick += 1
+        if x < 0 or x >= width or y < 0 or y >= self.height:
+            self.game_over = True
+            return False
+        cell = y * width + x
+        # Matches the client: the tail still counts as occupied this tick
+        if snake.occupied[cell]:
+            self.game_over = True
+            return False
+        snake.push_head(cell)
+        if cell == self.food:
+            self.score += FOOD_POINTS
+            self.spawn_food()
+        else:
+            snake.pop_tail()
+        return True
+
+    def apply_inputs(self, events, until_tick=None):
+        """
+        Apply ``(tick, direction)`` events at their ticks, then run on to ``until_tick``.
+
+        An event for tick ``t`` changes direction on the step that produces
+        tick ``t``; of several events for one tick the last one counts. The
+        board advances once, to the latest tick named, so how the events
+        are batched can't speed it up or hold it back. An event for a tick
+        already played raises ``InvalidState`` before anything moves.
+        Advancing is capped at ``MAX_TICKS_PER_UPDATE`` per call.
+        """
+        turns = {}
+        for tick, direction in events:
+            if tick <= self.tick:
+                raise InvalidState(f'Input for tick {tick} is behind tick {self.tick}')
+            turns[tick] = direction
+        target = max(turns, default=self.tick)
+        if until_tick is not None:
+            target = max(target, until_tick)
+        target = min(target, self.tick + MAX_TICKS_PER_UPDATE)
+        step = self.step
+        while self.tick < target and step(turns.get(self.tick + 1)):
+            pass
+        return not self.game_over
+
+    def run(self, ticks):
+        """Advance up to ``ticks`` ticks without input."""
+        step = self.step
+        for _ in range(ticks):
+            if not step():
+                break
+        return not self.game_over
+
+
+def pack_body(cells, width):
+    """
+    Encode the moves from each segment to the next as 2 bits each.
+
+    Four segments fit in a byte, so a 400-cell snake packs into 100 bytes.
+    """
+    packed = bytearray()
+    acc = 0
+    count = 0
+    previous = None
+    for cell in cells:
+        if previous is not None:
+            delta = cell - previous
+            if delta == -width:
+                move = UP
+            elif delta == width:
+                move = DOWN
+            elif delta == -1:
+                move = LEFT
+            else:
+                move = RIGHT
+            acc |= move << (2 * count)
+            count += 1
+            if count == 4:
+                packed.append(acc)
+                acc = 0
+                count = 0
+        previous = cell
+    if count:
+        packed.append(acc)
+    return base64.b64encode(bytes(packed)).decode('ascii')
+
+
+def unpack_body(head, length, body):
+    """Inverse of ``pack_body``: rebuild ``[x, y]`` segments head first."""
+    try:
+        packed = base64.b64decode(body)
+        x, y = int(head[0]), int(head[1])
+        length = int(length)
+    except (TypeError, ValueError, IndexError):
+        raise InvalidState('Malformed packed body')
+    if length < 1 or len(packed) * 4 < length - 1:
+        raise InvalidState('Packed body is shorter than its length')
+    segments = [[x, y]]
+    for i in range(length - 1):
+        move = (packed[i >> 2] >> (2 * (i & 3))) & 3
+        x += _DX[move]
+        y += _DY[move]
+        segments.append([x, y])
+    return segments
@@ -0,0 +1,338 @@
+"""
+Gameplay operations shared by the HTTP views and the game socket.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .authentication import token_cache
+from .buffers import session_buffer
+from .engine import DOWN, LEFT, RIGHT, UP, InvalidState, SnakeGame
+from .leaderboard import PERIODS, leaderboard, period_start, windows
+from .models import ArchivedGameSession, GameSession, HighScore, PeriodBest, ReplaySegment, User
+from .percentiles import score_distribution
+from .presence import presence
+from .replay import ReplayRecorder
+from .stats import record_game
+
+
+class InputGap(Exception):
+    """An input batch starts past the next expected sequence number."""
+
+    def __init__(self, acked):
+        super().__init__(f'Missing input events after seq {acked}')
+        self.acked = acked
+
+
+class StateMismatch(Exception):
+    """A posted full state does not follow from the stored game."""
+
+
+# Head movement of one step -> direction index
+_MOVES = {(0, -1): UP, (0, 1): DOWN, (-1, 0): LEFT, (1, 0): RIGHT}
+
+
+def apply_posted_state(game, state):
+    """
+    Advance ``game`` to a full state posted by an older client.
+
+    The engine keeps the board. The stock client posts every tick without
+    waiting for the previous post, so boards can arrive late, out of order
+    or not at all:
+
+    * the stored snake itself (a retransmit, or the game-over report, which
+      repeats the last board) changes nothing;
+    * an older board, its head somewhere down the stored body, is a late
+      post; it is ignored and False returned;
+    * a board ``k`` steps ahead has the stored head ``k`` cells down its
+      body, and the cells before it are the heads in between. The engine
+      takes those steps itself, so the snake only grows by eating the
+      stored food, and must end up on the posted snake.
+
+    The posted food, score and tick are ignored.
+    """
+    width = game.width
+    posted = [x + y * width for x, y in state['snake']]
+    stored = list(game.snake)
+    if posted != stored:
+        if posted[0] in stored and _is_older(posted, stored):
+            return False
+        ahead = posted.index(stored[0]) if stored[0] in posted else 0
+        if not ahead or game.game_over:
+            raise StateMismatch('Posted state does not follow from the stored game')
+        for cell in reversed(posted[:ahead]):
+            head = game.snake.head_cell()
+            direction = _MOVES.get((cell % width - head % width, cell // width - head // width))
+            if direction is None:
+                raise StateMismatch('Snake head must move one cell at a time')
+            game.step(direction if direction != game.direction else None)
+            if game.game_over:
+                raise StateMismatch('Posted state does not follow from the stored game')
+        if list(game.snake) != posted:
+            raise StateMismatch('Posted state does not follow from the stored game')
+    if state['game_over']:
+        game.game_over = True
+    return True
+
+
+def _is_older(posted, stored):
+    """Whether ``posted`` is an earlier position of the ``stored`` snake"""
+    behind = stored.index(posted[0])
+    return behind > 0 and all(cell == stored[behind + i] for i, cell in enumerate(posted[:len(stored) - behind]))
+
+
+def apply_input_events(game, acked, seq, events, tick=None):
+    """
+    Apply a sequenced batch of ``(tick, direction)`` events to ``game``.
+
+    ``seq`` numbers the first event in the batch. Events at or below
+    ``acked`` are retransmits and skipped. Returns the new ack.
+    """
+    if seq > acked + 1:
+        raise InputGap(acked)
+    game.apply_inputs(events[acked + 1 - seq:], tick)
+    return max(acked, seq + len(events) - 1)
+
+
+def new_game():
+    """A fresh, randomly seeded engine game with its replay recorder attached"""
+    game = SnakeGame.new()
+    ReplayRecorder.start(game, game.seed)
+    return game
+
+
+def load_game(game_data):
+    """Rebuild the engine from ``game_data``, resuming its replay log if any"""
+    game = SnakeGame.from_state(game_data)
+    if 'replay' in game_data:
+        game.recorder = ReplayRecorder.from_state(game_data['replay'])
+    return game
+
+
+def snapshot(game, acked):
+    """Compact ``game_data`` for a session driven by input events"""
+    game_data = game.to_compact()
+    game_data['seq'] = acked
+    if game.recorder is not None:
+        game_data['replay'] = game.recorder.to_state()
+    return game_data
+
+
+def save_game(user, game_session, game, game_data):
+    """
+    Store ``game_data`` and the engine's score on the session.
+
+    Buffered while the game runs, finalized once it is over. The replay
+    bytes recorded since the previous save go along as one appended
+    segment, so the write stays small however long the game gets.
+    """
+    game_session.game_data = game_data
+    game_session.score = game.score
+    segment = game.recorder.take() if game.recorder is not None else None
+    if game.game_over:
+        finish_game(user, game_session, segment)
+    else:
+        session_buffer.save(game_session, segment)
+
+
+def ack_payload(game, acked):
+    """What the client needs to reconcile after a batch; never the whole snake"""
+    width = game.width
+    return {
+        'seq': acked,
+        'tick': game.tick,
+        'score': game.score,
+        'food': [game.food % width, game.food // width] if game.food >= 0 else None,
+        'game_over': game.game_over,
+    }
+
+
+def finish_game(user, game_session, segment=None):
+    """
+    End the session, update the player's stats and record the high score.
+
+    Everything is written in one transaction: a guarded session UPDATE, an
+    ``F()``/``Greatest`` UPDATE of the user's counters, the all-time and
+    day/week high score upserts and the ``UserStats`` upsert, so concurrent
+    game-overs for the same user cannot lose a game or a best score. A game
+    with a replay log also reads its stored segments, writes the joined
+    replay and deletes the segments; the guarded UPDATE has locked the
+    session row by then, so a buffer flush cannot add a segment in between
+    (see ``SessionStateBuffer._insert_segments``). The in-memory
+    leaderboards, score sketch and token cache follow on commit.
+    ``segment`` is the replay piece the caller recorded last (see
+    ``save_game``).
+
+    Ending a session that is already over changes nothing and returns
+    False.
+    """
+    # The session object carries the final state; drop any older buffered copy
+    segments = session_buffer.take_segments(game_session.id)
+    if segment is not None:
+        segments.append(segment)
+    now = timezone.now()
+    score = game_session.score
+    game_data = game_session.game_data
+    logged = isinstance(game_data, dict) and 'replay' in game_data
+    if logged:
+        game_data = dict(game_data)
+        log_state = game_data.pop('replay')
+        game_session.game_data = game_data
+    with transaction.atomic():
+        ended = GameSession.objects.filter(id=game_session.id, is_active=True).update(
+            is_active=False,
+            ended_at=now,
+            updated_at=now,
+            game_data=game_data,
+            score=score,
+        )
+        if ended:
+            if logged:
+                replay = _close_replay(game_session.id, log_state, segments, int(game_data.get('tick', 0)))
+                GameSession.objects.filter(id=game_session.id).update(replay=replay)
+                ReplaySegment.objects.filter(session_id=game_session.id).delete()
+            User.objects.filter(id=user.id).update(
+                total_games_played=F('total_games_played') + 1,
+                best_score=Greatest(F('best_score'), score),
+            )
+            save_high_score(user, score, now)
+            save_period_bests(user, score, now)
+            record_game(user.id, score, now)
+            transaction.on_commit(lambda: score_distribution.record(score))
+            # Queryset updates skip post_save, which normally evicts the user
+            transaction.on_commit(lambda: token_cache.invalidate_user(user.id))
+    game_session.is_active = False
+    if ended:
+        game_session.ended_at = now
+        user.total_games_played += 1
+        user.best_score = max(user.best_score, score)
+    presence.set_game(user.id, None)
+    return bool(ended)
+
+
+def _close_replay(session_id, state, segments, tick):
+    """
+    Close the running replay log described by ``state`` at ``tick``.
+
+    The log is the session's stored segments plus ``segments`` (buffered or
+    just recorded), joined by offset. None if a piece is missing.
+    """
+    try:
+        recorder = ReplayRecorder.from_state(state)
+    except InvalidState:
+        return None
+    pieces = {}
+    if recorder.offset:
+        pieces.update(ReplaySegment.objects.filter(session_id=session_id).values_list('offset', 'data'))
+        pieces.update(segments)
+    log = bytearray()
+    while len(log) < recorder.offset:
+        piece = pieces.get(len(log))
+        if piece is None:
+            return None
+        log += piece
+    if len(log) != recorder.offset:
+        return None
+    recorder = ReplayRecorder(log + recorder.data, recorder.last_tick)
+    return recorder.finish(max(tick, recorder.last_tick))
+
+
+def save_high_score(user, score, achieved_at=None):
+    """
+    Keep only the best score per user with a single conditional upsert.
+
+    Returns True when ``score`` became the user's best.
+    """
+    achieved_at = achieved_at or timezone.now()
+    table = connection.ops.quote_name(HighScore._meta.db_table)
+    # INSERT ... ON CONFLICT (SQLite 3.24+, PostgreSQL); the WHERE keeps a
+    # concurrent higher score from being overwritten
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, score, date_achieved) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (user_id) DO UPDATE SET score = excluded.score, '
+            f'date_achieved = excluded.date_achieved WHERE {table}.score < excluded.score',
+            [user.id, score, connection.ops.adapt_datetimefield_value(achieved_at)],
+        )
+        improved = cursor.rowcount > 0
+    if improved:
+        transaction.on_commit(lambda: leaderboard.record(
+            user.id, score, achieved_at, user.username, user.profile_photo.name or None
+        ))
+    return improved
+
+
+def save_period_bests(user, score, achieved_at):
+    """
+    Upsert the user's best for the current day and week in one statement.
+
+    Same conditional upsert as ``save_high_score``; the live day and week
+    leaderboards are offered the score on commit and ignore lower ones.
+    """
+    table = connection.ops.quote_name(PeriodBest._meta.db_table)
+    params = []
+    for period in PERIODS:
+        params += [
+            period,
+            connection.ops.adapt_datefield_value(period_start(period, achieved_at)),
+            user.id,
+            score,
+            connection.ops.adapt_datetimefield_value(achieved_at),
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (period, starts_on, user_id, score, date_achieved) '
+            f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(PERIODS))} '
+            f'ON CONFLICT (period, starts_on, user_id) DO UPDATE SET score = excluded.score, '
+            f'date_achieved = excluded.date_achieved WHERE {table}.score < excluded.score',
+            params,
+        )
+    transaction.on_commit(lambda: windows.record(
+        user.id, score, achieved_at, user.username, user.profile_photo.name or None
+    ))
+
+
+def drop_flagged_scores(user_ids):
+    """
+    Rebuild the boards of players whose games failed verification.
+
+    ``HighScore``, the retained ``PeriodBest`` buckets and ``best_score``
+    are recomputed from each player's finished games that were not flagged
+    (verified or not checked yet, hot or archived). A row with no game left
+    is deleted. The player's row is locked first, so a game finishing
+    meanwhile upserts over the recomputed values. In-process leaderboards
+    drop the old scores on their next sync (``LeaderboardIndex.sync``).
+    """
+    for user_id in user_ids:
+        with transaction.atomic():
+            if not User.objects.select_for_update().filter(id=user_id).exists():
+                continue
+            buckets = dict.fromkeys(PeriodBest.objects.filter(user_id=user_id).values_list('period', 'starts_on'))
+            best = None
+            for model in (GameSession, ArchivedGameSession):
+                games = model.objects.filter(user_id=user_id, ended_at__isnull=False).exclude(verified=False)
+                # Best first, then earliest: what the conditional upserts keep
+                top = games.order_by('-score', 'ended_at').values_list('score', 'ended_at').first()
+                if top is not None and (best is None or (-top[0], top[1]) < best):
+                    best = (-top[0], top[1])
+                if not buckets:
+                    continue
+                since = min(starts_on for _, starts_on in buckets)
+                for score, ended_at in games.filter(ended_at__date__gte=since).values_list('score', 'ended_at'):
+                    for period in PERIODS:
+                        bucket = (period, period_start(period, ended_at))
+                        if bucket in buckets and (buckets[bucket] is None or (-score, ended_at) < buckets[bucket]):
+                            buckets[bucket] = (-score, ended_at)
+            if best is None:
+                HighScore.objects.filter(user_id=user_id).delete()
+            else:
+                HighScore.objects.filter(user_id=user_id).update(score=-best[0], date_achieved=best[1])
+            for (period, starts_on), entry in buckets.items():
+                rows = PeriodBest.objects.filter(period=period, starts_on=starts_on, user_id=user_id)
+                if entry is None:
+                    rows.delete()
+                else:
+                    rows.update(score=-entry[0], date_achieved=entry[1])
+            User.objects.filter(id=user_id).update(best_score=-best[0] if best is not None else 0)
+            transaction.on_commit(lambda user_id=user_id: token_cache.invalidate_user(user_id))
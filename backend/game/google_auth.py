@@ -12,6 +12,7 @@ import logging
 import requests as http_requests
 import os
 from urllib.parse import urlparse
+from .leaderboard import update_profile
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -154,6 +155,9 @@ def google_auth(request):
             if picture:
                 download_google_profile_picture(user, picture)
 
+        # Keep the leaderboards' cached name and photo current
+        update_profile(user.id, user.username, user.profile_photo.name or None)
+
         # Mark user as online
         user.mark_online()
 
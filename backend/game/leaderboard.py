@@ -0,0 +1,447 @@
+"""
+In-process leaderboard index.
+
+Every user's best score is held in ``SortedBlocks``, a sorted list split into
+blocks of roughly ``LOAD`` keys with a Fenwick tree over block lengths.
+Inserts and removals are a bisect plus a short memmove inside one block,
+and both "entry at rank r" and "rank of key k" are O(log n) tree walks, so
+top-N and rank-of-user queries never touch the database.
+
+Keys sort in leaderboard order, matching ``HighScore.Meta.ordering``
+(``-score, -date_achieved``), with the user id as the final tie-breaker.
+
+The index is per process. It loads every ``HighScore`` row in one streamed
+query on first use. After that it is updated in place from
+``gameplay.save_high_score``, and every ``LEADERBOARD_SYNC_INTERVAL``
+seconds it picks up scores written by other workers with one delta query,
+plus the players whose games ``verify_games`` has just flagged, which are
+re-read so their lowered (or removed) scores replace the old ones.
+
+``windows`` holds the same structure for the current day and week. Scores
+land in ``PeriodBest`` (one row per user per bucket, upserted by
+``gameplay.save_period_bests``) and in the live buckets on commit, so a new
+score costs one O(log n) insert per window and reading a window's top-N
+never looks at ``GameSession``. ``rollover_leaderboards`` deletes expired
+buckets in small batches outside the request path.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+LOAD = 1000
+
+PERIODS = ('day', 'week')
+
+DEFAULTS = {
+    # Finished buckets kept in PeriodBest before rollover_leaderboards deletes them
+    'KEEP_DAYS': 7,
+    'KEEP_WEEKS': 4,
+}
+
+# Re-read this much history on each sync so rows committed late are not missed
+SYNC_OVERLAP = timedelta(seconds=10)
+
+# Shared by every index so a version number never repeats, even across buckets
+_versions = itertools.count(1)
+
+
+def get_setting(name):
+    return getattr(settings, 'LEADERBOARD_WINDOWS', {}).get(name, DEFAULTS[name])
+
+
+class SortedBlocks:
+    """Sorted multiset of comparable keys with O(log n) positional access"""
+
+    def __init__(self, iterable=()):
+        self._load(sorted(iterable))
+
+    def _load(self, keys):
+        self._blocks = [keys[i:i + LOAD] for i in range(0, len(keys), LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(keys)
+        self._build_tree()
+
+    def _build_tree(self):
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block_index, delta):
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block_index):
+        """Number of keys in blocks before ``block_index``"""
+        total = 0
+        i = block_index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        """Block number and offset of the key at ``index``"""
+        tree = self._tree
+        pos = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                pos = nxt
+                index -= tree[nxt]
+            step >>= 1
+        return pos, index
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._build_tree()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._blocks[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._blocks[i], key)
+        self._len += 1
+        block = self._blocks[i]
+        if len(block) > 2 * LOAD:
+            self._blocks[i:i + 1] = [block[:LOAD], block[LOAD:]]
+            self._maxes[i:i + 1] = [block[LOAD - 1], block[-1]]
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            raise ValueError(f'{key!r} not in list')
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            raise ValueError(f'{key!r} not in list')
+        del block[j]
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._build_tree()
+
+    def index(self, key):
+        """Position of the first key >= ``key``"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._prefix(i) + bisect_left(self._blocks[i], key)
+
+    def index_right(self, key):
+        """Position after the last key <= ``key``"""
+        i = bisect_right(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._prefix(i) + bisect_right(self._blocks[i], key)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('index out of range')
+        block, offset = self._locate(index)
+        return self._blocks[block][offset]
+
+    def islice(self, start, stop):
+        """Yield keys at positions ``start`` to ``stop - 1``"""
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        block, offset = self._locate(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self._blocks[block][offset:offset + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            block += 1
+            offset = 0
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else 0.0
+
+
+class LeaderboardIndex:
+    """Best score per user in rank order, plus the fields the leaderboard shows"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = SortedBlocks()
+        # user_id -> (key, username, profile_photo name)
+        self._users = {}
+        self._loaded = False
+        self._synced_at = None
+        self._checked = 0.0
+        # Changes whenever the visible contents do (see game/caching.py)
+        self.version = next(_versions)
+
+    @staticmethod
+    def make_key(user_id, score, achieved_at):
+        return (-score, -_timestamp(achieved_at), user_id)
+
+    def load(self, rows):
+        """Replace the index from ``(user_id, score, achieved_at, username, photo)`` rows"""
+        users = {}
+        for user_id, score, achieved_at, username, photo in rows:
+            key = self.make_key(user_id, score, achieved_at)
+            current = users.get(user_id)
+            # Old data may still hold several rows per user; keep the best
+            if current is None or key < current[0]:
+                users[user_id] = (key, username, photo)
+        with self._lock:
+            self._keys = SortedBlocks(entry[0] for entry in users.values())
+            self._users = users
+            self._loaded = True
+            self.version = next(_versions)
+
+    def record(self, user_id, score, achieved_at, username, photo=None):
+        """Insert or move a user; a lower score than the current best is ignored"""
+        key = self.make_key(user_id, score, achieved_at)
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not None:
+                if current[0] <= key:
+                    return False
+                self._keys.remove(current[0])
+            self._keys.add(key)
+            self._users[user_id] = (key, username, photo)
+            self.version = next(_versions)
+            return True
+
+    def update_profile(self, user_id, username, photo):
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not None and current[1:] != (username, photo):
+                self._users[user_id] = (current[0], username, photo)
+                self.version = next(_versions)
+
+    def discard(self, user_id):
+        with self._lock:
+            current = self._users.pop(user_id, None)
+            if current is not None:
+                self._keys.remove(current[0])
+                self.version = next(_versions)
+
+    def _entry(self, key, rank):
+        _, username, photo = self._users[key[2]]
+        return {'rank': rank, 'user_id': key[2], 'username': username, 'score': -key[0], 'profile_photo': photo}
+
+    def top(self, limit=10, offset=0):
+        """Entries at ranks ``offset + 1`` to ``offset + limit``"""
+        with self._lock:
+            return [
+                self._entry(key, rank)
+                for rank, key in enumerate(self._keys.islice(offset, offset + limit), offset + 1)
+            ]
+
+    def around(self, user_id, k):
+        """The ``k`` entries above and below ``user_id``, or ``None`` if unranked"""
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return None
+            start = max(rank - 1 - k, 0)
+            return self.top(rank + k - start, start)
+
+    def rank(self, user_id):
+        """1-based rank of ``user_id``, or ``None`` if they have no score"""
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None:
+                return None
+            return self._keys.index(current[0]) + 1
+
+    def score(self, user_id):
+        with self._lock:
+            current = self._users.get(user_id)
+            return -current[0][0] if current is not None else None
+
+    def __len__(self):
+        return len(self._keys)
+
+    # Database synchronisation
+
+    def ensure_loaded(self):
+        """Bulk load on first use, then pick up other workers' writes periodically"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.rebuild()
+            return
+        interval = getattr(settings, 'LEADERBOARD_SYNC_INTERVAL', 5.0)
+        if time.monotonic() - self._checked >= interval:
+            self.sync()
+
+    def _rows(self, since=None, users=None):
+        """``(user_id, score, achieved_at, username, photo)`` rows, optionally only recent ones or some users'"""
+        from .models import HighScore
+        rows = HighScore.objects.all()
+        if since is not None:
+            rows = rows.filter(date_achieved__gte=since)
+        if users is not None:
+            rows = rows.filter(user_id__in=users)
+        return rows.values_list('user_id', 'score', 'date_achieved', 'user__username', 'user__profile_photo')
+
+    def rebuild(self):
+        started = timezone.now()
+        self.load(self._rows().iterator(chunk_size=10000))
+        self._synced_at = started
+        self._checked = time.monotonic()
+
+    def sync(self):
+        from .models import GameSession
+        started = timezone.now()
+        self._checked = time.monotonic()
+        since = self._synced_at - SYNC_OVERLAP
+        for user_id, score, achieved_at, username, photo in self._rows(since):
+            self.record(user_id, score, achieved_at, username, photo)
+        # Flagged games lower scores (gameplay.drop_flagged_scores), which record() ignores
+        flagged = GameSession.objects.filter(verified=False, verified_at__gte=since)
+        flagged = set(flagged.values_list('user_id', flat=True))
+        if flagged:
+            self.replace(flagged, self._rows(users=flagged))
+        self._synced_at = started
+
+    def replace(self, user_ids, rows):
+        """Set ``user_ids`` to exactly their entries in ``rows``; the others are dropped"""
+        rows = {row[0]: row for row in rows}
+        with self._lock:
+            for user_id in user_ids:
+                row = rows.get(user_id)
+                if row is None:
+                    self.discard(user_id)
+                elif self._users.get(user_id) != (self.make_key(*row[:3]), *row[3:]):
+                    self.discard(user_id)
+                    self.record(*row)
+
+
+class PeriodLeaderboard(LeaderboardIndex):
+    """Best score per user within one day or week, loaded from ``PeriodBest``"""
+
+    def __init__(self, period, starts_on):
+        super().__init__()
+        self.period = period
+        self.starts_on = starts_on
+
+    def _rows(self, since=None, users=None):
+        from .models import PeriodBest
+        rows = PeriodBest.objects.filter(period=self.period, starts_on=self.starts_on)
+        if since is not None:
+            rows = rows.filter(date_achieved__gte=since)
+        if users is not None:
+            rows = rows.filter(user_id__in=users)
+        return rows.values_list('user_id', 'score', 'date_achieved', 'user__username', 'user__profile_photo')
+
+
+def period_start(period, moment):
+    """First day of the ``period`` bucket holding ``moment`` (weeks start on Monday)"""
+    day = timezone.localdate(moment)
+    return day if period == 'day' else day - timedelta(days=day.weekday())
+
+
+class WindowedLeaderboards:
+    """
+    The current day and week leaderboards.
+
+    Buckets roll over by themselves: the first read after midnight (or
+    Monday) asks for a bucket that does not exist yet, which starts empty
+    and loads only that bucket's ``PeriodBest`` rows; the finished bucket
+    is dropped. Nothing is copied or recomputed at the boundary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (period, starts_on) -> PeriodLeaderboard
+        self._boards = {}
+
+    def get(self, period, now=None):
+        starts_on = period_start(period, now or timezone.now())
+        with self._lock:
+            board = self._boards.get((period, starts_on))
+            if board is None:
+                board = PeriodLeaderboard(period, starts_on)
+                self._boards = {
+                    key: value for key, value in self._boards.items() if key[0] != period or key[1] > starts_on
+                }
+                self._boards[(period, starts_on)] = board
+        board.ensure_loaded()
+        return board
+
+    def record(self, user_id, score, achieved_at, username, photo=None):
+        """Offer a score to every live bucket that covers ``achieved_at``"""
+        for period in PERIODS:
+            board = self._boards.get((period, period_start(period, achieved_at)))
+            if board is not None:
+                board.record(user_id, score, achieved_at, username, photo)
+
+    def update_profile(self, user_id, username, photo):
+        for board in list(self._boards.values()):
+            board.update_profile(user_id, username, photo)
+
+    def clear(self):
+        with self._lock:
+            self._boards = {}
+
+
+def expire_period_bests(batch_size=1000, today=None):
+    """
+    Delete ``PeriodBest`` rows older than the retention, one short batch at a time.
+
+    Returns the number of rows deleted.
+    """
+    from .models import PeriodBest
+    today = today or timezone.localdate()
+    this_week = today - timedelta(days=today.weekday())
+    expired = PeriodBest.objects.filter(
+        Q(period='day', starts_on__lt=today - timedelta(days=get_setting('KEEP_DAYS')))
+        | Q(period='week', starts_on__lt=this_week - timedelta(weeks=get_setting('KEEP_WEEKS')))
+    )
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += PeriodBest.objects.filter(id__in=ids).delete()[0]
+
+
+def update_profile(user_id, username, photo):
+    """Refresh the name and photo shown on every in-process leaderboard"""
+    leaderboard.update_profile(user_id, username, photo)
+    windows.update_profile(user_id, username, photo)
+
+
+leaderboard = LeaderboardIndex()
+windows = WindowedLeaderboards()
@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from game.archive import archivable, archive_sessions, get_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Move game sessions that ended more than --days ago from GameSession to the compressed '
+        'ArchivedGameSession table, in batches of one transaction each. Safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help=f'Age threshold (default GAME_ARCHIVE AFTER_DAYS, {get_setting("AFTER_DAYS")})')
+        parser.add_argument('--batch', type=int, help='Sessions per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after this many sessions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['batch'] is not None and options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+        days = options['days'] if options['days'] is not None else get_setting('AFTER_DAYS')
+        cutoff = timezone.now() - timedelta(days=days)
+        if options['dry_run']:
+            self.stdout.write(f'{archivable(cutoff).count():,} sessions ended before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        start = time.perf_counter()
+        moved, raw, packed = archive_sessions(cutoff, options['batch'], options['limit'])
+        elapsed = time.perf_counter() - start
+        ratio = f', game_data {raw:,} -> {packed:,} bytes' if moved else ''
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved:,} sessions in {elapsed:.2f}s{ratio}'))
@@ -0,0 +1,42 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from game.engine import SnakeGame, DIRECTIONS
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark the snake engine and report ticks per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=5000, help='Concurrent sessions to simulate')
+        parser.add_argument('--ticks', type=int, default=200, help='Ticks per session')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        games_count = options['games']
+        ticks = options['ticks']
+        rng = random.Random(options['seed'])
+        games = [SnakeGame.new(seed=rng.getrandbits(32)) for _ in range(games_count)]
+        # Pre-generate inputs so the timed loop only measures the engine
+        inputs = [rng.randrange(len(DIRECTIONS)) if rng.random() < 0.2 else None for _ in range(1024)]
+
+        total = 0
+        restarts = 0
+        start = time.perf_counter()
+        for t in range(ticks):
+            direction = inputs[t % len(inputs)]
+            for i, game in enumerate(games):
+                if not game.step(direction):
+                    games[i] = SnakeGame.new(seed=t)
+                    restarts += 1
+                total += 1
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'Sessions:        {games_count}')
+        self.stdout.write(f'Ticks simulated: {total} ({restarts} restarts)')
+        self.stdout.write(f'Elapsed:         {elapsed:.3f}s')
+        self.stdout.write(f'Per tick:        {elapsed / total * 1e6:.2f}us')
+        self.stdout.write(
+            self.style.SUCCESS(f'Throughput:      {total / elapsed:,.0f} ticks/second')
+        )
@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from game.models import GameSession, HighScore, OnlinePlayer, User
+
+# (model, index name) for every index 0006_add_hot_path_indexes added that
+# 0016_drop_redundant_indexes kept; a user's high score is found through the
+# one-per-user unique constraint
+PACK = [
+    (GameSession, 'session_active_only_idx'),
+    (HighScore, 'highscore_rank_idx'),
+    (OnlinePlayer, 'onlineplayer_last_ping_idx'),
+    (User, 'user_directory_idx'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load synthetic data, then print query plans and timings for the hot '
+        'query shapes without and with the index pack. Everything runs in one '
+        'transaction that is rolled back, so use a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--sessions', type=int, default=10, help='Ended sessions per user')
+        parser.add_argument('--repeat', type=int, default=200, help='Runs per query; the median is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.stdout.write(f'Database: {connection.vendor}')
+        try:
+            with transaction.atomic():
+                self._load(options['users'], options['sessions'], random.Random(options['seed']))
+                queries = self._queries(options['users'], random.Random(options['seed']))
+
+                self._set_indexes(create=False)
+                before = self._measure('without index pack', queries)
+                self._set_indexes(create=True)
+                after = self._measure('with index pack', queries)
+
+                self.stdout.write(self.style.MIGRATE_HEADING('\nSummary (median per query)'))
+                for label in queries:
+                    speedup = before[label] / after[label] if after[label] else float('inf')
+                    self.stdout.write(
+                        f'{label:<28} {before[label] * 1e3:9.3f}ms -> {after[label] * 1e3:9.3f}ms  x{speedup:.1f}'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _load(self, users, sessions, rng):
+        start = time.perf_counter()
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'bench{i}',
+                    email=f'bench{i}@example.com',
+                    best_score=rng.randrange(0, 5000, 10),
+                    total_games_played=rng.randrange(0, 500),
+                )
+                for i in range(users)
+            ],
+            batch_size=1000,
+        )
+        user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+
+        # Mostly finished games with one live session for a tenth of the players
+        GameSession.objects.bulk_create(
+            [
+                GameSession(user_id=user_id, score=rng.randrange(0, 5000, 10), is_active=False)
+                for user_id in user_ids
+                for _ in range(sessions)
+            ]
+            + [GameSession(user_id=user_id, is_active=True) for user_id in user_ids[::10]],
+            batch_size=1000,
+        )
+        HighScore.objects.bulk_create(
+            [HighScore(user_id=user_id, score=rng.randrange(0, 5000, 10)) for user_id in user_ids],
+            batch_size=1000,
+        )
+        OnlinePlayer.objects.bulk_create([OnlinePlayer(user_id=user_id) for user_id in user_ids], batch_size=1000)
+        # last_ping is auto_now; spread it over the last hour in slices
+        now = timezone.now()
+        step = max(len(user_ids) // 60, 1)
+        for minute, offset in enumerate(range(0, len(user_ids), step)):
+            chunk = user_ids[offset:offset + step]
+            OnlinePlayer.objects.filter(user_id__gte=chunk[0], user_id__lte=chunk[-1]).update(
+                last_ping=now - timedelta(minutes=minute)
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Loaded {users:,} users in {time.perf_counter() - start:.1f}s')
+
+    def _queries(self, users, rng):
+        user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+        probes = [rng.choice(user_ids) for _ in range(64)]
+        cutoff = timezone.now() - timedelta(minutes=2)
+        top = HighScore.objects.order_by('-score', '-date_achieved', '-id')
+        middle = top[users // 2:users // 2 + 1].get()
+        after_middle = (
+            HighScore.objects.filter(score__lt=middle.score)
+            | HighScore.objects.filter(score=middle.score, date_achieved__lt=middle.date_achieved)
+            | HighScore.objects.filter(score=middle.score, date_achieved=middle.date_achieved, id__lt=middle.id)
+        )
+        return {
+            'active session for user': lambda i: GameSession.objects.filter(
+                user_id=probes[i % len(probes)], is_active=True
+            ),
+            'best high score for user': lambda i: HighScore.objects.filter(
+                user_id=probes[i % len(probes)]
+            ).order_by('-score')[:1],
+            'leaderboard keyset page': lambda i: after_middle.order_by('-score', '-date_achieved', '-id')[:20],
+            'online players (last_ping)': lambda i: OnlinePlayer.objects.filter(last_ping__gte=cutoff).order_by(),
+            'user directory page': lambda i: User.objects.order_by('-best_score', '-total_games_played', 'id')[:50],
+        }
+
+    def _set_indexes(self, create):
+        # Statements are built by hand: the SQLite schema editor refuses to run
+        # inside the transaction that keeps the synthetic data disposable
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model, name in PACK:
+                index = next(index for index in model._meta.indexes if index.name == name)
+                statement = index.create_sql(model, editor) if create else index.remove_sql(model, editor)
+                cursor.execute(str(statement))
+            cursor.execute('ANALYZE')
+
+    def _measure(self, title, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {title} =='))
+        medians = {}
+        for label, build in queries.items():
+            self.stdout.write(self.style.MIGRATE_LABEL(label))
+            self.stdout.write('  ' + build(0).explain().replace('\n', '\n  '))
+            timings = []
+            for i in range(self.repeat):
+                queryset = build(i)
+                start = time.perf_counter()
+                list(queryset)
+                timings.append(time.perf_counter() - start)
+            medians[label] = statistics.median(timings)
+            self.stdout.write(f'  median {medians[label] * 1e3:.3f}ms over {self.repeat} runs')
+        return medians
@@ -0,0 +1,60 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from game.leaderboard import LeaderboardIndex
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the in-process leaderboard index (bulk load, updates, top-N, rank)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--ops', type=int, default=100000, help='Operations per timed phase')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        users = options['users']
+        ops = options['ops']
+        rng = random.Random(options['seed'])
+        epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        rows = [
+            (user_id, rng.randrange(0, 5000, 10), epoch + timedelta(seconds=rng.randrange(10 ** 7)), f'user{user_id}', None)
+            for user_id in range(1, users + 1)
+        ]
+        index = LeaderboardIndex()
+        start = time.perf_counter()
+        index.load(rows)
+        self._line(f'Bulk load {users:,} users', time.perf_counter() - start, 1)
+
+        # New personal bests for random users
+        updates = [(rng.randrange(1, users + 1), rng.randrange(5000, 10000, 10)) for _ in range(ops)]
+        now = epoch + timedelta(days=365)
+        start = time.perf_counter()
+        for user_id, score in updates:
+            index.record(user_id, score, now, f'user{user_id}')
+        self._line('record (new best)', time.perf_counter() - start, ops)
+
+        start = time.perf_counter()
+        for _ in range(ops):
+            index.top(10)
+        self._line('top(10)', time.perf_counter() - start, ops)
+
+        offsets = [rng.randrange(users) for _ in range(ops)]
+        start = time.perf_counter()
+        for offset in offsets:
+            index.top(10, offset)
+        self._line('top(10, random offset)', time.perf_counter() - start, ops)
+
+        lookups = [rng.randrange(1, users + 1) for _ in range(ops)]
+        start = time.perf_counter()
+        for user_id in lookups:
+            index.rank(user_id)
+        self._line('rank(user)', time.perf_counter() - start, ops)
+
+        self.stdout.write(self.style.SUCCESS(f'Index holds {len(index):,} users'))
+
+    def _line(self, label, elapsed, count):
+        self.stdout.write(f'{label:<28} {elapsed:8.3f}s total  {elapsed / count * 1e6:10.2f}us/op')
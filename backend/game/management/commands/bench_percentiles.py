@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+from bisect import bisect_left
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from game.models import GameSession, User
+from game.sketch import KLLSketch, normalized_rank_error
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the KLL score sketch with exact COUNT(*) percentiles on synthetic finished games: '
+        'update and query cost, sketch size and observed rank error. Runs in a transaction that is '
+        'rolled back, so use a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=200000)
+        parser.add_argument('--k', type=int, default=200)
+        parser.add_argument('--probes', type=int, default=200, help='Scores queried; the median time is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Most games end early; a long tail of good runs
+        scores = [int(rng.expovariate(1 / 150)) // 10 * 10 for _ in range(options['games'])]
+        probes = [rng.choice(scores) + rng.choice((-10, 0, 10)) for _ in range(options['probes'])]
+
+        sketch = KLLSketch(options['k'], seed=options['seed'])
+        start = time.perf_counter()
+        for score in scores:
+            sketch.update(score)
+        update = (time.perf_counter() - start) / len(scores)
+
+        ordered = sorted(scores)
+        errors = [abs(sketch.rank(x) - bisect_left(ordered, x) / len(ordered)) for x in probes]
+        sketch_times = []
+        for x in probes:
+            start = time.perf_counter()
+            sketch.rank(x)
+            sketch_times.append(time.perf_counter() - start)
+
+        try:
+            with transaction.atomic():
+                exact_times = self._exact(scores, probes)
+                raise Rollback
+        except Rollback:
+            pass
+
+        sketch_query = statistics.median(sketch_times)
+        exact_query = statistics.median(exact_times)
+        self.stdout.write(f'{len(scores):,} games on {connection.vendor}, k={options["k"]}')
+        self.stdout.write(f'Sketch update:        {update * 1e6:9.2f}us per score')
+        self.stdout.write(f'Sketch size:          {len(sketch.to_bytes()):9,} bytes')
+        self.stdout.write(f'Sketch percentile:    {sketch_query * 1e6:9.2f}us median')
+        self.stdout.write(f'COUNT(*) percentile:  {exact_query * 1e6:9.2f}us median')
+        self.stdout.write(
+            f'Rank error:           max {max(errors) * 100:.2f}%, mean {statistics.mean(errors) * 100:.3f}% '
+            f'(documented bound {normalized_rank_error(options["k"]) * 100:.2f}%)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Speedup x{exact_query / sketch_query:,.0f}'))
+
+    def _exact(self, scores, probes):
+        user = User.objects.create(username='percentile-bench', email='percentile-bench@example.com')
+        now = timezone.now()
+        GameSession.objects.bulk_create(
+            [GameSession(user=user, score=score, is_active=False, ended_at=now) for score in scores],
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        finished = GameSession.objects.filter(is_active=False, ended_at__isnull=False)
+        times = []
+        for x in probes:
+            start = time.perf_counter()
+            # Games below the score and the total, as an exact endpoint would
+            finished.filter(score__lt=x).count()
+            finished.count()
+            times.append(time.perf_counter() - start)
+        return times
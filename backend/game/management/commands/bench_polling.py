@@ -0,0 +1,94 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from game.caching import high_scores_cache, online_players_cache
+from game.leaderboard import leaderboard
+from game.models import HighScore, User
+from game.presence import presence
+
+ENDPOINTS = (
+    ('online-players', '/api/online-players/', online_players_cache),
+    ('high_scores', '/api/games/high_scores/', high_scores_cache),
+    ('me_summary', '/api/games/me_summary/', None),
+    ('profile', '/api/auth/profile/', None),
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Cost of one client poll of the polled endpoints: rebuilt, served from the response cache, '
+        'and revalidated with If-None-Match (304). Runs in a transaction that is rolled back, so use '
+        'a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=200, help='Players online and on the leaderboard')
+        parser.add_argument('--polls', type=int, default=200, help='Requests per endpoint and mode')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                client = self._setup(options['players'])
+                rows = [self._bench(client, name, url, cache, options['polls']) for name, url, cache in ENDPOINTS]
+                raise Rollback
+        except Rollback:
+            pass
+        presence.clear()
+
+        self.stdout.write(f'{options["players"]} players, median of {options["polls"]} polls')
+        self.stdout.write(f'{"endpoint":<16}{"mode":<10}{"time":>10}{"queries":>9}{"bytes":>9}')
+        for name, results in rows:
+            for mode, (elapsed, queries, size) in results.items():
+                self.stdout.write(f'{name:<16}{mode:<10}{elapsed * 1e3:8.3f}ms{queries:>9}{size:>9,}')
+            speedup = results['full'][0] / results['304'][0]
+            self.stdout.write(self.style.SUCCESS(f'{name:<16}304 is x{speedup:.1f} cheaper than a full response'))
+
+    def _setup(self, players):
+        now = timezone.now()
+        users = User.objects.bulk_create([
+            User(username=f'poll-bench-{i}', email=f'poll-bench-{i}@example.com', best_score=i * 10)
+            for i in range(players)
+        ])
+        HighScore.objects.bulk_create([
+            HighScore(user=user, score=user.best_score, date_achieved=now) for user in users
+        ])
+        leaderboard.rebuild()
+        for user in users:
+            presence.ping(user.id)
+        token = Token.objects.create(user=users[0])
+        return Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def _bench(self, client, name, url, cache, polls):
+        client.get(url)
+        results = {}
+        modes = ['full', 'cached', '304'] if cache is not None else ['full', '304']
+        for mode in modes:
+            times, queries, sizes = [], [], []
+            for _ in range(polls):
+                headers = {}
+                if mode == 'full' and cache is not None:
+                    # What the first poll after every data change costs
+                    cache.clear()
+                elif mode == '304':
+                    headers['HTTP_IF_NONE_MATCH'] = etag
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url, **headers)
+                    times.append(time.perf_counter() - start)
+                queries.append(len(captured))
+                sizes.append(len(response.content))
+                etag = response['ETag']
+            if mode == '304' and response.status_code != 304:
+                self.stderr.write(f'{name}: expected 304, got {response.status_code}')
+            results[mode] = (statistics.median(times), max(queries), int(statistics.median(sizes)))
+        return name, results
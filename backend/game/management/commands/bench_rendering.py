@@ -0,0 +1,72 @@
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from game.renderers import FastJSONRenderer, orjson, stream_json
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def rows(count):
+    """User-directory-shaped rows, generated lazily"""
+    for i in range(count):
+        yield {
+            'id': i,
+            'username': f'player{i}',
+            'date_joined': (EPOCH + timedelta(hours=i)).isoformat(),
+            'join_date_formatted': 'January 2025',
+            'total_games_played': i % 90,
+            'best_score': i % 500 * 10,
+            'is_online': bool(i % 2),
+            'last_activity': EPOCH + timedelta(minutes=i),
+            'profile_photo_url': f'http://localhost/media/profile_photos/{i}.png' if i % 3 else None,
+            'bio': 'Snake fan',
+            'location': 'Earth',
+        }
+
+
+class Command(BaseCommand):
+    help = 'Stock JSONRenderer vs FastJSONRenderer, and peak memory of a materialized vs streamed list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows rendered per timing run')
+        parser.add_argument('--sizes', default='10000,50000,200000', help='List sizes for the memory comparison')
+        parser.add_argument('--repeat', type=int, default=5, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed; FastJSONRenderer falls back to the stock encoder')
+        data = list(rows(options['rows']))
+        stock, stock_bytes = self._time(JSONRenderer().render, data, options['repeat'])
+        fast, fast_bytes = self._time(FastJSONRenderer().render, data, options['repeat'])
+        if stock_bytes != fast_bytes:
+            raise AssertionError('FastJSONRenderer output differs from JSONRenderer')
+        self.stdout.write(f'Render {len(data):,} rows ({len(stock_bytes) / 1e6:.1f} MB)')
+        self.stdout.write(f'  JSONRenderer      {stock * 1000:8.1f}ms')
+        self.stdout.write(f'  FastJSONRenderer  {fast * 1000:8.1f}ms   x{stock / fast:.1f}')
+
+        self.stdout.write('Peak memory: materialized Response body vs streamed chunks')
+        for size in (int(size) for size in options['sizes'].split(',')):
+            whole = self._peak(lambda: JSONRenderer().render(list(rows(size))))
+            streamed = self._peak(lambda: sum(len(chunk) for chunk in stream_json(rows(size))))
+            self.stdout.write(f'  {size:>9,} rows  {whole / 2 ** 20:8.1f} MiB  vs  {streamed / 2 ** 20:6.2f} MiB')
+        self.stdout.write(self.style.SUCCESS('Streamed peak stays at about one chunk whatever the size'))
+
+    def _time(self, render, data, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = render(data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    def _peak(self, function):
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,98 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.utils.encoders import JSONEncoder
+from game.fastserializers import compile_serializer
+from game.models import GameSession, HighScore, OnlinePlayer, User
+from game.serializers import HighScoreSerializer, LeaderboardEntrySerializer, OnlinePlayerSerializer, UserProfileSerializer
+
+
+def as_row(instance, columns):
+    """The dict values(*columns) would return for ``instance``"""
+    row = {}
+    for column in columns:
+        value = instance
+        for attr in column.split('__'):
+            value = getattr(value, attr)
+        row[column] = getattr(value, 'name', value)
+    return row
+
+
+class Command(BaseCommand):
+    help = 'Serialize in-memory rows with DRF and with the compiled fast path; time per 1k rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        n = options['rows']
+        epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        users = [
+            User(
+                id=i, username=f'user{i}', email=f'user{i}@example.com', date_joined=epoch + timedelta(hours=i),
+                best_score=i % 500 * 10, total_games_played=i % 90, is_online=bool(i % 2),
+                last_activity=epoch + timedelta(minutes=i), profile_photo=f'profile_photos/{i}.png' if i % 3 else None,
+                bio='snake fan', location='Earth',
+            )
+            for i in range(1, n + 1)
+        ]
+        scores = [HighScore(id=user.id, user=user, score=user.best_score, date_achieved=user.last_activity) for user in users]
+        players = [
+            OnlinePlayer(user=user, last_ping=user.last_activity,
+                         current_game=GameSession(id=user.id, user=user, score=10, is_active=True) if user.id % 4 else None)
+            for user in users
+        ]
+        entries = [
+            {'rank': rank, 'user_id': user.id, 'username': user.username, 'score': user.best_score,
+             'profile_photo': user.profile_photo.name}
+            for rank, user in enumerate(users, 1)
+        ]
+        request = RequestFactory().get('/api/users/', HTTP_HOST='localhost')
+        request.query_params = request.GET
+        context = {'request': request}
+
+        cases = [
+            ('UserProfileSerializer', UserProfileSerializer, users),
+            ('HighScoreSerializer', HighScoreSerializer, scores),
+            ('OnlinePlayerSerializer', OnlinePlayerSerializer, players),
+            ('LeaderboardEntrySerializer', LeaderboardEntrySerializer, entries),
+        ]
+        self.stdout.write(f'{"serializer":<28}{"DRF":>10}{"compiled":>11}{"values()":>11}   ms per 1k rows')
+        for label, serializer_class, instances in cases:
+            expected = self._encode(serializer_class(instances, many=True, context=context).data)
+            drf = self._time(lambda: serializer_class(instances, many=True, context=context).data, options['repeat'])
+            timings = []
+            for dicts in (False, True):
+                if instances is entries and not dicts:
+                    # The index hands out dicts already
+                    timings.append(None)
+                    continue
+                try:
+                    compiled = compile_serializer(serializer_class, context, dicts=dicts)
+                except TypeError:
+                    timings.append(None)
+                    continue
+                rows = [as_row(row, compiled.columns) for row in instances] if dicts and instances is not entries else instances
+                if self._encode(compiled.serialize(rows, context)) != expected:
+                    raise AssertionError(f'{label} compiled output differs')
+                timings.append(self._time(lambda: compiled.serialize(rows, context), options['repeat']))
+            cells = [f'{t * 1000 / n * 1000:9.2f}' if t is not None else f'{"-":>9}' for t in [drf] + timings]
+            best = min(t for t in timings if t is not None)
+            self.stdout.write(f'{label:<28}{cells[0]:>10}{cells[1]:>11}{cells[2]:>11}   x{drf / best:.1f}')
+        self.stdout.write(self.style.SUCCESS('Compiled output matches serializer.data for every case'))
+
+    def _encode(self, data):
+        return json.dumps(data, cls=JSONEncoder)
+
+    def _time(self, function, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from game.engine import SnakeGame
+from game.models import User, GameSession
+from game.sockets import websocket_application
+
+# Heading changes that keep a bot circling a small square
+LOOP = ('right', 'down', 'left', 'up')
+
+
+def bot_batch(tick):
+    """One input batch per tick: a turn every third tick"""
+    events = [[tick, LOOP[(tick // 3 - 1) % 4]]] if tick % 3 == 0 else []
+    # seq numbers events, so an empty batch names the next expected one
+    seq = tick // 3 if events else tick // 3 + 1
+    return {'seq': seq, 'events': events, 'tick': tick}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Local load test comparing the WebSocket game channel with HTTP update_game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=200, help='Concurrent sockets to hold open')
+        parser.add_argument('--messages', type=int, default=50, help='Input batches per connection')
+
+    def handle(self, *args, **options):
+        connections = options['connections']
+        messages = options['messages']
+        user = User.objects.create_user(
+            username=f'bench_transport_{int(time.time())}',
+            email=f'bench_transport_{int(time.time())}@example.com'
+        )
+        token = Token.objects.create(user=user)
+        try:
+            start = time.perf_counter()
+            http = self._bench_http(user, token, messages)
+            http_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            sockets, per_connection = self._bench_sockets(user, token, connections, messages)
+            sockets_elapsed = time.perf_counter() - start
+        finally:
+            user.delete()
+
+        self._report('HTTP update_game (1 client)', http, http_elapsed)
+        self._report(f'WebSocket ({connections} open)', sockets, sockets_elapsed)
+        self.stdout.write(f'Memory per open socket: {per_connection / 1024:.1f} KiB')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Estimated connections/worker at 256 MiB: {int(256 * 1024 * 1024 / max(per_connection, 1)):,}'
+            )
+        )
+
+    def _new_session(self, user):
+        return GameSession.objects.create(user=user, game_data=SnakeGame.new(seed=0).to_state())
+
+    def _bench_http(self, user, token, messages):
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}')
+        url = f'/api/games/{self._new_session(user).id}/update_game/'
+        latencies = []
+        for tick in range(1, messages + 1):
+            start = time.perf_counter()
+            response = client.post(url, json.dumps(bot_batch(tick)), content_type='application/json')
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or response.json().get('game_over'):
+                break
+        return latencies
+
+    def _bench_sockets(self, user, token, connections, messages):
+        sessions = [self._new_session(user) for _ in range(connections)]
+        latencies = []
+
+        async def run():
+            queues = []
+            tasks = []
+            for game_session in sessions:
+                inbox, outbox = asyncio.Queue(), asyncio.Queue()
+                scope = {
+                    'type': 'websocket',
+                    'path': f'/ws/games/{game_session.id}/',
+                    'query_string': f'token={token.key}'.encode(),
+                }
+                tasks.append(asyncio.create_task(websocket_application(scope, inbox.get, outbox.put)))
+                await inbox.put({'type': 'websocket.connect'})
+                accepted = await outbox.get()
+                if accepted['type'] != 'websocket.accept':
+                    raise RuntimeError(f'Socket rejected: {accepted}')
+                queues.append((inbox, outbox))
+
+            open_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            async def drive(inbox, outbox):
+                for tick in range(1, messages + 1):
+                    start = time.perf_counter()
+                    await inbox.put({'type': 'websocket.receive', 'text': json.dumps(bot_batch(tick))})
+                    reply = await outbox.get()
+                    latencies.append(time.perf_counter() - start)
+                    if reply['type'] != 'websocket.send' or json.loads(reply['text']).get('game_over'):
+                        return
+                await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+
+            await asyncio.gather(*(drive(inbox, outbox) for inbox, outbox in queues))
+            await asyncio.gather(*tasks)
+            return open_bytes
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        open_bytes = asyncio.run(run())
+        return latencies, (open_bytes - baseline) / max(connections, 1)
+
+    def _report(self, label, latencies, elapsed):
+        if not latencies:
+            self.stdout.write(f'{label}: no messages completed')
+            return
+        ms = [v * 1000 for v in latencies]
+        self.stdout.write(
+            f'{label}: {len(ms)} msgs, {len(ms) / elapsed:,.0f} msgs/s, mean {statistics.mean(ms):.3f}ms, '
+            f'p50 {percentile(ms, 50):.3f}ms, p95 {percentile(ms, 95):.3f}ms, p99 {percentile(ms, 99):.3f}ms'
+        )
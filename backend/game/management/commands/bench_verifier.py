@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from game.engine import DIRECTIONS, SnakeGame
+from game.replay import Replay, ReplayRecorder
+from game.verifier import verify_batch
+
+
+def play(rng, max_ticks):
+    """A food-chasing bot game; returns ``(score, replay_bytes)``"""
+    game = SnakeGame.new(seed=rng.getrandbits(32))
+    ReplayRecorder.start(game, game.seed)
+    limit = rng.randrange(max_ticks // 2, max_ticks + 1)
+    while not game.game_over and game.tick < limit:
+        direction = None
+        if rng.random() < 0.7:
+            head = game.snake.head_cell()
+            hx, hy = head % game.width, head // game.width
+            fx, fy = game.food % game.width, game.food // game.width
+            direction = 3 if fx > hx else 2 if fx < hx else 1 if fy > hy else 0
+        elif rng.random() < 0.2:
+            direction = rng.randrange(len(DIRECTIONS))
+        game.step(direction)
+    return game.score, game.recorder.finish(game.tick)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare one-at-a-time Python replay verification with the NumPy batch verifier on '
+        'synthetic games and project the time to verify a day of traffic'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=20000)
+        parser.add_argument('--ticks', type=int, default=600, help='Longest game in ticks')
+        parser.add_argument('--batch', type=int, default=4096)
+        parser.add_argument('--per-day', type=int, default=1_000_000, help='Games per day for the projection')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        items = [(i, *play(rng, options['ticks'])) for i in range(options['games'])]
+        size = sum(len(data) for _, _, data in items)
+        self.stdout.write(f'{len(items):,} games, {size / len(items):.0f} bytes of replay on average')
+
+        start = time.perf_counter()
+        reference = [Replay(data).verify()[1].score for _, _, data in items]
+        python = time.perf_counter() - start
+
+        batch = options['batch']
+        start = time.perf_counter()
+        results = [result for i in range(0, len(items), batch) for result in verify_batch(items[i:i + batch])]
+        vectorized = time.perf_counter() - start
+
+        disagree = sum(result.score != score for result, score in zip(results, reference))
+        flagged = sum(not result.ok for result in results)
+        per_day = options['per_day']
+        for label, elapsed in (('Python Replay.verify', python), (f'NumPy verify_batch ({batch})', vectorized)):
+            rate = len(items) / elapsed
+            self.stdout.write(
+                f'{label:<28} {elapsed:8.2f}s {rate:>10,.0f} games/s   {per_day:,} games/day in {per_day / rate / 60:.1f} min'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Speedup x{python / vectorized:.1f}'))
+        if disagree or flagged:
+            self.stdout.write(self.style.ERROR(f'{disagree} score disagreements, {flagged} games flagged'))
@@ -0,0 +1,182 @@
+import http.client
+import json
+import statistics
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from game.management.commands.bench_transport import bot_batch, percentile
+from game.models import User
+
+PASSWORD = 'Load-test-pass-1234'
+
+
+class Stats:
+    """Latencies and failures per endpoint, shared by every player thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class Player:
+    """One virtual player on its own keep-alive connection"""
+
+    def __init__(self, base, name, stats, options):
+        self.base = base
+        self.name = name
+        self.stats = stats
+        self.options = options
+        self.token = None
+        self.connection = None
+
+    def request(self, endpoint, method, path, body=None):
+        headers = {'Content-Type': 'application/json', 'Host': self.base.netloc}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        payload = json.dumps(body) if body is not None else None
+        start = time.perf_counter()
+        status, data = 0, None
+        try:
+            if self.connection is None:
+                connection_class = http.client.HTTPSConnection if self.base.scheme == 'https' else http.client.HTTPConnection
+                self.connection = connection_class(self.base.hostname, self.base.port, timeout=30)
+            self.connection.request(method, self.base.path.rstrip('/') + path, payload, headers)
+            response = self.connection.getresponse()
+            raw = response.read()
+            status = response.status
+            if raw and response.getheader('Content-Type', '').startswith('application/json'):
+                data = json.loads(raw)
+        except (OSError, http.client.HTTPException, ValueError):
+            # Reconnect on the next request
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+        self.stats.add(endpoint, time.perf_counter() - start, 200 <= status < 300)
+        return status, data
+
+    def run(self, deadline):
+        status, _ = self.request('register', 'POST', '/api/auth/register/', {
+            'username': self.name, 'email': f'{self.name}@example.com',
+            'password': PASSWORD, 'password2': PASSWORD,
+        })
+        status, data = self.request('login', 'POST', '/api/auth/login/', {'username': self.name, 'password': PASSWORD})
+        if status != 200:
+            return
+        self.token = data['token']
+        think = self.options['think'] / 1000
+        for _ in range(self.options['games']):
+            if time.monotonic() >= deadline:
+                break
+            status, data = self.request('start_game', 'POST', '/api/games/start_game/')
+            if status != 201:
+                return
+            game_id = data['game_id']
+            for tick in range(1, self.options['moves'] + 1):
+                if time.monotonic() >= deadline:
+                    break
+                status, data = self.request('update_game', 'POST', f'/api/games/{game_id}/update_game/', bot_batch(tick))
+                if status == 200 and data.get('game_over'):
+                    break
+                if tick % self.options['ping_every'] == 0:
+                    self.request('ping', 'POST', '/api/ping/', {'current_game_id': game_id})
+                if tick % self.options['poll_every'] == 0:
+                    self.request('online_players', 'GET', '/api/online-players/')
+                if think:
+                    time.sleep(think)
+            else:
+                self.request('end_game', 'POST', f'/api/games/{game_id}/end_game/')
+        if self.connection is not None:
+            self.connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate concurrent players against a running server (register, login, start_game, '
+        'update_game, ping, online-players, end_game) and report throughput and latency per endpoint. '
+        'Pass several --players values to sweep for the saturation point.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--players', default='20', help='Concurrent players; a comma list runs one stage per value')
+        parser.add_argument('--games', type=int, default=3, help='Games per player')
+        parser.add_argument('--moves', type=int, default=200, help='update_game calls per game at most')
+        parser.add_argument('--think', type=float, default=100, help='Milliseconds between moves')
+        parser.add_argument('--ping-every', type=int, default=20, help='Moves between pings')
+        parser.add_argument('--poll-every', type=int, default=50, help='Moves between online-players polls')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds per stage at most')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the generated users afterwards (same database)')
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        if base.scheme not in ('http', 'https') or not base.hostname:
+            raise CommandError(f'Unsupported --url {options["url"]}')
+        try:
+            stages = [int(value) for value in options['players'].split(',')]
+        except ValueError:
+            raise CommandError('--players takes integers, e.g. 10,50,100')
+
+        prefix = f'load{int(time.time())}'
+        summary = []
+        try:
+            for stage, players in enumerate(stages):
+                stats, elapsed = self._run_stage(base, f'{prefix}s{stage}p', players, options)
+                summary.append((players, *self._report(players, stats, elapsed)))
+        finally:
+            if options['cleanup']:
+                deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+                self.stdout.write(f'Deleted {deleted} rows created by the load test')
+
+        if len(summary) > 1:
+            self.stdout.write(self.style.MIGRATE_HEADING('\nSaturation sweep'))
+            self.stdout.write(f'{"players":>8} {"req/s":>9} {"p95 ms":>9} {"errors":>7}')
+            for players, throughput, p95, errors in summary:
+                self.stdout.write(f'{players:>8} {throughput:>9,.0f} {p95:>9.1f} {errors:>7}')
+
+    def _run_stage(self, base, prefix, players, options):
+        stats = Stats()
+        deadline = time.monotonic() + options['duration']
+        threads = [
+            threading.Thread(target=Player(base, f'{prefix}{i}', stats, options).run, args=(deadline,), daemon=True)
+            for i in range(players)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats, time.perf_counter() - start
+
+    def _report(self, players, stats, elapsed):
+        """Print one stage; returns (requests/s, overall p95 ms, errors)"""
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{players} players, {elapsed:.1f}s'))
+        self.stdout.write(
+            f'{"endpoint":<16} {"count":>7} {"errors":>7} {"req/s":>8} {"mean":>8} {"p50":>8} {"p95":>8} {"p99":>8}'
+        )
+        everything = []
+        for endpoint, latencies in stats.latencies.items():
+            ms = [value * 1000 for value in latencies]
+            everything.extend(ms)
+            self.stdout.write(
+                f'{endpoint:<16} {len(ms):>7} {stats.errors[endpoint]:>7} {len(ms) / elapsed:>8,.1f} '
+                f'{statistics.mean(ms):>8.2f} {percentile(ms, 50):>8.2f} {percentile(ms, 95):>8.2f} {percentile(ms, 99):>8.2f}'
+            )
+        errors = sum(stats.errors.values())
+        if not everything:
+            return 0.0, 0.0, errors
+        throughput = len(everything) / elapsed
+        p95 = percentile(everything, 95)
+        self.stdout.write(self.style.SUCCESS(
+            f'Total {len(everything):,} requests, {throughput:,.1f} req/s, p95 {p95:.2f}ms, {errors} errors'
+        ))
+        return throughput, p95, errors
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from game.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild every UserStats row from finished games in GameSession and the archive, one '
+        'chunk of users per transaction. Use it to backfill or repair the incremental stats.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=500, help='Users per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk'] < 1:
+            raise CommandError('--chunk must be positive')
+        start = time.perf_counter()
+        written = rebuild(options['chunk'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt stats for {written:,} players in {time.perf_counter() - start:.2f}s'
+        ))
@@ -0,0 +1,71 @@
+import mmap
+
+from django.core.management.base import BaseCommand, CommandError
+from game.engine import InvalidState
+from game.models import ArchivedGameSession, GameSession
+from game.replay import Replay
+
+
+class Command(BaseCommand):
+    help = 'Reconstruct a frame of a finished game from its binary replay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id', nargs='?', type=int)
+        parser.add_argument('--file', help='Read a raw replay file (memory-mapped) instead of the database')
+        parser.add_argument('--tick', type=int, help='Frame to draw; defaults to the final tick')
+        parser.add_argument('--export', help='Write the replay bytes of session_id to this file')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._show(data, options['tick'], None)
+            return
+        if options['session_id'] is None:
+            raise CommandError('Give a session id or --file')
+        game_session = (
+            GameSession.objects.only('score', 'replay').filter(id=options['session_id']).first()
+            or ArchivedGameSession.objects.only('score', 'replay').filter(id=options['session_id']).first()
+        )
+        if game_session is None:
+            raise CommandError(f'Game session {options["session_id"]} not found')
+        if game_session.replay is None:
+            raise CommandError('This session has no replay (still running, or played with full-state updates)')
+        if options['export']:
+            with open(options['export'], 'wb') as f:
+                f.write(game_session.replay)
+        self._show(game_session.replay, options['tick'], game_session.score)
+
+    def _show(self, data, tick, stored_score):
+        try:
+            replay = Replay(data)
+            final = tick is None or tick >= replay.final_tick
+            game = replay.frame(replay.final_tick if tick is None else tick)
+        except InvalidState as e:
+            raise CommandError(f'Cannot read replay: {e}')
+        self.stdout.write(
+            f'{len(replay)} bytes, {replay.turns} turns, final tick {replay.final_tick}, '
+            f'seed {replay.seed if replay.seed is not None else "-"}'
+        )
+        self.stdout.write(self._draw(game))
+        self.stdout.write(f'tick {game.tick}  score {game.score}  {"game over" if game.game_over else ""}'.rstrip())
+        if final:
+            consistent, _ = replay.verify()
+            if consistent is not None:
+                if consistent:
+                    self.stdout.write(self.style.SUCCESS('Every food placement matches the seed'))
+                else:
+                    self.stdout.write(self.style.ERROR('Food placements do not match the seed'))
+        if final and stored_score is not None:
+            if game.score == stored_score:
+                self.stdout.write(self.style.SUCCESS(f'Replay matches the stored score {stored_score}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Replay scores {game.score}, stored score is {stored_score}'))
+
+    def _draw(self, game):
+        width = game.width
+        grid = [['.'] * width for _ in range(game.height)]
+        for i, cell in enumerate(game.snake):
+            grid[cell // width][cell % width] = 'O' if i == 0 else 'o'
+        if game.food >= 0:
+            grid[game.food // width][game.food % width] = '*'
+        return '\n'.join(''.join(row) for row in grid)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.leaderboard import expire_period_bests, get_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete day and week leaderboard buckets past the LEADERBOARD_WINDOWS retention, in small '
+        'batches so requests are never blocked. Schedule it daily; live buckets roll over by themselves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        if options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+        deleted = expire_period_bests(options['batch'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted:,} expired rows (keeping {get_setting("KEEP_DAYS")} days, {get_setting("KEEP_WEEKS")} weeks)'
+        ))
@@ -0,0 +1,93 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from game.gameplay import drop_flagged_scores
+from game.models import GameSession
+from game.verifier import verify_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-simulate finished games from their replays in NumPy batches and flag sessions whose '
+        'stored score, food placements or length do not match. Run with --minutes and --unchecked '
+        'from cron for near-online checking, or with --days for an offline sweep. With --mark, flagged '
+        'games also come off the leaderboards.'
+    )
+
+    def add_arguments(self, parser):
+        window = parser.add_mutually_exclusive_group()
+        window.add_argument('--days', type=float, default=1, help='Games ended in the last N days (default 1)')
+        window.add_argument('--minutes', type=float, help='Games ended in the last N minutes')
+        window.add_argument('--all', action='store_true', help='Every finished game')
+        parser.add_argument('--unchecked', action='store_true', help='Skip sessions that already have a verdict')
+        parser.add_argument('--batch', type=int, default=4096, help='Games simulated together')
+        parser.add_argument('--mark', action='store_true', help='Store verdicts and take flagged scores off the leaderboards')
+
+    def handle(self, *args, **options):
+        if options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+        sessions = GameSession.objects.filter(is_active=False)
+        if not options['all']:
+            window = timedelta(minutes=options['minutes']) if options['minutes'] is not None else timedelta(days=options['days'])
+            sessions = sessions.filter(ended_at__gte=timezone.now() - window)
+        if options['unchecked']:
+            sessions = sessions.filter(verified__isnull=True)
+        unverifiable = sessions.filter(replay__isnull=True).count()
+
+        checked = 0
+        flagged = []
+        start = time.perf_counter()
+        rows = sessions.filter(replay__isnull=False).order_by('id').values_list(
+            'id', 'user_id', 'user__username', 'score', 'replay'
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=options['batch']):
+            batch.append(row)
+            if len(batch) == options['batch']:
+                flagged += self._verify(batch, options['mark'])
+                checked += len(batch)
+                batch = []
+        if batch:
+            flagged += self._verify(batch, options['mark'])
+            checked += len(batch)
+        elapsed = time.perf_counter() - start
+
+        for result, username in flagged:
+            if result.error:
+                reason = result.error
+            elif result.score != result.claimed_score:
+                reason = f'replay scores {result.score}, stored score is {result.claimed_score}'
+            else:
+                reason = 'food placements do not match the seed'
+            self.stdout.write(self.style.ERROR(f'Session {result.key} ({username}): {reason}'))
+        rate = checked / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f'Verified {checked:,} games in {elapsed:.2f}s ({rate:,.0f} games/s), '
+            f'{len(flagged)} flagged, {unverifiable} without a replay'
+        )
+
+    def _verify(self, rows, mark):
+        """Verify one batch; returns ``(VerifiedGame, username)`` for failures"""
+        users = {}
+        # Replays of different board sizes cannot share a batch
+        by_board = defaultdict(list)
+        for session_id, user_id, username, score, replay in rows:
+            users[session_id] = (user_id, username)
+            replay = bytes(replay)
+            by_board[replay[5:7]].append((session_id, score, replay))
+        results = [result for items in by_board.values() for result in verify_batch(items)]
+        flagged = [result for result in results if not result.ok]
+        if mark:
+            now = timezone.now()
+            with transaction.atomic():
+                GameSession.objects.bulk_update(
+                    [GameSession(id=result.key, verified=result.ok, verified_at=now) for result in results],
+                    ['verified', 'verified_at'],
+                    batch_size=1000,
+                )
+                drop_flagged_scores({users[result.key][0] for result in flagged})
+        return [(result, users[result.key][1]) for result in flagged]
@@ -0,0 +1,135 @@
+"""
+Opt-in per-request query inspection.
+
+``QueryInspectorMiddleware`` wraps every database call made while a request
+is handled and records its SQL fingerprint and duration. After the response
+it logs, on the ``game.queries`` logger:
+
+* requests over ``SLOW_REQUEST_MS`` of DB time or ``MAX_QUERIES`` queries,
+* single queries over ``SLOW_QUERY_MS``,
+* likely N+1 loops: one fingerprint repeated ``N_PLUS_ONE_THRESHOLD`` times
+  or more, with the view and the serializer method that issued it.
+
+It also adds a ``Server-Timing: db`` header. Enable it with
+``QUERY_INSPECTOR['ENABLED']``; when disabled Django drops it at startup.
+"""
+from collections import Counter
+import logging
+import re
+import sys
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('game.queries')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 200.0,
+    'SLOW_QUERY_MS': 50.0,
+    'MAX_QUERIES': 30,
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE = re.compile(r'\s+')
+
+# Frames walked looking for the serializer behind a repeated query
+_STACK_DEPTH = 40
+
+
+def get_setting(name):
+    return getattr(settings, 'QUERY_INSPECTOR', {}).get(name, DEFAULTS[name])
+
+
+def fingerprint(sql):
+    """SQL with parameters, literals and IN-list lengths folded away"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERAL.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _serializer_frame():
+    """``Serializer.method`` for the innermost serializer on the stack"""
+    frame = sys._getframe(2)
+    for _ in range(_STACK_DEPTH):
+        if frame is None:
+            break
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, BaseSerializer):
+            return f'{type(owner).__name__}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable collecting one request's queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.sources = {}
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        # The stack is only walked once a statement starts repeating
+        if self.fingerprints[key] == 2 and key not in self.sources:
+            self.sources[key] = _serializer_frame()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed * 1000 >= get_setting('SLOW_QUERY_MS'):
+                self.slow.append((elapsed, key))
+
+    def repeated(self, threshold):
+        return [(key, count) for key, count in self.fingerprints.most_common() if count >= threshold]
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        wrappers = [connection.execute_wrapper(recorder) for connection in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        self.report(request, recorder)
+        response['Server-Timing'] = f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"'
+        return response
+
+    def report(self, request, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        millis = recorder.seconds * 1000
+        if millis >= get_setting('SLOW_REQUEST_MS') or recorder.count >= get_setting('MAX_QUERIES'):
+            logger.warning(
+                'Slow request %s %s (view %s): %d queries, %.1fms in the database',
+                request.method, request.path, view, recorder.count, millis,
+            )
+        for elapsed, sql in recorder.slow:
+            logger.warning('Slow query in %s (%.1fms): %s', view, elapsed * 1000, sql)
+        for sql, count in recorder.repeated(get_setting('N_PLUS_ONE_THRESHOLD')):
+            source = recorder.sources.get(sql)
+            logger.warning(
+                'Possible N+1 in %s%s: %d x %s',
+                view, f' via {source}' if source else '', count, sql,
+            )
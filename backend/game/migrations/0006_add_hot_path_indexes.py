@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_remove_user_google_id_remove_user_google_id_temp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='session_active_only_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='highscore',
+            index=models.Index(fields=['-score', '-date_achieved', '-id'], name='highscore_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onlineplayer',
+            index=models.Index(fields=['last_ping'], name='onlineplayer_last_ping_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-best_score', '-total_games_played', 'id'], name='user_directory_idx'),
+        ),
+    ]
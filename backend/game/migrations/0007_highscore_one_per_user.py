@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def keep_best_score_per_user(apps, schema_editor):
+    HighScore = apps.get_model('game', 'HighScore')
+    duplicated = (
+        HighScore.objects.values('user').annotate(rows=Count('id')).filter(rows__gt=1).values_list('user', flat=True)
+    )
+    for user_id in duplicated:
+        scores = HighScore.objects.filter(user_id=user_id).order_by('-score', 'date_achieved', 'id')
+        best = scores.first()
+        scores.exclude(id=best.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_add_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_best_score_per_user, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='highscore',
+            constraint=models.UniqueConstraint(fields=('user',), name='highscore_one_per_user'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_highscore_one_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='replay',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_gamesession_replay'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='seed',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_gamesession_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='verified',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_gamesession_verified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGameSession',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('score', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('state', models.BinaryField()),
+                ('replay', models.BinaryField(blank=True, null=True)),
+                ('verified', models.BooleanField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-score', '-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['updated_at'], name='session_ended_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedgamesession',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedgamesession',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='archive_user_history_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_archive_ended_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('games_played', models.IntegerField(default=0)),
+                ('total_score', models.BigIntegerField(default=0)),
+                ('total_score_squares', models.BigIntegerField(default=0)),
+                ('days_played', models.IntegerField(default=0)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('first_played_on', models.DateField(blank=True, null=True)),
+                ('last_played_on', models.DateField(blank=True, null=True)),
+                ('bucket_0', models.IntegerField(default=0)),
+                ('bucket_1', models.IntegerField(default=0)),
+                ('bucket_2', models.IntegerField(default=0)),
+                ('bucket_3', models.IntegerField(default=0)),
+                ('bucket_4', models.IntegerField(default=0)),
+                ('bucket_5', models.IntegerField(default=0)),
+                ('bucket_6', models.IntegerField(default=0)),
+                ('bucket_7', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreSketch',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_scoresketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodBest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('starts_on', models.DateField()),
+                ('score', models.IntegerField()),
+                ('date_achieved', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_bests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score', '-date_achieved'],
+                'indexes': [models.Index(fields=['period', 'starts_on', '-score', '-date_achieved', '-id'], name='periodbest_rank_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='periodbest',
+            constraint=models.UniqueConstraint(fields=('period', 'starts_on', 'user'), name='periodbest_one_per_user'),
+        ),
+    ]
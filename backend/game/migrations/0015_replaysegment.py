@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_periodbest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplaySegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='replay_segments', to='game.gamesession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='replaysegment',
+            constraint=models.UniqueConstraint(fields=('session', 'offset'), name='replaysegment_session_offset'),
+        ),
+    ]
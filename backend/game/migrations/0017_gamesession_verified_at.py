@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0015_replaysegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(condition=models.Q(('verified', False)), fields=['verified_at'], name='session_flagged_idx'),
+        ),
+    ]
@@ -1,7 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from bisect import bisect_right
 from datetime import timedelta
+import json
+import zlib
+
+from .buffers import activity_buffer
 
 
 class User(AbstractUser):
@@ -21,17 +26,26 @@ class User(AbstractUser):
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # User directory order (AllUsersView keyset pages)
+            models.Index(fields=['-best_score', '-total_games_played', 'id'], name='user_directory_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
     def mark_online(self):
+        """Buffered: the timestamp reaches the database on the next activity flush"""
         self.is_online = True
         self.last_activity = timezone.now()
-        self.save()
+        activity_buffer.touch(self)
 
     def mark_offline(self):
+        # A pending flush would otherwise mark the user online again
+        activity_buffer.pop(self.id)
         self.is_online = False
-        self.save()
+        self.save(update_fields=['is_online'])
 
     @classmethod
     def get_online_users(cls):
@@ -51,9 +65,25 @@ class GameSession(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     ended_at = models.DateTimeField(null=True, blank=True)
+    # Food placement seed (see engine.food_hash); null for older sessions
+    seed = models.BigIntegerField(null=True, blank=True)
+    # Binary input log of a finished game (see game/replay.py)
+    replay = models.BinaryField(null=True, blank=True, editable=False)
+    # Outcome of re-simulating the replay (see game/verifier.py); null until checked
+    verified = models.BooleanField(null=True, blank=True)
+    verified_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-score', '-created_at']
+        indexes = [
+            # Only live sessions; stays small however many games have ended.
+            # Per-user history uses the user foreign key's own index.
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='session_active_only_idx'),
+            # Archival candidates (game/archive.py), oldest first
+            models.Index(fields=['updated_at'], condition=models.Q(is_active=False), name='session_ended_idx'),
+            # Recently flagged games, polled by every leaderboard sync
+            models.Index(fields=['verified_at'], condition=models.Q(verified=False), name='session_flagged_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - Score: {self.score}"
@@ -67,7 +97,139 @@ class GameSession(models.Model):
         self.user.total_games_played += 1
         if self.score > self.user.best_score:
             self.user.best_score = self.score
-        self.user.save()
+        self.user.save(update_fields=['total_games_played', 'best_score'])
+
+
+class ReplaySegment(models.Model):
+    """
+    Bytes appended to a running game's replay log by one save (see game/replay.py).
+
+    The hot ``GameSession`` row only carries the log's length; finish_game
+    joins the segments into ``GameSession.replay`` and deletes them.
+    """
+    session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='replay_segments')
+    offset = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            # A retried flush can't store a piece twice
+            models.UniqueConstraint(fields=['session', 'offset'], name='replaysegment_session_offset'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} @ {self.offset}: {len(self.data)} bytes"
+
+
+class ArchivedGameSession(models.Model):
+    """
+    Cold copy of an ended ``GameSession`` (see game/archive.py).
+
+    Keeps the original id so links and replays stay valid. The final
+    ``game_data`` is stored zlib-compressed.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_sessions')
+    score = models.IntegerField()
+    created_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+    seed = models.BigIntegerField(null=True, blank=True)
+    state = models.BinaryField()
+    replay = models.BinaryField(null=True, blank=True)
+    verified = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-score', '-created_at']
+        indexes = [
+            # A player's history, newest first (keyset pages)
+            models.Index(fields=['user', '-created_at', '-id'], name='archive_user_history_idx'),
+        ]
+
+    # Read-only stand-ins so archived rows serialize like GameSession
+    is_active = False
+
+    @property
+    def game_data(self):
+        return json.loads(zlib.decompress(self.state))
+
+    def __str__(self):
+        return f"{self.user.username} - Score: {self.score} (archived)"
+
+
+class UserStats(models.Model):
+    """
+    Running aggregates over a player's finished games (see game/stats.py).
+
+    Every column is a sum, a counter or a last-seen value, so a finished
+    game updates the row in O(1) with a single upsert. ``bucket_i`` counts
+    scores in ``[BUCKET_EDGES[i], BUCKET_EDGES[i + 1])``, the last bucket is
+    open-ended. The streak counts consecutive calendar days with a game.
+    """
+    BUCKET_EDGES = (0, 50, 100, 200, 300, 500, 750, 1000)
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    games_played = models.IntegerField(default=0)
+    total_score = models.BigIntegerField(default=0)
+    total_score_squares = models.BigIntegerField(default=0)
+    days_played = models.IntegerField(default=0)
+    current_streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    first_played_on = models.DateField(null=True, blank=True)
+    last_played_on = models.DateField(null=True, blank=True)
+    bucket_0 = models.IntegerField(default=0)
+    bucket_1 = models.IntegerField(default=0)
+    bucket_2 = models.IntegerField(default=0)
+    bucket_3 = models.IntegerField(default=0)
+    bucket_4 = models.IntegerField(default=0)
+    bucket_5 = models.IntegerField(default=0)
+    bucket_6 = models.IntegerField(default=0)
+    bucket_7 = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.games_played} games"
+
+    @classmethod
+    def bucket_for(cls, score):
+        return max(bisect_right(cls.BUCKET_EDGES, score) - 1, 0)
+
+    @property
+    def histogram(self):
+        return [getattr(self, f'bucket_{i}') for i in range(len(self.BUCKET_EDGES))]
+
+    def record(self, score, day):
+        """Fold one finished game into the aggregates (mirrors stats.record_game)"""
+        self.games_played += 1
+        self.total_score += score
+        self.total_score_squares += score * score
+        bucket = f'bucket_{self.bucket_for(score)}'
+        setattr(self, bucket, getattr(self, bucket) + 1)
+        if self.last_played_on is not None and day <= self.last_played_on:
+            return
+        if self.last_played_on == day - timedelta(days=1):
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+        self.days_played += 1
+        self.first_played_on = self.first_played_on or day
+        self.last_played_on = day
+
+    def streak_on(self, day):
+        """The current streak as seen on ``day``; 0 once a whole day was missed"""
+        if self.last_played_on is None or self.last_played_on < day - timedelta(days=1):
+            return 0
+        return self.current_streak
+
+
+class ScoreSketch(models.Model):
+    """Persisted quantile sketch (see game/percentiles.py); workers merge into it"""
+    name = models.CharField(max_length=50, primary_key=True)
+    data = models.BinaryField()
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.count} values"
 
 
 class HighScore(models.Model):
@@ -77,11 +239,44 @@ class HighScore(models.Model):
 
     class Meta:
         ordering = ['-score', '-date_achieved']
+        indexes = [
+            # Leaderboard order and keyset pagination on (score, date, id)
+            models.Index(fields=['-score', '-date_achieved', '-id'], name='highscore_rank_idx'),
+        ]
+        constraints = [
+            # One row per user; gameplay.save_high_score upserts against it
+            models.UniqueConstraint(fields=['user'], name='highscore_one_per_user'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.score}"
 
 
+class PeriodBest(models.Model):
+    """Best score per user in one day or week bucket (see leaderboard.windows)"""
+    PERIOD_CHOICES = [('day', 'Day'), ('week', 'Week')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    starts_on = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='period_bests')
+    score = models.IntegerField()
+    date_achieved = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-score', '-date_achieved']
+        indexes = [
+            # Bucket order and keyset pagination, like highscore_rank_idx
+            models.Index(fields=['period', 'starts_on', '-score', '-date_achieved', '-id'], name='periodbest_rank_idx'),
+        ]
+        constraints = [
+            # gameplay.save_period_bests upserts against it
+            models.UniqueConstraint(fields=['period', 'starts_on', 'user'], name='periodbest_one_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.score} ({self.period} of {self.starts_on})"
+
+
 class OnlinePlayer(models.Model):
     """Track currently online players"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='online_status')
@@ -90,6 +285,9 @@ class OnlinePlayer(models.Model):
     
     class Meta:
         ordering = ['user__username']
+        indexes = [
+            models.Index(fields=['last_ping'], name='onlineplayer_last_ping_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - Online"
@@ -102,10 +300,12 @@ class OnlinePlayer(models.Model):
 
     @classmethod
     def get_online_count(cls):
-        cls.cleanup_offline_players()
-        return cls.objects.count()
+        """Count from the last presence snapshot; live data is in game.presence"""
+        cutoff_time = timezone.now() - timedelta(minutes=2)
+        return cls.objects.filter(last_ping__gte=cutoff_time).count()
 
     @classmethod
     def get_online_players(cls):
-        cls.cleanup_offline_players()
-        return cls.objects.select_related('user', 'current_game').all()
+        """Players from the last presence snapshot; live data is in game.presence"""
+        cutoff_time = timezone.now() - timedelta(minutes=2)
+        return cls.objects.filter(last_ping__gte=cutoff_time).select_related('user', 'current_game')
@@ -0,0 +1,186 @@
+"""
+Global score percentiles from a streaming quantile sketch.
+
+``score_distribution`` answers "this score beats X% of all finished games"
+from a ``KLLSketch`` (game/sketch.py) in a few microseconds, instead of a
+``COUNT(*) WHERE score < ?`` per game over.
+
+Each process keeps two sketches: the merged view it answers from and the
+scores it recorded itself since the last save. The first use reads the
+``ScoreSketch`` row and starts a daemon thread; every ``PERSIST_INTERVAL``
+seconds the thread merges the local scores into the row under a row lock,
+and the merged result, which includes every other worker's saves, becomes
+the new view. If there is no row yet, the thread builds one from
+``GameSession`` and the archive, leaving out games ``verify_games`` flagged
+(scores already in the sketch stay until it is rebuilt). Until then
+answers are None. Requests never scan history or wait on the row lock.
+Answers carry the sketch's rank error (``normalized_rank_error``).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .sketch import KLLSketch, normalized_rank_error
+
+DEFAULTS = {
+    'K': 200,
+    'PERSIST_INTERVAL': 30.0,
+}
+
+SKETCH_NAME = 'game_scores'
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name):
+    return getattr(settings, 'SCORE_SKETCH', {}).get(name, DEFAULTS[name])
+
+
+class ScoreDistribution:
+    """Per-process view of the persisted score sketch plus local updates"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._view = None
+        self._pending = None
+        self._read = False
+        self._thread = None
+
+    def reset(self):
+        """Forget everything in memory (tests); the stored sketch is kept"""
+        with self._lock:
+            self._view = None
+            self._pending = None
+            self._read = False
+
+    def record(self, score):
+        with self._lock:
+            if self._pending is None:
+                self._pending = KLLSketch(get_setting('K'))
+            self._pending.update(score)
+            if self._view is not None:
+                self._view.update(score)
+
+    def percentile(self, score):
+        """Share of finished games scoring strictly below ``score``, or None"""
+        self.ensure_loaded()
+        with self._lock:
+            return self._view.rank(score) if self._view is not None else None
+
+    def quantile(self, fraction):
+        self.ensure_loaded()
+        with self._lock:
+            return self._view.quantile(fraction) if self._view is not None else None
+
+    @property
+    def count(self):
+        self.ensure_loaded()
+        view = self._view
+        return view.n if view is not None else 0
+
+    @property
+    def error_bound(self):
+        return normalized_rank_error(get_setting('K'))
+
+    # Database synchronisation
+
+    def ensure_loaded(self):
+        """Read the stored sketch once; saving and bootstrapping are the thread's job"""
+        self._ensure_thread()
+        if not self._read:
+            with self._lock:
+                if not self._read:
+                    self._read = True
+                    self.load()
+
+    def load(self):
+        """Adopt the stored sketch, if there is one yet"""
+        from .models import ScoreSketch
+        row = ScoreSketch.objects.filter(name=SKETCH_NAME).first()
+        if row is not None:
+            self._use(KLLSketch.from_bytes(row.data))
+
+    def persist(self):
+        """
+        Merge local scores into the stored sketch and adopt the result.
+
+        Builds the stored sketch from history first if there is none. Called
+        from the background thread, never from a request.
+        """
+        from .models import ScoreSketch
+        with self._lock:
+            pending, self._pending = self._pending, None
+        try:
+            with transaction.atomic():
+                row = ScoreSketch.objects.select_for_update().filter(name=SKETCH_NAME).first()
+                if row is None:
+                    row = self._bootstrap()
+                    # History already holds every score recorded so far
+                    pending = None
+                stored = KLLSketch.from_bytes(row.data)
+                if pending is not None and pending.n:
+                    stored.merge(pending)
+                    row.data = stored.to_bytes()
+                    row.count = stored.n
+                    row.save()
+        except Exception:
+            # Keep the scores for the next attempt
+            with self._lock:
+                if pending is not None:
+                    if self._pending is None:
+                        self._pending = pending
+                    else:
+                        self._pending.merge(pending)
+            raise
+        self._use(stored)
+
+    def _use(self, stored):
+        """Answer from ``stored`` plus whatever was recorded meanwhile"""
+        with self._lock:
+            if self._pending is not None:
+                stored.merge(self._pending)
+            self._view = stored
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score-sketch', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(get_setting('PERSIST_INTERVAL'))
+            try:
+                self.persist()
+            except Exception:
+                logger.exception('Score sketch persist failed')
+            finally:
+                close_old_connections()
+
+    def _bootstrap(self):
+        """Build and save the sketch from every finished game on record"""
+        from .models import ArchivedGameSession, GameSession, ScoreSketch
+        sketch = KLLSketch(get_setting('K'))
+        finished = {'ended_at__isnull': False}
+        for queryset in (
+            GameSession.objects.filter(is_active=False, **finished).exclude(verified=False),
+            ArchivedGameSession.objects.filter(**finished).exclude(verified=False),
+        ):
+            for score in queryset.values_list('score', flat=True).iterator(chunk_size=10000):
+                sketch.update(score)
+        row = ScoreSketch(name=SKETCH_NAME, data=sketch.to_bytes(), count=sketch.n)
+        try:
+            with transaction.atomic():
+                row.save(force_insert=True)
+        except IntegrityError:
+            # Another worker got there first
+            row = ScoreSketch.objects.get(name=SKETCH_NAME)
+        return row
+
+
+score_distribution = ScoreDistribution()
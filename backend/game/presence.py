@@ -0,0 +1,202 @@
+"""
+Memory-resident presence tracking.
+
+Pings land in a timing wheel: one bucket per wall-clock second holding the
+users whose latest ping fell in that second. A ping moves the user between
+two sets (O(1), no database write) and expiry pops whole buckets older than
+``TTL`` seconds, so the cost is proportional to the users actually expiring.
+
+Expiry runs incrementally on every read and from a daemon thread, which also
+writes a bulk snapshot to ``OnlinePlayer`` every ``SNAPSHOT_INTERVAL``
+seconds for the admin. The snapshot only upserts present users and deletes
+stale rows, so several workers can share the table.
+
+State is per process; run presence-sensitive endpoints on one worker or
+with sticky routing for an exact online list.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Matches the old OnlinePlayer cleanup cutoff of two minutes
+    'TTL': 120,
+    'SNAPSHOT_INTERVAL': 30.0,
+}
+
+_UNCHANGED = object()
+
+
+def get_setting(name):
+    return getattr(settings, 'PRESENCE', {}).get(name, DEFAULTS[name])
+
+
+class PresenceTracker:
+    """Who pinged in the last ``TTL`` seconds, and which game they are in"""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # user_id -> [last_ping (epoch seconds), current_game_id]
+        self._users = {}
+        # second -> set of user ids whose latest ping fell in it
+        self._buckets = {}
+        self._cursor = None
+        self._thread = None
+        self._last_snapshot = time.monotonic()
+        self.version = 0
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else get_setting('TTL')
+
+    def ping(self, user_id, current_game_id=_UNCHANGED, now=None):
+        now = time.time() if now is None else now
+        second = int(now)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = [now, None]
+                self.version += 1
+            else:
+                old = int(entry[0])
+                if old != second:
+                    bucket = self._buckets.get(old)
+                    if bucket is not None:
+                        bucket.discard(user_id)
+                entry[0] = now
+            if current_game_id is not _UNCHANGED and entry[1] != current_game_id:
+                entry[1] = current_game_id
+                self.version += 1
+            self._buckets.setdefault(second, set()).add(user_id)
+            if self._cursor is None or second < self._cursor:
+                self._cursor = second
+        self._ensure_thread()
+
+    def set_game(self, user_id, game_id):
+        """Record the player's current game; also counts as a ping"""
+        self.ping(user_id, game_id)
+
+    def current_game(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            return entry[1] if entry is not None else None
+
+    def remove(self, user_id):
+        with self._lock:
+            entry = self._users.pop(user_id, None)
+            if entry is not None:
+                bucket = self._buckets.get(int(entry[0]))
+                if bucket is not None:
+                    bucket.discard(user_id)
+                self.version += 1
+
+    def expire(self, now=None):
+        """Drop users whose last ping is older than ``TTL``; returns how many"""
+        now = time.time() if now is None else now
+        threshold = int(now) - self.ttl
+        expired = 0
+        with self._lock:
+            if self._cursor is None or self._cursor >= threshold:
+                return 0
+            # Walk second by second normally; after a long idle gap, jump
+            if threshold - self._cursor <= 2 * len(self._buckets) + 8:
+                seconds = range(self._cursor, threshold)
+            else:
+                seconds = sorted(second for second in self._buckets if second < threshold)
+            for second in seconds:
+                for user_id in self._buckets.pop(second, ()):
+                    del self._users[user_id]
+                    expired += 1
+            self._cursor = threshold
+            if expired:
+                self.version += 1
+        return expired
+
+    def online(self):
+        """``(user_id, last_ping datetime, current_game_id)`` for everyone online"""
+        self.expire()
+        with self._lock:
+            return [
+                (user_id, datetime.fromtimestamp(last, dt_timezone.utc), game_id)
+                for user_id, (last, game_id) in self._users.items()
+            ]
+
+    def count(self):
+        self.expire()
+        with self._lock:
+            return len(self._users)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._buckets.clear()
+            self._cursor = None
+            self.version += 1
+
+    def snapshot(self):
+        """
+        Upsert present users into ``OnlinePlayer`` and delete expired rows.
+
+        Users and games deleted (or archived) since their last ping would
+        fail the whole upsert on a foreign key, so they are filtered out
+        first: a gone user is forgotten, a gone game becomes no game.
+        """
+        from .models import GameSession, OnlinePlayer, User
+        online = self.online()
+        cutoff = datetime.now(dt_timezone.utc) - timedelta(seconds=self.ttl)
+        OnlinePlayer.objects.filter(last_ping__lt=cutoff).delete()
+        if online:
+            users = set(User.objects.filter(id__in=[user_id for user_id, _, _ in online]).values_list('id', flat=True))
+            game_ids = [game_id for _, _, game_id in online if game_id]
+            games = set(GameSession.objects.filter(id__in=game_ids).values_list('id', flat=True)) if game_ids else set()
+            for user_id, _, _ in online:
+                if user_id not in users:
+                    self.remove(user_id)
+            online = [
+                (user_id, last_ping, game_id if game_id in games else None)
+                for user_id, last_ping, game_id in online
+                if user_id in users
+            ]
+        if online:
+            OnlinePlayer.objects.bulk_create(
+                [
+                    OnlinePlayer(user_id=user_id, last_ping=last_ping, current_game_id=game_id)
+                    for user_id, last_ping, game_id in online
+                ],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['last_ping', 'current_game'],
+                batch_size=500,
+            )
+        self._last_snapshot = time.monotonic()
+        return len(online)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='presence-expiry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(1)
+            try:
+                self.expire()
+                if time.monotonic() - self._last_snapshot >= get_setting('SNAPSHOT_INTERVAL'):
+                    self.snapshot()
+            except Exception:
+                logger.exception('Presence maintenance failed')
+            finally:
+                close_old_connections()
+
+
+presence = PresenceTracker()
@@ -0,0 +1,104 @@
+"""
+Faster JSON rendering and streamed JSON arrays.
+
+``FastJSONRenderer`` is a drop-in ``JSONRenderer`` that encodes with orjson
+when ``JSON_RENDERING['BACKEND']`` is ``'orjson'`` and the package is
+installed. Datetimes are written natively (``OPT_UTC_Z`` gives DRF's ``Z``
+for UTC); everything else orjson doesn't know (lazy strings, Decimal,
+querysets...) goes through DRF's ``JSONEncoder.default``, so the bytes
+match the stock renderer's compact output. Pretty-printing, ASCII-only or
+non-compact settings, and anything orjson refuses (integers over 64 bits,
+non-string keys) use the stock renderer. One difference remains: NaN and
+infinity render as ``null`` instead of raising.
+
+A DRF ``Response`` always holds its whole body in memory.
+``StreamingJSONResponse`` writes a JSON array from an iterable of rows
+instead, one chunk of ``STREAM_CHUNK_SIZE`` rows at a time, with an
+optional per-chunk ``transform`` (e.g. a compiled serializer). Fed from
+``QuerySet.iterator()``, peak memory is one chunk however many rows there
+are, and ``GZipMiddleware`` compresses the stream as it goes.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULTS = {
+    'BACKEND': 'orjson',
+    'STREAM_CHUNK_SIZE': 500,
+}
+
+_default = JSONEncoder().default
+
+
+def get_setting(name):
+    return getattr(settings, 'JSON_RENDERING', {}).get(name, DEFAULTS[name])
+
+
+def _use_orjson():
+    return orjson is not None and get_setting('BACKEND') == 'orjson'
+
+
+def _escape(data):
+    # Same as JSONRenderer: keep the output a strict JavaScript subset
+    if b'\xe2\x80\xa8' in data or b'\xe2\x80\xa9' in data:
+        data = data.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return data
+
+
+def dumps(data):
+    """Compact JSON bytes for ``data``, as ``FastJSONRenderer`` writes them"""
+    if _use_orjson():
+        try:
+            return _escape(orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z))
+        except orjson.JSONEncodeError:
+            pass
+    return JSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` backed by orjson where the output is the same"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact or not _use_orjson():
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def stream_json(rows, transform=None, chunk_size=None):
+    """Yield a JSON array of ``rows`` as bytes, ``chunk_size`` rows at a time"""
+    chunk_size = chunk_size or get_setting('STREAM_CHUNK_SIZE')
+    chunk = []
+    first = True
+    yield b'['
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield _encode_chunk(chunk, transform, first)
+            first = False
+            chunk = []
+    if chunk:
+        yield _encode_chunk(chunk, transform, first)
+    yield b']'
+
+
+def _encode_chunk(rows, transform, first):
+    # An encoded list minus its brackets is the comma-joined rows
+    body = dumps(transform(rows) if transform is not None else rows)[1:-1]
+    return body if first else b',' + body
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """A JSON array streamed from ``rows``; see ``stream_json``"""
+
+    def __init__(self, rows, transform=None, chunk_size=None, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(stream_json(rows, transform, chunk_size), **kwargs)
@@ -0,0 +1,218 @@
+"""
+Compact binary replays of finished games.
+
+A replay is the game's input log plus every food placement, enough to
+rebuild any frame with the engine. Layout (all integers are LEB128
+varints unless noted):
+
+* header: ``b'SNKR'``, version byte, width byte, height byte, ``seed + 1``
+  (0 when the seed is unknown);
+* records: ``(tick_delta << 3) | code`` where ``tick_delta`` is relative to
+  the previous record and ``code`` is a direction 0-3 (a turn applied on
+  the step producing that tick), ``FOOD`` followed by ``cell + 1`` (0 for
+  no food), or ``END`` marking the final tick.
+
+A turn usually costs one byte and a food placement two or three, so a
+long game fits in a few hundred bytes. While a game is running, each save
+appends the bytes recorded since the previous one as a ``ReplaySegment``
+row (``ReplayRecorder.take``), and ``game_data['replay']`` only holds the
+log's length and last tick. ``finish_game`` joins the segments into
+``GameSession.replay``.
+
+``Replay`` parses through a ``memoryview``, so bytes from the database, a
+file read or an ``mmap`` are decoded without copying. Because food is a
+function of the game's seed, ``Replay.verify`` can also check that no
+placement in the log was tampered with.
+"""
+import base64
+
+from .engine import INITIAL_SNAKE, InvalidState, SnakeGame
+
+MAGIC = b'SNKR'
+VERSION = 1
+FOOD = 4
+END = 5
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(view, offset):
+    """Decode one varint at ``offset``; returns ``(value, next_offset)``"""
+    value = shift = 0
+    while True:
+        try:
+            byte = view[offset]
+        except IndexError:
+            raise InvalidState('Truncated replay')
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def parse_header(view):
+    """``(width, height, seed, body_offset)`` of an encoded replay"""
+    if len(view) < 8 or bytes(view[:4]) != MAGIC:
+        raise InvalidState('Not a replay')
+    if view[4] != VERSION:
+        raise InvalidState(f'Unsupported replay version {view[4]}')
+    seed, offset = read_varint(view, 7)
+    return view[5], view[6], seed - 1 if seed else None, offset
+
+
+class ReplayRecorder:
+    """Appends turns and food placements for a game in progress"""
+    __slots__ = ('data', 'last_tick', 'offset')
+
+    def __init__(self, data=b'', last_tick=0, offset=0):
+        self.data = bytearray(data)
+        self.last_tick = last_tick
+        # Bytes of the log already handed off by take(); ``data`` follows them
+        self.offset = offset
+
+    @classmethod
+    def start(cls, game, seed=None):
+        """Attach a recorder to a freshly created game and log its first food"""
+        recorder = cls()
+        recorder.data += MAGIC
+        recorder.data += bytes((VERSION, game.width, game.height))
+        write_varint(recorder.data, 0 if seed is None else seed + 1)
+        recorder.food(game.tick, game.food)
+        game.recorder = recorder
+        return recorder
+
+    def _record(self, tick, code):
+        write_varint(self.data, (tick - self.last_tick) << 3 | code)
+        self.last_tick = tick
+
+    def turn(self, tick, direction):
+        self._record(tick, direction)
+
+    def food(self, tick, cell):
+        self._record(tick, FOOD)
+        write_varint(self.data, cell + 1)
+
+    def take(self):
+        """``(offset, bytes)`` recorded since the last take, for the caller to store"""
+        segment = (self.offset, bytes(self.data))
+        self.offset += len(self.data)
+        self.data = bytearray()
+        return segment
+
+    def finish(self, tick):
+        """The log from ``offset`` on, closed at ``tick``; the whole replay if nothing was taken"""
+        self._record(tick, END)
+        return bytes(self.data)
+
+    def to_state(self):
+        return {'offset': self.offset + len(self.data), 'tick': self.last_tick}
+
+    @classmethod
+    def from_state(cls, state):
+        """Resume a log at the end of what ``to_state`` saw; its bytes are in the segments"""
+        try:
+            if 'data' in state:
+                # Sessions started before segments carry the log inline
+                return cls(base64.b64decode(state['data']), int(state['tick']))
+            return cls(b'', int(state['tick']), int(state['offset']))
+        except (KeyError, TypeError, ValueError):
+            raise InvalidState('Invalid replay log')
+
+
+class ReplayGame(SnakeGame):
+    """
+    Engine whose food comes from the recorded placements.
+
+    With ``check`` set, each placement is also compared with what the seeded
+    generator would have chosen; disagreements are counted in ``mismatches``.
+    """
+    __slots__ = ('foods', 'check', 'mismatches')
+
+    def spawn_food(self):
+        recorded = next(self.foods, -1)
+        if self.check:
+            SnakeGame.spawn_food(self)
+            if self.food != recorded:
+                self.mismatches += 1
+        self.food = recorded
+
+
+class Replay:
+    """Read-only view over one encoded replay"""
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.width, self.height, self.seed, self._body = parse_header(self.view)
+        self.final_tick = None
+        self.turns = 0
+        for tick, code, _ in self.records():
+            if code == END:
+                self.final_tick = tick
+            elif code < FOOD:
+                self.turns += 1
+        if self.final_tick is None:
+            raise InvalidState('Replay has no end record')
+
+    def __len__(self):
+        return len(self.view)
+
+    def records(self):
+        """Yield ``(tick, code, cell)``; ``cell`` is only set for food"""
+        view, offset, tick = self.view, self._body, 0
+        end = len(view)
+        while offset < end:
+            value, offset = read_varint(view, offset)
+            tick += value >> 3
+            code = value & 7
+            cell = None
+            if code == FOOD:
+                cell, offset = read_varint(view, offset)
+                cell -= 1
+            yield tick, code, cell
+            if code == END:
+                return
+
+    def frames(self):
+        """Yield the game after every tick, starting with tick 0"""
+        turns = {}
+        foods = []
+        for tick, code, cell in self.records():
+            if code == FOOD:
+                foods.append(cell)
+            elif code < FOOD:
+                turns[tick] = code
+        game = ReplayGame(self.width, self.height, self.seed)
+        game.foods = iter(foods)
+        game.check = self.seed is not None
+        game.mismatches = 0
+        for x, y in reversed(INITIAL_SNAKE):
+            game.snake.push_head(y * self.width + x)
+        game.spawn_food()
+        yield game
+        while game.tick < self.final_tick and not game.game_over:
+            game.step(turns.get(game.tick + 1))
+            yield game
+
+    def verify(self):
+        """
+        Re-run the game and check every food placement against the seed.
+
+        Returns ``(consistent, final_game)``; ``consistent`` is None for
+        replays recorded without a seed.
+        """
+        for game in self.frames():
+            pass
+        return (game.mismatches == 0 if game.check else None), game
+
+    def frame(self, tick):
+        """The game as it stood at ``tick`` (clamped to the final tick)"""
+        for game in self.frames():
+            if game.tick >= tick:
+                return game
+        return game
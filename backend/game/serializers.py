@@ -1,7 +1,25 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from .models import User, GameSession, HighScore, OnlinePlayer
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from .models import User, UserStats, GameSession, ArchivedGameSession, HighScore, OnlinePlayer
+from .engine import DIRECTIONS, DIRECTION_INDEX
+
+
+def photo_url(context, name):
+    """URL of a stored profile photo, absolute when the context has a request"""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    request = context.get('request')
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def join_date(context, date_joined):
+    return date_joined.strftime('%B %Y') if date_joined else None
 
 
 class SparseFieldsMixin:
@@ -93,17 +111,76 @@ class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
         extra_kwargs = {
             'email': {'write_only': True}  # Don't expose email to other users
         }
+
+    # Model columns each output field reads, for only()/values() projection
+    field_columns = {
+        'join_date_formatted': ['date_joined'],
+        'profile_photo_url': ['profile_photo'],
+    }
+    # Method fields from a values() row: (column, function(context, value)), see game/fastserializers.py
+    row_methods = {
+        'join_date_formatted': ('date_joined', join_date),
+        'profile_photo_url': ('profile_photo', photo_url),
+    }
+
+    @classmethod
+    def readable_fields(cls):
+        write_only = {name for name, kwargs in cls.Meta.extra_kwargs.items() if kwargs.get('write_only')}
+        return [name for name in cls.Meta.fields if name not in write_only]
+
+    @classmethod
+    def columns_for(cls, fields):
+        """Model columns needed to render ``fields``"""
+        columns = ['id']
+        for name in fields:
+            for column in cls.field_columns.get(name, [name]):
+                if column not in columns:
+                    columns.append(column)
+        return columns
     
     def get_profile_photo_url(self, obj):
-        if obj.profile_photo:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.profile_photo.url)
-            return obj.profile_photo.url
-        return None
-    
+        return photo_url(self.context, obj.profile_photo.name)
+
     def get_join_date_formatted(self, obj):
-        return obj.date_joined.strftime('%B %Y') if obj.date_joined else None
+        return join_date(self.context, obj.date_joined)
+
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    """Derived figures from the running ``UserStats`` aggregates"""
+    average_score = serializers.SerializerMethodField()
+    score_stddev = serializers.SerializerMethodField()
+    games_per_active_day = serializers.SerializerMethodField()
+    current_streak = serializers.SerializerMethodField()
+    histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'games_played', 'average_score', 'score_stddev', 'histogram', 'days_played',
+            'games_per_active_day', 'current_streak', 'longest_streak', 'first_played_on', 'last_played_on'
+        ]
+
+    def get_average_score(self, obj):
+        return round(obj.total_score / obj.games_played, 1) if obj.games_played else None
+
+    def get_score_stddev(self, obj):
+        if not obj.games_played:
+            return None
+        mean = obj.total_score / obj.games_played
+        return round(max(obj.total_score_squares / obj.games_played - mean * mean, 0) ** 0.5, 1)
+
+    def get_games_per_active_day(self, obj):
+        return round(obj.games_played / obj.days_played, 2) if obj.days_played else None
+
+    def get_current_streak(self, obj):
+        return obj.streak_on(timezone.localdate())
+
+    def get_histogram(self, obj):
+        edges = obj.BUCKET_EDGES
+        return [
+            {'min': low, 'max': edges[i + 1] - 1 if i + 1 < len(edges) else None, 'count': count}
+            for i, (low, count) in enumerate(zip(edges, obj.histogram))
+        ]
 
 
 class OnlinePlayerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
@@ -134,6 +211,17 @@ class GameSessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
         fields = ['id', 'username', 'score', 'game_data', 'created_at', 'updated_at', 'is_active']
 
 
+class ArchivedGameSessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Archived sessions in the same shape as ``GameSessionSerializer``"""
+    username = serializers.CharField(source='user.username', read_only=True)
+    updated_at = serializers.DateTimeField(source='ended_at', read_only=True)
+
+    class Meta:
+        model = ArchivedGameSession
+        fields = GameSessionSerializer.Meta.fields
+        read_only_fields = fields
+
+
 class HighScoreSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     profile_photo_url = serializers.SerializerMethodField()
@@ -142,14 +230,13 @@ class HighScoreSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = HighScore
         fields = ['id', 'user_id', 'username', 'score', 'date_achieved', 'profile_photo_url']
-    
+
+    row_methods = {
+        'profile_photo_url': ('user__profile_photo', photo_url),
+    }
+
     def get_profile_photo_url(self, obj):
-        if obj.user.profile_photo:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.user.profile_photo.url)
-            return obj.user.profile_photo.url
-        return None
+        return photo_url(self.context, obj.user.profile_photo.name)
 
 
 class GameStateSerializer(serializers.Serializer):
@@ -169,6 +256,7 @@ class GameStateSerializer(serializers.Serializer):
     direction = serializers.ChoiceField(choices=['up', 'down', 'left', 'right'])
     score = serializers.IntegerField(min_value=0)
     game_over = serializers.BooleanField()
+    # No seed: food follows the one the server stored at start_game
 
     def validate_snake(self, value):
         """Validate that snake segments are valid"""
@@ -187,3 +275,45 @@ class GameStateSerializer(serializers.Serializer):
 class UpdateGameSerializer(serializers.Serializer):
     game_data = GameStateSerializer()
     score = serializers.IntegerField()
+
+
+class InputEventsSerializer(serializers.Serializer):
+    """
+    Compact update: only the inputs since the last acknowledged sequence.
+
+    ``seq`` is the sequence number of the first event in ``events``; each
+    event is ``[tick, direction]`` with direction as a name or 0-3 index.
+    ``tick`` is the client's current tick, which the server advances to.
+    """
+    seq = serializers.IntegerField(min_value=1)
+    events = serializers.ListField(
+        child=serializers.ListField(min_length=2, max_length=2),
+        max_length=500
+    )
+    tick = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_events(self, value):
+        events = []
+        for tick, direction in value:
+            if isinstance(direction, str):
+                if direction not in DIRECTION_INDEX:
+                    raise serializers.ValidationError(f"Unknown direction '{direction}'.")
+                direction = DIRECTION_INDEX[direction]
+            if not isinstance(tick, int) or tick < 0:
+                raise serializers.ValidationError("Event tick must be a non-negative integer.")
+            if not isinstance(direction, int) or not 0 <= direction < len(DIRECTIONS):
+                raise serializers.ValidationError("Event direction must be 0-3.")
+            events.append((tick, direction))
+        return events
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    """Leaderboard rows served from the in-process index (plain dicts)"""
+    rank = serializers.IntegerField()
+    user_id = serializers.IntegerField()
+    username = serializers.CharField()
+    score = serializers.IntegerField()
+    profile_photo_url = serializers.SerializerMethodField()
+
+    def get_profile_photo_url(self, obj):
+        return photo_url(self.context, obj['profile_photo'])
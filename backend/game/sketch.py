@@ -0,0 +1,136 @@
+"""
+KLL quantile sketch.
+
+A stack of compactors: level ``h`` holds items that each stand for ``2**h``
+inputs. When a level outgrows its capacity it is sorted and every other item
+(random offset) moves up a level, halving its size and doubling the weight.
+Capacities shrink geometrically (factor 2/3) from the top level down to a
+minimum of 2, so the sketch keeps about ``3k`` items however many values it
+has seen.
+
+Rank queries have a normalized error of roughly ``normalized_rank_error(k)``
+with 99% confidence (1.3% at the default ``k=200``); the constants are the
+ones published for Apache DataSketches' KLL, and ``bench_percentiles``
+measures the actual error against exact counts. Sketches with the same ``k``
+merge by concatenating levels and compacting, which is how workers combine
+their local updates into the persisted copy.
+"""
+from bisect import bisect_left, bisect_right
+import math
+import random
+import struct
+
+_MAGIC = b'KLL1'
+_HEADER = struct.Struct('<4sHQB')
+_CAPACITY_DECAY = 2 / 3
+
+
+def normalized_rank_error(k):
+    """Rank error (fraction of n) at 99% confidence for a sketch of size ``k``"""
+    return 2.296 / k ** 0.9723
+
+
+class KLLSketch:
+    """Mergeable streaming quantiles over numbers"""
+
+    def __init__(self, k=200, seed=None):
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._rng = random.Random(seed)
+        # (sorted values, cumulative weights) for rank queries; None when stale
+        self._cdf = None
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(math.ceil(self.k * _CAPACITY_DECAY ** depth), 2)
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.n += 1
+        self._cdf = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compact()
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError('Only sketches with the same k can be merged')
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self._cdf = None
+        self._compact()
+
+    def _compact(self):
+        """Halve every level that is over capacity, lowest first"""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # An odd item out stays behind so total weight is exact
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[level + 1].extend(items[self._rng.getrandbits(1)::2])
+                self.levels[level] = keep
+            level += 1
+
+    def _table(self):
+        if self._cdf is None:
+            weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+            values = [value for value, _ in weighted]
+            cumulative = [0]
+            for _, weight in weighted:
+                cumulative.append(cumulative[-1] + weight)
+            self._cdf = (values, cumulative)
+        return self._cdf
+
+    def rank(self, value, inclusive=False):
+        """Estimated fraction of inputs below ``value`` (or at most, if ``inclusive``)"""
+        if not self.n:
+            return None
+        values, cumulative = self._table()
+        position = (bisect_right if inclusive else bisect_left)(values, value)
+        return cumulative[position] / cumulative[-1]
+
+    def quantile(self, fraction):
+        """Estimated value at ``fraction`` (0-1) of the inputs"""
+        if not self.n:
+            return None
+        values, cumulative = self._table()
+        target = min(max(fraction, 0.0), 1.0) * cumulative[-1]
+        return values[min(bisect_left(cumulative, target, 1) - 1, len(values) - 1)]
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(_MAGIC, self.k, self.n, len(self.levels))]
+        for items in self.levels:
+            parts.append(struct.pack(f'<I{len(items)}d', len(items), *items))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, seed=None):
+        data = bytes(data)
+        try:
+            magic, k, n, levels = _HEADER.unpack_from(data)
+            if magic != _MAGIC:
+                raise ValueError
+            sketch = cls(k, seed)
+            sketch.n = n
+            sketch.levels = []
+            offset = _HEADER.size
+            for _ in range(levels):
+                (size,) = struct.unpack_from('<I', data, offset)
+                offset += 4
+                sketch.levels.append(list(struct.unpack_from(f'<{size}d', data, offset)))
+                offset += 8 * size
+        except (struct.error, ValueError):
+            raise ValueError('Not a KLL sketch')
+        return sketch
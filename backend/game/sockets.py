@@ -0,0 +1,151 @@
+"""
+WebSocket game channel served straight from the ASGI entry point.
+
+A client connects once per game session to ``/ws/games/<id>/?token=<key>``.
+The token is checked on connect only; afterwards each text frame is an
+input batch in the same format as the compact ``update_game`` payload
+(``{"seq": ..., "events": [[tick, direction], ...], "tick": ...}``) and is
+answered with the same ack. The engine lives in the connection, so moves
+cost no database work; state is handed to the write-behind session buffer
+at most once per ``GAME_SOCKET_PERSIST_INTERVAL`` seconds and on
+disconnect, and finalized immediately on game over.
+"""
+import json
+import logging
+import re
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .buffers import session_buffer
+from .engine import InvalidState
+from .gameplay import InputGap, apply_input_events, snapshot, ack_payload, save_game, load_game
+from .models import GameSession
+from .serializers import InputEventsSerializer
+
+logger = logging.getLogger(__name__)
+
+PATH_RE = re.compile(r'^/ws/games/(?P<game_id>\d+)/?$')
+
+# Application close codes (4000-4999 are reserved for applications)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+
+def _authenticate(key):
+    from rest_framework.authtoken.models import Token
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def _load_session(user, game_id):
+    try:
+        game_session = GameSession.objects.defer('replay').get(id=game_id, user=user, is_active=True)
+    except GameSession.DoesNotExist:
+        return None
+    game_session.user = user
+    # As on the HTTP path: newer state may still be in the write-behind buffer
+    return session_buffer.overlay(game_session)
+
+
+def _persist(game_session, game, acked):
+    save_game(game_session.user, game_session, game, snapshot(game, acked))
+
+
+class GameConnection:
+    """State for one open socket: the engine plus persistence bookkeeping"""
+
+    def __init__(self, game_session, game):
+        self.game_session = game_session
+        self.game = game
+        self.acked = game_session.game_data.get('seq', 0)
+        self.dirty = False
+        self.persisted_at = time.monotonic()
+
+    def handle(self, text):
+        """Apply one frame and return the reply dict"""
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return {'error': 'Invalid JSON'}
+        serializer = InputEventsSerializer(data=data)
+        if not serializer.is_valid():
+            return {'error': serializer.errors}
+        try:
+            self.acked = apply_input_events(
+                self.game,
+                self.acked,
+                serializer.validated_data['seq'],
+                serializer.validated_data['events'],
+                serializer.validated_data.get('tick')
+            )
+        except InputGap as e:
+            return {'error': 'Missing input events', 'seq': e.acked}
+        except InvalidState as e:
+            return {'error': str(e)}
+        self.dirty = True
+        return ack_payload(self.game, self.acked)
+
+    def should_persist(self):
+        interval = getattr(settings, 'GAME_SOCKET_PERSIST_INTERVAL', 2.0)
+        return self.dirty and (
+            self.game.game_over or time.monotonic() - self.persisted_at >= interval
+        )
+
+    async def persist(self):
+        if not self.dirty:
+            return
+        await sync_to_async(_persist)(self.game_session, self.game, self.acked)
+        self.dirty = False
+        self.persisted_at = time.monotonic()
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI application for ``/ws/games/<id>/``"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = PATH_RE.match(scope['path'])
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    key = (query.get('token') or [None])[0]
+    user = await sync_to_async(_authenticate)(key) if key and match else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    game_session = await sync_to_async(_load_session)(user, int(match.group('game_id')))
+    if game_session is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    try:
+        game = load_game(game_session.game_data)
+    except InvalidState:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    connection = GameConnection(game_session, game)
+    await send({'type': 'websocket.accept'})
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] != 'websocket.receive':
+                continue
+            reply = connection.handle(message.get('text') or '')
+            if connection.should_persist():
+                await connection.persist()
+            await send({'type': 'websocket.send', 'text': json.dumps(reply)})
+            if game.game_over:
+                await send({'type': 'websocket.close', 'code': 1000})
+                break
+    finally:
+        try:
+            await connection.persist()
+        except Exception:
+            logger.exception('Failed to persist game %s on disconnect', game_session.id)
@@ -0,0 +1,79 @@
+"""
+Incrementally maintained per-user statistics.
+
+``record_game`` folds a finished game into the player's ``UserStats`` row
+with one ``INSERT ... ON CONFLICT DO UPDATE``: counters and sums are added
+to, the score's histogram bucket is incremented and the day streak is
+advanced with a ``CASE`` on the last day played. It runs inside
+``finish_game``'s transaction, so stats and ``total_games_played`` cannot
+drift apart, and costs the same however long the player's history is.
+
+``rebuild`` recomputes every row from ``GameSession`` and the archive with
+``UserStats.record``, a chunk of users per transaction. Use it to backfill
+after deploying, or to repair rows; a game that finishes while its chunk is
+being rebuilt can be missed, so run it when traffic is low.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedGameSession, GameSession, User, UserStats
+
+
+def record_game(user_id, score, ended_at):
+    """Add one finished game to ``user_id``'s stats with a single upsert"""
+    day = timezone.localdate(ended_at)
+    yesterday = connection.ops.adapt_datefield_value(day - timedelta(days=1))
+    day = connection.ops.adapt_datefield_value(day)
+    table = connection.ops.quote_name(UserStats._meta.db_table)
+    buckets = [f'bucket_{i}' for i in range(len(UserStats.BUCKET_EDGES))]
+    bucket = buckets[UserStats.bucket_for(score)]
+    # A day at or before the stored last day counts as that day (clock skew)
+    same_day = f'{table}.last_played_on >= excluded.last_played_on'
+    next_day = f'{table}.last_played_on = %s'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, games_played, total_score, total_score_squares, days_played, '
+            f'current_streak, longest_streak, first_played_on, last_played_on, {", ".join(buckets)}) '
+            f'VALUES (%s, 1, %s, %s, 1, 1, 1, %s, %s, {", ".join("1" if b == bucket else "0" for b in buckets)}) '
+            f'ON CONFLICT (user_id) DO UPDATE SET '
+            f'games_played = {table}.games_played + 1, '
+            f'total_score = {table}.total_score + excluded.total_score, '
+            f'total_score_squares = {table}.total_score_squares + excluded.total_score_squares, '
+            f'{bucket} = {table}.{bucket} + 1, '
+            f'days_played = {table}.days_played + CASE WHEN {same_day} THEN 0 ELSE 1 END, '
+            f'current_streak = CASE WHEN {same_day} THEN {table}.current_streak '
+            f'WHEN {next_day} THEN {table}.current_streak + 1 ELSE 1 END, '
+            f'longest_streak = CASE WHEN {next_day} AND {table}.current_streak >= {table}.longest_streak '
+            f'THEN {table}.current_streak + 1 ELSE {table}.longest_streak END, '
+            f'last_played_on = CASE WHEN {same_day} THEN {table}.last_played_on ELSE excluded.last_played_on END',
+            [user_id, score, score * score, day, day, yesterday, yesterday],
+        )
+
+
+def rebuild(chunk_size=500):
+    """Recompute every user's stats from game history; returns users written"""
+    written = 0
+    user_ids = User.objects.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        chunk = list(user_ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return written
+        last_id = chunk[-1]
+        with transaction.atomic():
+            # Only finished games: abandoned sessions have no ended_at
+            window = {'user_id__gte': chunk[0], 'user_id__lte': last_id, 'ended_at__isnull': False}
+            columns = ('user_id', 'ended_at', 'score')
+            games = list(GameSession.objects.filter(is_active=False, **window).values_list(*columns))
+            games += ArchivedGameSession.objects.filter(**window).values_list(*columns)
+            games.sort()
+            stats = {}
+            for user_id, ended_at, score in games:
+                if user_id not in stats:
+                    stats[user_id] = UserStats(user_id=user_id)
+                stats[user_id].record(score, timezone.localdate(ended_at))
+            UserStats.objects.filter(user_id__gte=chunk[0], user_id__lte=last_id).delete()
+            UserStats.objects.bulk_create(stats.values())
+        written += len(stats)
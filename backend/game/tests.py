@@ -1,8 +1,54 @@
-from django.test import TestCase
+import asyncio
+import bisect
+import json
+import random
+import threading
+import time
+import uuid
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
-from .models import GameSession, HighScore
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .models import User, UserStats, GameSession, ArchivedGameSession, ReplaySegment, HighScore, PeriodBest, OnlinePlayer, ScoreSketch
+from .engine import SnakeGame, InvalidState, DIRECTION_INDEX, food_hash
+from .sockets import websocket_application
+from .archive import archive_sessions
+from .authentication import token_cache
+from .caching import VersionedCache, high_scores_cache, online_players_cache
+from .buffers import WriteBehindBuffer, session_buffer, activity_buffer
+from .gameplay import finish_game, load_game, new_game, save_high_score, snapshot
+from .leaderboard import SortedBlocks, expire_period_bests, leaderboard, period_start, windows
+from .middleware import QueryInspectorMiddleware, fingerprint
+from .percentiles import score_distribution
+from .presence import PresenceTracker, presence
+from .renderers import FastJSONRenderer, StreamingJSONResponse
+from .replay import Replay, ReplayRecorder
+from .sketch import KLLSketch
+from .fastserializers import compile_serializer
+from .serializers import HighScoreSerializer, LeaderboardEntrySerializer, OnlinePlayerSerializer, UserProfileSerializer
+from .stats import record_game
+from .verifier import verify_batch
+from .views import OnlinePlayersView
+from .management.commands.bench_verifier import play
 
 
 class GameSessionModelTest(TestCase):
@@ -35,3 +81,1230 @@ class GameAPITest(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)
+
+
+class SnakeEngineTest(TestCase):
+    def test_new_game_matches_client_start(self):
+        state = SnakeGame.new(seed=1).to_state()
+        self.assertEqual(state['snake'], [[10, 10], [10, 11], [10, 12]])
+        self.assertEqual(state['direction'], 'up')
+        self.assertEqual(state['score'], 0)
+        self.assertNotIn(state['food'], state['snake'])
+
+    def test_step_moves_and_eats(self):
+        game = SnakeGame.new(seed=1)
+        game.food = 9 * game.width + 10  # directly above the head
+        self.assertTrue(game.step())
+        self.assertEqual(game.score, 10)
+        self.assertEqual(len(game.snake), 4)
+        self.assertEqual(game.to_state()['snake'][0], [10, 9])
+
+    def test_wall_collision_ends_game(self):
+        game = SnakeGame.new(seed=1)
+        game.food = 0
+        self.assertFalse(game.run(20))
+        self.assertTrue(game.game_over)
+        self.assertEqual(game.tick, 11)
+
+    def test_reverse_is_ignored(self):
+        game = SnakeGame.new(seed=1)
+        game.step(DIRECTION_INDEX['down'])
+        self.assertEqual(game.to_state()['direction'], 'up')
+
+    def test_inputs_apply_at_their_ticks_however_batched(self):
+        game = SnakeGame.new(seed=1)
+        game.food = 0
+        # Three events for tick 2 make one step there; the last one counts
+        game.apply_inputs([(2, DIRECTION_INDEX['left']), (2, DIRECTION_INDEX['up']), (2, DIRECTION_INDEX['right'])])
+        self.assertEqual((game.tick, game.to_state()['snake'][0]), (2, [11, 9]))
+        with self.assertRaises(InvalidState):
+            game.apply_inputs([(2, DIRECTION_INDEX['up']), (5, DIRECTION_INDEX['up'])])
+        self.assertEqual(game.tick, 2)
+
+    def test_from_state_derives_score(self):
+        state = {'snake': [[5, 5], [5, 6], [5, 7], [5, 8]], 'food': [0, 0],
+                 'direction': 'up', 'score': 9999, 'game_over': False}
+        self.assertEqual(SnakeGame.from_state(state).score, 10)
+        state['snake'] = [[5, 5], [7, 7]]
+        with self.assertRaises(InvalidState):
+            SnakeGame.from_state(state)
+
+
+class InputEventProtocolTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='player', email='player@example.com', password='pw')
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/games/start_game/', format='json')
+        self.game_id = response.data['game_id']
+        self.url = f'/api/games/{self.game_id}/update_game/'
+
+    def tearDown(self):
+        session_buffer.clear()
+
+    def test_events_advance_server_state(self):
+        response = self.client.post(self.url, {'seq': 1, 'events': [[2, 'left']], 'tick': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['seq'], 1)
+        self.assertEqual(response.data['tick'], 4)
+        self.assertNotIn('snake', response.data)
+        session_buffer.flush()
+        game = SnakeGame.from_state(GameSession.objects.get(id=self.game_id).game_data)
+        self.assertEqual(game.to_state()['snake'][0], [7, 9])
+
+    def test_retransmit_is_idempotent_and_gap_conflicts(self):
+        self.client.post(self.url, {'seq': 1, 'events': [[1, 'left']], 'tick': 1}, format='json')
+        response = self.client.post(self.url, {'seq': 1, 'events': [[1, 'left'], [3, 'up']], 'tick': 3}, format='json')
+        self.assertEqual(response.data['seq'], 2)
+        self.assertEqual(response.data['tick'], 3)
+        response = self.client.post(self.url, {'seq': 5, 'events': [[9, 'left']]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['seq'], 2)
+
+    def test_game_over_finishes_session(self):
+        response = self.client.post(self.url, {'seq': 1, 'events': [], 'tick': 50}, format='json')
+        self.assertTrue(response.data['game_over'])
+        session = GameSession.objects.get(id=self.game_id)
+        self.assertFalse(session.is_active)
+
+
+class PostedStateUpdateTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='legacy', email='legacy@example.com', password='pw')
+        self.client.force_authenticate(self.user)
+        # Seeds the game with food at [13, 5], clear of the moves below
+        random.seed(0)
+        response = self.client.post('/api/games/start_game/', format='json')
+        self.state = response.data['game_state']
+        self.url = f'/api/games/{response.data["game_id"]}/update_game/'
+
+    def tearDown(self):
+        session_buffer.clear()
+
+    def _post(self, **changes):
+        game_data = dict(self.state, **changes)
+        return self.client.post(self.url, {'game_data': game_data, 'score': game_data['score']}, format='json')
+
+    def test_one_step_is_replayed_by_the_engine(self):
+        response = self._post(snake=[[9, 10], [10, 10], [10, 11]], direction='left', score=500, food=[0, 0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['score'], 0)
+        self.assertEqual(response.data['game_state']['snake'], [[9, 10], [10, 10], [10, 11]])
+        self.assertEqual(response.data['game_state']['food'], self.state['food'])
+        self.assertEqual(response.data['game_state']['tick'], 1)
+
+    def test_posted_seed_is_ignored(self):
+        response = self._post(snake=[[10, 9], [10, 10], [10, 11]], seed=self.state['seed'] ^ 1)
+        self.assertEqual(response.data['game_state']['seed'], self.state['seed'])
+        self.assertEqual(response.data['game_state']['food'], self.state['food'])
+
+    def test_fabricated_long_snake_is_rejected(self):
+        snake = [[10, 10 + i] for i in range(10)] + [[11, 19 - i] for i in range(10)]
+        response = self._post(snake=snake, score=370, game_over=True)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['game_state']['snake'], self.state['snake'])
+        self.assertFalse(HighScore.objects.filter(user=self.user).exists())
+
+    def test_head_must_move_from_the_stored_head(self):
+        response = self._post(snake=[[12, 8], [12, 9], [12, 10]])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_out_of_order_posts_catch_up_and_finish(self):
+        first, second = [[10, 9], [10, 10], [10, 11]], [[9, 9], [10, 9], [10, 10]]
+        # The second tick arrives first: both steps are replayed, the turn included
+        response = self._post(snake=second, direction='left')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['game_state']['snake'], response.data['game_state']['tick']), (second, 2))
+        # The late first tick changes nothing
+        response = self._post(snake=first)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['game_state']['snake'], second)
+        response = self._post(snake=second, direction='left', game_over=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        session = GameSession.objects.get(user=self.user)
+        self.assertFalse(session.is_active)
+        self.assertTrue(Replay(bytes(session.replay)).verify()[0])
+        self.assertEqual(HighScore.objects.get(user=self.user).score, 0)
+
+    def test_game_over_report_keeps_the_stored_score(self):
+        self._post(snake=[[10, 9], [10, 10], [10, 11]])
+        response = self._post(snake=[[10, 9], [10, 10], [10, 11]], score=90, game_over=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(HighScore.objects.get(user=self.user).score, 0)
+        self.assertIsNotNone(GameSession.objects.get(user=self.user).replay)
+
+
+class GameSocketTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='socket', email='socket@example.com', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.session = GameSession.objects.create(user=self.user, game_data=SnakeGame.new(seed=0).to_state())
+
+    def tearDown(self):
+        session_buffer.clear()
+
+    def _run(self, path, token, frames):
+        """Connect, send text frames and collect everything the app sends"""
+        async def run():
+            inbox = asyncio.Queue()
+            sent = []
+            scope = {'type': 'websocket', 'path': path, 'query_string': f'token={token}'.encode()}
+            await inbox.put({'type': 'websocket.connect'})
+            for frame in frames:
+                await inbox.put({'type': 'websocket.receive', 'text': json.dumps(frame)})
+            await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+
+            async def send(message):
+                sent.append(message)
+            await websocket_application(scope, inbox.get, send)
+            return sent
+        return async_to_sync(run)()
+
+    def test_bad_token_is_rejected(self):
+        sent = self._run(f'/ws/games/{self.session.id}/', 'nope', [])
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4401}])
+
+    def test_inputs_are_acked_and_persisted_on_disconnect(self):
+        sent = self._run(f'/ws/games/{self.session.id}/', self.token.key, [
+            {'seq': 1, 'events': [[1, 'left']], 'tick': 1},
+            {'seq': 2, 'events': [], 'tick': 2},
+        ])
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        acks = [json.loads(m['text']) for m in sent[1:]]
+        self.assertEqual([a['tick'] for a in acks], [1, 2])
+        self.assertEqual(acks[-1]['seq'], 1)
+        session_buffer.flush()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.game_data['tick'], 2)
+        self.assertEqual(self.session.game_data['head'], [8, 10])
+
+    @override_settings(GAME_WRITE_BEHIND={'FLUSH_INTERVAL': 60})
+    def test_socket_resumes_from_buffered_state(self):
+        game = load_game(self.session.game_data)
+        game.apply_inputs([], 3)
+        self.session.game_data = snapshot(game, 4)
+        session_buffer.save(self.session)
+        sent = self._run(f'/ws/games/{self.session.id}/', self.token.key, [{'seq': 5, 'events': [], 'tick': 4}])
+        self.assertEqual(json.loads(sent[1]['text'])['seq'], 4)
+        self.assertEqual(json.loads(sent[1]['text'])['tick'], 4)
+
+
+class RecordingBuffer(WriteBehindBuffer):
+    def __init__(self):
+        super().__init__('test')
+        self.batches = []
+
+    def write(self, batch):
+        self.batches.append(batch)
+
+
+class WriteBehindBufferTest(TestCase):
+    def test_subclasses_must_write(self):
+        with self.assertRaises(TypeError):
+            WriteBehindBuffer('abstract')
+
+    @override_settings(GAME_WRITE_BEHIND={'FLUSH_INTERVAL': 60, 'MAX_PENDING': 2})
+    def test_updates_coalesce_per_key_and_flush_on_size(self):
+        buffer = RecordingBuffer()
+        for score in range(5):
+            buffer.put(1, score)
+        self.assertEqual(buffer.batches, [])
+        buffer.put(2, 'x')
+        self.assertEqual(buffer.batches, [{1: 4, 2: 'x'}])
+        stats = buffer.stats()
+        self.assertEqual(stats['flushes'], 1)
+        self.assertEqual(stats['coalescing_ratio'], 3.0)
+
+    # A long interval keeps the save below from flushing on its own
+    @override_settings(GAME_WRITE_BEHIND={'FLUSH_INTERVAL': 60})
+    def test_session_state_is_overlaid_until_flushed(self):
+        user = User.objects.create_user(username='buffered', email='buffered@example.com')
+        game_session = GameSession.objects.create(user=user, game_data={'tick': 0})
+        game_session.game_data = {'tick': 9}
+        game_session.score = 30
+        session_buffer.save(game_session)
+        fresh = GameSession.objects.get(id=game_session.id)
+        self.assertEqual(fresh.score, 0)
+        self.assertEqual(session_buffer.overlay(fresh).score, 30)
+        session_buffer.flush()
+        fresh.refresh_from_db()
+        self.assertEqual((fresh.score, fresh.game_data), (30, {'tick': 9}))
+
+    @override_settings(GAME_WRITE_BEHIND={'FLUSH_INTERVAL': 60})
+    def test_batch_stays_readable_while_it_is_written(self):
+        seen = []
+
+        class SlowBuffer(WriteBehindBuffer):
+            def write(self, batch):
+                seen.append(self.get(1))
+
+        buffer = SlowBuffer('slow')
+        buffer.put(1, 'latest')
+        buffer.flush()
+        self.assertEqual(seen, ['latest'])
+        self.assertIsNone(buffer.get(1))
+
+    @override_settings(GAME_WRITE_BEHIND={'FLUSH_INTERVAL': 60})
+    def test_replay_segments_accumulate_across_coalesced_saves(self):
+        user = User.objects.create_user(username='segments', email='segments@example.com')
+        game_session = GameSession.objects.create(user=user)
+        for offset, data in ((0, b'ab'), (2, b'cd'), (4, b'e')):
+            game_session.game_data = {'tick': offset}
+            session_buffer.save(game_session, (offset, data))
+        session_buffer.flush()
+        self.assertEqual(
+            list(ReplaySegment.objects.filter(session=game_session).values_list('offset', 'data')),
+            [(0, b'abcde')],
+        )
+
+
+class SortedBlocksTest(TestCase):
+    def test_matches_sorted_list_across_block_splits(self):
+        rng = random.Random(7)
+        blocks = SortedBlocks()
+        expected = []
+        for _ in range(5000):
+            key = rng.randrange(100000)
+            blocks.add(key)
+            bisect.insort(expected, key)
+        for key in expected[::7]:
+            blocks.remove(key)
+            expected.remove(key)
+        self.assertEqual(list(blocks), expected)
+        for i in range(0, len(expected), 97):
+            self.assertEqual(blocks[i], expected[i])
+            self.assertEqual(blocks.index(expected[i]), bisect.bisect_left(expected, expected[i]))
+        self.assertEqual(list(blocks.islice(1990, 2030)), expected[1990:2030])
+
+
+class LeaderboardTest(APITestCase):
+    def setUp(self):
+        leaderboard.rebuild()
+        self.users = [
+            User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com') for i in range(3)
+        ]
+        self.client.force_authenticate(self.users[0])
+
+    def test_index_rebuilds_in_bulk_and_ranks(self):
+        for user, score in zip(self.users, [50, 200, 120]):
+            HighScore.objects.create(user=user, score=score)
+        leaderboard.rebuild()
+        response = self.client.get('/api/games/high_scores/')
+        self.assertEqual([row['username'] for row in response.data], ['p1', 'p2', 'p0'])
+        self.assertEqual(response.data[0], {'rank': 1, 'user_id': self.users[1].id, 'username': 'p1', 'score': 200, 'profile_photo_url': None})
+        response = self.client.get('/api/games/rank/')
+        self.assertEqual((response.data['rank'], response.data['total']), (3, 3))
+
+    def test_new_best_updates_index_without_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            save_high_score(self.users[2], 70)
+            save_high_score(self.users[2], 40)
+        self.assertEqual(leaderboard.rank(self.users[2].id), 1)
+        self.assertEqual(leaderboard.score(self.users[2].id), 70)
+        self.assertEqual(HighScore.objects.get(user=self.users[2]).score, 70)
+
+
+class LeaderboardWindowTest(APITestCase):
+    def setUp(self):
+        self.users = []
+        for i in range(12):
+            user = User.objects.create_user(username=f'w{i:02d}', email=f'w{i}@example.com')
+            HighScore.objects.create(user=user, score=(i + 1) * 10)
+            self.users.append(user)
+        leaderboard.rebuild()
+        self.client.force_authenticate(self.users[5])
+
+    def test_around_me_window(self):
+        response = self.client.get('/api/games/high_scores/', {'around': 'me', 'k': 2})
+        self.assertEqual([row['rank'] for row in response.data], [5, 6, 7, 8, 9])
+        self.assertEqual(response.data[2]['username'], 'w05')
+        response = self.client.get('/api/games/high_scores/', {'around': self.users[11].id, 'k': 2})
+        self.assertEqual([row['rank'] for row in response.data], [1, 2, 3])
+
+    def test_keyset_pages_walk_every_row_once(self):
+        seen = []
+        response = self.client.get('/api/games/high_scores/', {'page_size': 5})
+        while True:
+            seen.extend(row['score'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, sorted(((i + 1) * 10 for i in range(12)), reverse=True))
+
+
+class PresenceTrackerTest(TestCase):
+    def test_timing_wheel_expires_only_stale_users(self):
+        tracker = PresenceTracker(ttl=120)
+        tracker.ping(1, now=1000.0)
+        tracker.ping(2, now=1050.0)
+        tracker.ping(1, now=1100.0)
+        self.assertEqual(tracker.expire(now=1169.0), 0)
+        self.assertEqual(tracker.expire(now=1171.0), 1)
+        self.assertEqual(set(tracker._users), {1})
+        self.assertEqual(tracker.expire(now=1221.0), 1)
+        self.assertEqual(tracker._users, {})
+
+    def test_snapshot_upserts_online_players(self):
+        user = User.objects.create_user(username='present', email='present@example.com')
+        tracker = PresenceTracker(ttl=120)
+        tracker.ping(user.id)
+        self.assertEqual(tracker.snapshot(), 1)
+        tracker.ping(user.id)
+        tracker.snapshot()
+        self.assertEqual(OnlinePlayer.objects.filter(user=user).count(), 1)
+
+    def test_snapshot_skips_deleted_users_and_games(self):
+        user = User.objects.create_user(username='stays', email='stays@example.com')
+        gone = User.objects.create_user(username='gone', email='gone@example.com')
+        game = GameSession.objects.create(user=user)
+        tracker = PresenceTracker(ttl=120)
+        tracker.ping(user.id, current_game_id=game.id)
+        tracker.ping(gone.id)
+        game.delete()
+        gone.delete()
+        self.assertEqual(tracker.snapshot(), 1)
+        self.assertEqual(list(OnlinePlayer.objects.values_list('user_id', 'current_game_id')), [(user.id, None)])
+        self.assertEqual(tracker.count(), 1)
+
+
+class OnlinePlayersViewTest(APITestCase):
+    def setUp(self):
+        presence.clear()
+
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def test_ping_and_list_without_online_player_rows(self):
+        users = [User.objects.create_user(username=name, email=f'{name}@example.com') for name in ('bo', 'al')]
+        for user in users:
+            self.client.force_authenticate(user)
+            self.client.post('/api/ping/', format='json')
+        self.assertFalse(OnlinePlayer.objects.exists())
+        response = self.client.get('/api/online-players/')
+        self.assertEqual([row['username'] for row in response.data], ['al', 'bo'])
+
+    def test_current_game_loads_only_the_shown_columns(self):
+        user = User.objects.create_user(username='gamer', email='gamer@example.com')
+        game = GameSession.objects.create(user=user, score=40, game_data=SnakeGame.new(seed=0).to_state())
+        presence.ping(user.id)
+        presence.set_game(user.id, game.id)
+        with self.assertNumQueries(2):
+            [player] = OnlinePlayersView()._online_players()
+            self.assertEqual((player.current_game.score, player.current_game.is_active), (40, True))
+        self.assertTrue({'game_data', 'replay'} <= player.current_game.get_deferred_fields())
+
+
+class ActivityBufferTest(TestCase):
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def test_mark_online_is_buffered_and_flushed_in_bulk(self):
+        users = [User.objects.create_user(username=f'a{i}', email=f'a{i}@example.com', bio='keep') for i in range(3)]
+        with self.assertNumQueries(0):
+            for user in users * 2:
+                user.mark_online()
+        with self.assertNumQueries(1):
+            activity_buffer.flush()
+        self.assertEqual(User.objects.filter(is_online=True, bio='keep').count(), 3)
+
+    def test_mark_offline_drops_pending_activity(self):
+        user = User.objects.create_user(username='gone', email='gone@example.com')
+        user.mark_online()
+        user.mark_offline()
+        activity_buffer.flush()
+        user.refresh_from_db()
+        self.assertFalse(user.is_online)
+
+
+class AllUsersViewTest(APITestCase):
+    def setUp(self):
+        for i in range(7):
+            User.objects.create_user(username=f'u{i}', email=f'u{i}@example.com', best_score=i * 10, bio='long text')
+        self.client.force_authenticate(User.objects.get(username='u0'))
+
+    def test_streams_full_list_as_json_array(self):
+        response = self.client.get('/api/users/', {'fields': 'id,username,best_score'})
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['username'] for row in rows], [f'u{i}' for i in range(6, -1, -1)])
+        self.assertEqual(set(rows[0]), {'id', 'username', 'best_score'})
+
+    def test_keyset_pages_load_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/', {'fields': 'username', 'page_size': 3})
+        self.assertNotIn('bio', queries.captured_queries[-1]['sql'])
+        names = [row['username'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            names.extend(row['username'] for row in response.data['results'])
+        self.assertEqual(names, [f'u{i}' for i in range(6, -1, -1)])
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='cached', email='cached@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def test_second_request_skips_token_lookup(self):
+        self.client.get('/api/games/me_summary/')
+        hits = token_cache.hits
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/games/me_summary/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('authtoken_token' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    def test_profile_change_and_logout_invalidate(self):
+        self.client.get('/api/games/me_summary/')
+        self.client.put('/api/auth/profile/', {'location': 'Kathmandu'}, format='json')
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.client.get('/api/games/me_summary/')
+        self.client.post('/api/auth/logout/')
+        response = self.client.get('/api/games/me_summary/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class IndexPackTest(TestCase):
+    def test_hot_queries_use_pack_indexes(self):
+        plan = GameSession.objects.filter(user_id=1, is_active=True).explain()
+        self.assertIn('session_', plan)
+        plan = HighScore.objects.order_by('-score', '-date_achieved', '-id')[:20].explain()
+        self.assertIn('highscore_rank_idx', plan)
+
+    def test_bench_command_rolls_back(self):
+        out = StringIO()
+        call_command('bench_indexes', users=30, sessions=2, repeat=2, stdout=out)
+        self.assertIn('with index pack', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='bench').exists())
+        self.assertIn('highscore_rank_idx', HighScore.objects.order_by('-score', '-date_achieved', '-id')[:20].explain())
+
+
+class FinishGameTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fin', email='fin@example.com')
+        self.session = GameSession.objects.create(user=self.user, game_data={'score': 0})
+
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def _logged_session(self):
+        """A session set up like start_game's: the replay header is its first segment"""
+        game = new_game()
+        session = GameSession.objects.create(
+            user=self.user, seed=game.seed, game_data=dict(game.to_state(), replay=game.recorder.to_state())
+        )
+        offset, data = game.recorder.take()
+        ReplaySegment.objects.create(session=session, offset=offset, data=data)
+        return session
+
+    def test_fixed_query_count(self):
+        session = self._logged_session()
+        session.score = 120
+        # SAVEPOINT, session UPDATE, segment SELECT, replay UPDATE, segment DELETE,
+        # user UPDATE, high score upserts (all-time, day/week), stats upsert, RELEASE
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(10):
+            self.assertTrue(finish_game(self.user, session))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_games_played, self.user.best_score), (1, 120))
+        self.assertEqual(HighScore.objects.get(user=self.user).score, 120)
+        self.assertEqual(leaderboard.score(self.user.id), 120)
+        self.assertIsNotNone(GameSession.objects.get(id=session.id).replay)
+        self.assertFalse(ReplaySegment.objects.exists())
+
+    def test_two_game_overs_for_one_user(self):
+        first, second = self._logged_session(), self._logged_session()
+        first.score, second.score = 70, 40
+        # Each request holds its own copy of the user
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(finish_game(User.objects.get(id=self.user.id), first))
+            self.assertTrue(finish_game(User.objects.get(id=self.user.id), second))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_games_played, self.user.best_score), (2, 70))
+        self.assertEqual(list(HighScore.objects.filter(user=self.user).values_list('score', flat=True)), [70])
+        self.assertEqual(UserStats.objects.get(user=self.user).games_played, 2)
+        for session in GameSession.objects.filter(id__in=[first.id, second.id]):
+            self.assertTrue(Replay(bytes(session.replay)).verify()[0])
+        self.assertFalse(ReplaySegment.objects.exists())
+
+    def test_ending_twice_counts_once(self):
+        self.session.score = 50
+        finish_game(self.user, self.session)
+        self.assertFalse(finish_game(self.user, GameSession.objects.get(id=self.session.id)))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_games_played, 1)
+        self.assertFalse(GameSession.objects.get(id=self.session.id).is_active)
+
+    def test_lower_score_keeps_best(self):
+        self.session.score = 90
+        finish_game(self.user, self.session)
+        # A stale in-memory user must not roll the stored best back
+        stale = User.objects.get(id=self.user.id)
+        stale.best_score = 0
+        second = GameSession.objects.create(user=self.user, score=30)
+        finish_game(stale, second)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_games_played, self.user.best_score), (2, 90))
+        self.assertEqual(list(HighScore.objects.filter(user=self.user).values_list('score', flat=True)), [90])
+
+
+@override_settings(QUERY_INSPECTOR={'ENABLED': True, 'N_PLUS_ONE_THRESHOLD': 3})
+class QueryInspectorMiddlewareTest(TestCase):
+    def setUp(self):
+        for i in range(4):
+            user = User.objects.create_user(username=f'q{i}', email=f'q{i}@example.com')
+            HighScore.objects.create(user=user, score=i)
+
+    def test_fingerprint_folds_parameters(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_flags_serializer_n_plus_one(self):
+        def view(request):
+            # No select_related: each row loads its user
+            return JsonResponse(HighScoreSerializer(HighScore.objects.all(), many=True).data, safe=False)
+
+        middleware = QueryInspectorMiddleware(view)
+        with self.assertLogs('game.queries', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/api/games/high_scores/'))
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        self.assertTrue(any('Possible N+1' in line and 'HighScoreSerializer' in line for line in logs.output))
+
+
+class SerialLiveServerThread(LiveServerThread):
+    """Handles one request at a time"""
+
+    def _create_server(self, connections_override=None):
+        # Requests share the test's in-memory SQLite connection, which can't
+        # hold two players' transactions at once
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+    server_thread_class = SerialLiveServerThread
+
+    def tearDown(self):
+        session_buffer.clear()
+        activity_buffer.clear()
+
+    def test_players_run_every_endpoint(self):
+        out = StringIO()
+        call_command(
+            'loadtest', url=self.live_server_url, players='2', games=1, moves=6, think=0,
+            ping_every=2, poll_every=3, cleanup=True, stdout=out,
+        )
+        report = out.getvalue()
+        for endpoint in ('register', 'login', 'start_game', 'update_game', 'ping', 'online_players', 'end_game'):
+            self.assertIn(endpoint, report)
+        self.assertIn(', 0 errors', report)
+        self.assertFalse(User.objects.filter(username__startswith='load').exists())
+
+
+class ReplayTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='replayer', email='replayer@example.com')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        session_buffer.clear()
+        activity_buffer.clear()
+
+    def test_frames_match_the_live_game_across_saves(self):
+        rng = random.Random(3)
+        game = SnakeGame.new()
+        # Food straight ahead, so later placements are part of the log too
+        game.food = 9 * game.width + 10
+        ReplayRecorder.start(game)
+        checkpoints = {}
+        segments = []
+        while not game.game_over and game.tick < 400:
+            events = [[game.tick + 1, rng.randrange(4)]] if rng.random() < 0.4 else []
+            game.apply_inputs(events, game.tick + 1)
+            checkpoints[game.tick] = (game.to_state()['snake'], game.score)
+            segments.append(game.recorder.take())
+            game = load_game(snapshot(game, 0))
+        self.assertEqual([offset for offset, _ in segments[1:]], [o + len(d) for o, d in segments[:-1]])
+        data = b''.join(d for _, d in segments) + game.recorder.finish(game.tick)
+        replay = Replay(data)
+        self.assertEqual(replay.final_tick, game.tick)
+        for frame in replay.frames():
+            if frame.tick in checkpoints:
+                self.assertEqual((frame.to_state()['snake'], frame.score), checkpoints[frame.tick])
+        self.assertLess(len(data), 16 + 3 * game.tick)
+
+    def test_finished_session_stores_replay(self):
+        response = self.client.post('/api/games/start_game/', format='json')
+        self.assertNotIn('replay', response.data['game_state'])
+        game_id = response.data['game_id']
+        url = f'/api/games/{game_id}/update_game/'
+        self.client.post(url, {'seq': 1, 'events': [[2, 'left']], 'tick': 3}, format='json')
+        self.client.post(url, {'seq': 2, 'events': [[5, 'down']], 'tick': 6}, format='json')
+        session_buffer.flush()
+        # The hot row only tracks the log; its bytes are appended segments
+        session = GameSession.objects.get(id=game_id)
+        segments = list(ReplaySegment.objects.filter(session=session).order_by('offset').values_list('offset', 'data'))
+        self.assertEqual(set(session.game_data['replay']), {'offset', 'tick'})
+        self.assertEqual(session.game_data['replay']['offset'], sum(len(data) for _, data in segments))
+        self.client.post(f'/api/games/{game_id}/end_game/', format='json')
+        session = GameSession.objects.get(id=game_id)
+        self.assertNotIn('replay', session.game_data)
+        self.assertFalse(ReplaySegment.objects.filter(session=session).exists())
+        replay = Replay(session.replay)
+        self.assertEqual((replay.final_tick, replay.turns), (6, 2))
+        self.assertEqual(replay.frame(6).to_state()['snake'], SnakeGame.from_state(session.game_data).to_state()['snake'])
+        out = StringIO()
+        call_command('replay', game_id, tick=2, stdout=out)
+        self.assertIn('tick 2', out.getvalue())
+
+
+class SeededFoodTest(APITestCase):
+    def tearDown(self):
+        session_buffer.clear()
+        activity_buffer.clear()
+
+    def test_hash_matches_client_vectors(self):
+        # Same values as frontend/src/utils/food.js foodHash
+        self.assertEqual(
+            [food_hash(seed, n, n + 2) for seed in (0, 4294967295) for n in (-1, 0)],
+            [3848110014, 3127061551, 4279436518, 2278344006],
+        )
+        self.assertEqual(SnakeGame.new(seed=987654321).to_state()['food'], [1, 10])
+
+    def test_food_survives_state_round_trips(self):
+        game = SnakeGame.new(seed=7)
+        rebuilt = SnakeGame.from_state(game.to_compact())
+        for other in (game, rebuilt):
+            other.snake.push_head(other.food)
+            other.spawn_food()
+        self.assertEqual(game.food, rebuilt.food)
+        self.assertFalse(game.snake.occupied[game.food])
+
+    def test_start_game_seeds_session_and_replay_verifies(self):
+        user = User.objects.create_user(username='seeded', email='seeded@example.com')
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/games/start_game/', format='json')
+        game_id = response.data['game_id']
+        session = GameSession.objects.get(id=game_id)
+        self.assertEqual(response.data['game_state']['seed'], session.seed)
+        self.client.post(f'/api/games/{game_id}/update_game/', {'seq': 1, 'events': [], 'tick': 40}, format='json')
+        data = GameSession.objects.get(id=game_id).replay
+        self.assertEqual(Replay(data).verify()[0], True)
+        # Re-encode the log with the first food moved one cell along
+        replay = Replay(data)
+        game = SnakeGame.new(seed=replay.seed)
+        recorder = ReplayRecorder.start(game, replay.seed)
+        recorder.data[-1] = recorder.data[-1] % 100 + 1
+        for tick, code, cell in list(replay.records())[1:-1]:
+            if cell is not None:
+                recorder.food(tick, cell)
+            else:
+                recorder.turn(tick, code)
+        tampered = recorder.finish(replay.final_tick)
+        self.assertEqual(Replay(tampered).verify()[0], False)
+
+
+class VerifierTest(TestCase):
+    def test_batch_agrees_with_single_replay_verification(self):
+        rng = random.Random(5)
+        items = [(i, *play(rng, 400)) for i in range(150)]
+        # An unseeded game and one whose stored score is inflated
+        game = SnakeGame.new()
+        ReplayRecorder.start(game)
+        for _ in range(12):
+            game.step(None)
+        items.append(('unseeded', game.score, game.recorder.finish(game.tick)))
+        items.append(('inflated', items[0][1] + 10, items[0][2]))
+
+        results = verify_batch(items)
+        for (key, claimed, data), result in zip(items, results):
+            consistent, final = Replay(data).verify()
+            self.assertEqual(result.key, key)
+            self.assertEqual((result.score, result.tick, result.game_over), (final.score, final.tick, final.game_over))
+            self.assertEqual(result.food_ok, consistent)
+        self.assertTrue(max(result.score for result in results) > 0)
+        self.assertEqual([result.key for result in results if not result.ok], ['inflated'])
+
+    def test_unreadable_replays_are_flagged(self):
+        _, data = self._game()
+        results = verify_batch([('junk', 0, b'not a replay'), ('cut', 0, data[:-1]), ('fine', 0, data)])
+        self.assertEqual([result.error is not None for result in results], [True, True, False])
+
+    def test_command_flags_and_marks_sessions(self):
+        user = User.objects.create_user(username='verifier', email='verifier@example.com')
+        score, data = self._game()
+        honest = GameSession.objects.create(user=user, score=score, replay=data, is_active=False, ended_at=timezone.now())
+        cheat = GameSession.objects.create(user=user, score=score + 500, replay=data, is_active=False, ended_at=timezone.now())
+        GameSession.objects.create(user=user, score=900, is_active=False, ended_at=timezone.now())
+        out = StringIO()
+        call_command('verify_games', mark=True, stdout=out)
+        self.assertIn(f'Session {cheat.id} (verifier)', out.getvalue())
+        self.assertIn('Verified 2 games', out.getvalue())
+        self.assertIn('1 flagged, 1 without a replay', out.getvalue())
+        self.assertEqual(
+            dict(GameSession.objects.filter(replay__isnull=False).values_list('id', 'verified')),
+            {honest.id: True, cheat.id: False},
+        )
+
+    @override_settings(LEADERBOARD_SYNC_INTERVAL=0)
+    def test_flagged_scores_leave_the_boards(self):
+        score, data = self._game()
+        now = timezone.now()
+        player = User.objects.create_user(username='player', email='player@example.com', best_score=score + 500)
+        spoofer = User.objects.create_user(username='spoofer', email='spoofer@example.com', best_score=score + 500)
+        GameSession.objects.create(user=player, score=score, replay=data, is_active=False, ended_at=now)
+        for user in (player, spoofer):
+            GameSession.objects.create(user=user, score=score + 500, replay=data, is_active=False, ended_at=now)
+            HighScore.objects.create(user=user, score=score + 500, date_achieved=now)
+            for period in ('day', 'week'):
+                PeriodBest.objects.create(
+                    period=period, starts_on=period_start(period, now), user=user, score=score + 500, date_achieved=now
+                )
+        windows.clear()
+        score_distribution.reset()
+        self.addCleanup(windows.clear)
+        self.addCleanup(score_distribution.reset)
+        leaderboard.rebuild()
+        self.assertEqual(windows.get('day').score(player.id), score + 500)
+
+        call_command('verify_games', mark=True, stdout=StringIO())
+        self.assertEqual(HighScore.objects.get(user=player).score, score)
+        self.assertFalse(HighScore.objects.filter(user=spoofer).exists())
+        self.assertEqual(set(PeriodBest.objects.values_list('user_id', 'score')), {(player.id, score)})
+        self.assertEqual(User.objects.get(id=spoofer.id).best_score, 0)
+        # Live boards in other workers catch up on their next sync
+        leaderboard.ensure_loaded()
+        for board in (leaderboard, windows.get('day'), windows.get('week')):
+            self.assertEqual(board.score(player.id), score)
+            self.assertIsNone(board.rank(spoofer.id))
+        score_distribution.persist()
+        self.assertEqual(score_distribution.count, 1)
+
+    def _game(self):
+        score, data = play(random.Random(2), 300)
+        self.assertGreater(score, 0)
+        return score, data
+
+
+class ArchiveTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='archivist', email='archivist@example.com')
+        self.client.force_authenticate(self.user)
+        old = timezone.now() - timedelta(days=60)
+        self.old = [
+            GameSession.objects.create(user=self.user, score=10 * i, is_active=False, game_data={'score': 10 * i})
+            for i in range(5)
+        ]
+        GameSession.objects.filter(id__in=[s.id for s in self.old]).update(updated_at=old, ended_at=old)
+        self.recent = GameSession.objects.create(user=self.user, score=70, is_active=False, ended_at=timezone.now())
+        self.live = GameSession.objects.create(user=self.user, score=80)
+        OnlinePlayer.objects.create(user=self.user, current_game=self.old[0])
+
+    def test_moves_only_old_ended_sessions_in_batches(self):
+        moved, raw, packed = archive_sessions(batch_size=2)
+        self.assertEqual(moved, 5)
+        self.assertGreater(raw, 0)
+        self.assertEqual(set(GameSession.objects.values_list('id', flat=True)), {self.recent.id, self.live.id})
+        archived = ArchivedGameSession.objects.get(id=self.old[3].id)
+        self.assertEqual((archived.score, archived.game_data, archived.is_active), (30, {'score': 30}, False))
+        self.assertIsNone(OnlinePlayer.objects.get(user=self.user).current_game)
+        # Nothing left to move on a second run
+        self.assertEqual(archive_sessions()[0], 0)
+
+    def test_archived_history_is_readable_through_the_api(self):
+        call_command('archive_sessions', stdout=StringIO())
+        old = self.old[2]
+        response = self.client.get(f'/api/games/{old.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ('id', 'username', 'score', 'game_data', 'is_active')},
+            {'id': old.id, 'username': 'archivist', 'score': 20, 'game_data': {'score': 20}, 'is_active': False},
+        )
+        self.assertEqual(self.client.get(f'/api/games/{self.live.id}/').data['score'], 80)
+        pages = [self.client.get('/api/games/archived/', {'page_size': 3})]
+        pages.append(self.client.get(pages[0].data['next']))
+        ids = [row['id'] for page in pages for row in page.data['results']]
+        self.assertEqual(ids, sorted((s.id for s in self.old), reverse=True))
+        self.assertIsNone(pages[1].data['next'])
+
+    def test_other_users_archives_stay_private(self):
+        archive_sessions()
+        other = User.objects.create_user(username='snoop', email='snoop@example.com')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/games/{self.old[0].id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/games/archived/').data['results'], [])
+
+
+class UserStatsTest(APITestCase):
+    STAT_FIELDS = (
+        'games_played', 'total_score', 'total_score_squares', 'days_played', 'current_streak',
+        'longest_streak', 'first_played_on', 'last_played_on', 'histogram',
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='statter', email='statter@example.com')
+
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def _stats(self):
+        stats = UserStats.objects.get(user=self.user)
+        return {name: getattr(stats, name) for name in self.STAT_FIELDS}
+
+    def test_upserts_match_a_rebuild_from_history(self):
+        start = timezone.now() - timedelta(days=20)
+        # Two-day streak, a gap, a three-day streak with two games on one day
+        for day, score in [(0, 40), (1, 120), (4, 0), (5, 300), (5, 1200), (6, 60)]:
+            ended_at = start + timedelta(days=day)
+            GameSession.objects.create(user=self.user, score=score, is_active=False, ended_at=ended_at)
+            record_game(self.user.id, score, ended_at)
+        # Abandoned sessions never count
+        GameSession.objects.create(user=self.user, score=500, is_active=False)
+        incremental = self._stats()
+        self.assertEqual(
+            {key: incremental[key] for key in ('games_played', 'days_played', 'current_streak', 'longest_streak')},
+            {'games_played': 6, 'days_played': 5, 'current_streak': 3, 'longest_streak': 3},
+        )
+        self.assertEqual(incremental['histogram'], [2, 1, 1, 0, 1, 0, 0, 1])
+        UserStats.objects.all().delete()
+        call_command('rebuild_user_stats', chunk=1, stdout=StringIO())
+        self.assertEqual(self._stats(), incremental)
+
+    def test_finished_games_show_on_the_profile(self):
+        for score in (100, 300):
+            finish_game(self.user, GameSession.objects.create(user=self.user, score=score))
+        self.client.force_authenticate(self.user)
+        stats = self.client.get('/api/auth/profile/').data['stats']
+        self.assertEqual(
+            {key: stats[key] for key in ('games_played', 'average_score', 'score_stddev', 'current_streak')},
+            {'games_played': 2, 'average_score': 200.0, 'score_stddev': 100.0, 'current_streak': 1},
+        )
+        self.assertEqual(stats['histogram'][2], {'min': 100, 'max': 199, 'count': 1})
+        other = User.objects.create_user(username='newbie', email='newbie@example.com')
+        self.assertEqual(self.client.get(f'/api/profile/{other.id}/').data['stats']['games_played'], 0)
+
+
+class KLLSketchTest(TestCase):
+    def test_ranks_stay_within_the_error_bound_after_merge_and_round_trip(self):
+        rng = random.Random(4)
+        values = [rng.randrange(0, 2000, 10) for _ in range(40000)]
+        halves = [KLLSketch(200, seed=i) for i in range(2)]
+        for i, value in enumerate(values):
+            halves[i % 2].update(value)
+        halves[0].merge(halves[1])
+        sketch = KLLSketch.from_bytes(halves[0].to_bytes())
+        self.assertEqual(sketch.n, len(values))
+        self.assertEqual(sum(len(items) << level for level, items in enumerate(sketch.levels)), len(values))
+        ordered = sorted(values)
+        for probe in range(0, 2000, 50):
+            self.assertAlmostEqual(sketch.rank(probe), bisect.bisect_left(ordered, probe) / len(values), delta=0.0133)
+        self.assertLess(sum(len(items) for items in sketch.levels), 1000)
+        self.assertAlmostEqual(sketch.quantile(0.5), ordered[len(ordered) // 2], delta=60)
+
+
+class PercentileTest(APITestCase):
+    def setUp(self):
+        score_distribution.reset()
+        self.user = User.objects.create_user(username='ranker', email='ranker@example.com')
+        for score in (0, 10, 20, 30):
+            GameSession.objects.create(user=self.user, score=score, is_active=False, ended_at=timezone.now())
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        score_distribution.reset()
+        activity_buffer.clear()
+
+    def test_bootstraps_from_history_then_tracks_finished_games(self):
+        # Requests never scan history; until the background thread has built
+        # the stored sketch there is no answer
+        self.assertIsNone(self.client.get('/api/games/percentile/', {'score': 25}).data['percentile'])
+        self.assertFalse(ScoreSketch.objects.exists())
+        score_distribution.persist()
+        self.assertEqual(self.client.get('/api/games/percentile/', {'score': 25}).data['percentile'], 75.0)
+        session = GameSession.objects.create(user=self.user, score=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/games/{session.id}/end_game/')
+        response = self.client.get('/api/games/percentile/', {'score': 25})
+        self.assertEqual((response.data['percentile'], response.data['games']), (80.0, 5))
+        self.assertGreater(response.data['error'], 0)
+
+    def test_workers_merge_into_the_stored_sketch(self):
+        score_distribution.persist()
+        score_distribution.record(100)
+        score_distribution.persist()
+        # Another process starting now sees this worker's score
+        score_distribution.reset()
+        self.assertEqual(score_distribution.count, 5)
+        self.assertEqual(score_distribution.percentile(100), 0.8)
+
+    def test_end_game_survives_a_failing_percentile(self):
+        session = GameSession.objects.create(user=self.user, score=40)
+        with mock.patch.object(score_distribution, 'percentile', side_effect=DatabaseError('locked')):
+            with self.assertLogs('game.views', 'ERROR'):
+                response = self.client.post(f'/api/games/{session.id}/end_game/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['percentile'])
+        self.assertFalse(GameSession.objects.get(id=session.id).is_active)
+
+
+class WindowedLeaderboardTest(APITestCase):
+    def setUp(self):
+        windows.clear()
+        leaderboard.rebuild()
+        self.users = [User.objects.create_user(username=f'd{i}', email=f'd{i}@example.com') for i in range(3)]
+        self.client.force_authenticate(self.users[0])
+        # An old record that only the all-time board should show
+        long_ago = timezone.now() - timedelta(days=60)
+        for period in ('day', 'week'):
+            PeriodBest.objects.create(
+                period=period, starts_on=period_start(period, long_ago), user=self.users[2], score=900, date_achieved=long_ago
+            )
+        HighScore.objects.create(user=self.users[2], score=900, date_achieved=long_ago)
+        leaderboard.rebuild()
+
+    def tearDown(self):
+        windows.clear()
+        activity_buffer.clear()
+
+    def _finish(self, user, score):
+        with self.captureOnCommitCallbacks(execute=True):
+            finish_game(user, GameSession.objects.create(user=user, score=score))
+
+    def test_windows_rank_only_their_own_games(self):
+        self.assertEqual(windows.get('day').top(10), [])
+        # The first read loaded the empty bucket; later scores arrive in place
+        self._finish(self.users[0], 50)
+        self._finish(self.users[1], 80)
+        self._finish(self.users[0], 120)
+        self._finish(self.users[0], 60)
+        for window in ('day', 'week'):
+            response = self.client.get('/api/games/high_scores/', {'window': window})
+            self.assertEqual([(row['username'], row['score']) for row in response.data], [('d0', 120), ('d1', 80)])
+        response = self.client.get('/api/games/high_scores/')
+        self.assertEqual([row['username'] for row in response.data], ['d2', 'd0', 'd1'])
+        response = self.client.get('/api/games/rank/', {'window': 'day', 'user_id': self.users[1].id})
+        self.assertEqual((response.data['rank'], response.data['total']), (2, 2))
+        page = self.client.get('/api/games/high_scores/', {'window': 'week', 'page_size': 1})
+        self.assertEqual([row['score'] for row in page.data['results']], [120])
+        self.assertEqual(self.client.get('/api/games/high_scores/', {'window': 'month'}).status_code, 400)
+
+    def test_buckets_roll_over_and_expire(self):
+        self._finish(self.users[1], 40)
+        yesterday = timezone.now() - timedelta(days=1)
+        stale = windows.get('day', yesterday)
+        today = windows.get('day')
+        self.assertEqual(today.score(self.users[1].id), 40)
+        self.assertIsNot(windows.get('day', yesterday), stale)
+        self.assertEqual(expire_period_bests(batch_size=1), 2)
+        self.assertEqual(PeriodBest.objects.filter(user=self.users[2]).count(), 0)
+        self.assertEqual(PeriodBest.objects.filter(user=self.users[1]).count(), 2)
+
+
+class VersionedCacheTest(APITestCase):
+    def test_rebuilds_only_when_version_changes(self):
+        cache = VersionedCache()
+        builds = []
+        build = lambda: builds.append(1) or len(builds)
+        self.assertEqual(cache.get_or_build('top', 1, build), 1)
+        self.assertEqual(cache.get_or_build('top', 1, build), 1)
+        self.assertEqual(cache.get_or_build('top', 2, build), 2)
+        self.assertEqual(cache.get_or_build('top', 2, build, max_age=0), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 3, 1))
+
+    def test_one_rebuild_while_others_get_previous_value(self):
+        cache = VersionedCache()
+        cache.get_or_build('top', 1, lambda: 'old')
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'new'
+
+        results = []
+        builder = threading.Thread(target=lambda: results.append(cache.get_or_build('top', 2, slow)))
+        builder.start()
+        started.wait(5)
+        # Concurrent readers of the new version neither build nor block
+        self.assertEqual([cache.get_or_build('top', 2, self.fail) for _ in range(3)], ['old'] * 3)
+        release.set()
+        builder.join()
+        self.assertEqual(results, ['new'])
+        self.assertEqual(cache.get_or_build('top', 2, self.fail), 'new')
+        self.assertEqual(cache.stats()['stale_hits'], 3)
+
+    def test_etag_follows_content_across_workers(self):
+        cache, other_worker = VersionedCache(), VersionedCache()
+        _, etag = cache.fetch('top', 1, lambda: ['a'])
+        # Versions are per process; the same data gets the same tag
+        self.assertEqual(other_worker.fetch('top', 7, lambda: ['a'])[1], etag)
+        # An expired entry rebuilt from unchanged data keeps it too
+        self.assertEqual(cache.fetch('top', 1, lambda: ['a'], max_age=0)[1], etag)
+        self.assertNotEqual(cache.fetch('top', 2, lambda: ['b'])[1], etag)
+        self.assertNotEqual(cache.fetch('around', 2, lambda: ['b'])[1], etag)
+
+    def test_finished_game_shows_on_next_read(self):
+        leaderboard.rebuild()
+        user = User.objects.create_user(username='fresh', email='fresh@example.com')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/games/high_scores/').data, [])
+        self.assertEqual(self.client.get('/api/games/high_scores/').data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            finish_game(user, GameSession.objects.create(user=user, score=70))
+        response = self.client.get('/api/games/high_scores/')
+        self.assertEqual([(row['username'], row['score']) for row in response.data], [('fresh', 70)])
+        self.assertEqual(self.client.get('/api/games/high_scores/', {'around': 'me'}).status_code, 200)
+        self.assertEqual(self.client.get('/api/games/cache_stats/').status_code, 403)
+        user.is_staff = True
+        user.save()
+        stats = self.client.get('/api/games/cache_stats/').data['high_scores']
+        self.assertEqual(stats, high_scores_cache.stats())
+        self.assertGreaterEqual(stats['hits'], 1)
+        activity_buffer.clear()
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        presence.clear()
+        leaderboard.rebuild()
+        self.user = User.objects.create_user(username='poller', email='poller@example.com')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        activity_buffer.clear()
+
+    def _revalidate(self, url, queries=0):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(queries):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((second.status_code, second['ETag']), (304, first['ETag']))
+        return first['ETag']
+
+    def test_online_players_and_leaderboard_revalidate_until_data_changes(self):
+        self.client.post('/api/ping/', format='json')
+        etag = self._revalidate('/api/online-players/')
+        other = User.objects.create_user(username='joiner', email='joiner@example.com')
+        presence.ping(other.id)
+        response = self.client.get('/api/online-players/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([row['username'] for row in response.data], ['joiner', 'poller'])
+
+        etag = self._revalidate('/api/games/high_scores/')
+        with self.captureOnCommitCallbacks(execute=True):
+            finish_game(self.user, GameSession.objects.create(user=self.user, score=30))
+        response = self.client.get('/api/games/high_scores/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data[0]['score']), (200, 30))
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rebuilt_entry_with_unchanged_data_answers_304(self):
+        self.client.post('/api/ping/', format='json')
+        etag = self.client.get('/api/online-players/')['ETag']
+        misses = online_players_cache.stats()['misses']
+        # Past ONLINE_PLAYERS_MAX_AGE the entry is rebuilt, to the same data
+        later = time.monotonic() + 60
+        with mock.patch('game.caching.time', SimpleNamespace(monotonic=lambda: later, perf_counter=time.perf_counter)):
+            response = self.client.get('/api/online-players/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(online_players_cache.stats()['misses'], misses + 1)
+
+        etag = self.client.get('/api/games/high_scores/')['ETag']
+        # A worker that has not built the entry yet
+        high_scores_cache.clear()
+        response = self.client.get('/api/games/high_scores/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_profiles_revalidate_from_user_columns(self):
+        etag = self._revalidate('/api/games/me_summary/', queries=1)
+        self._revalidate('/api/games/me_summary/?fields=id,bio', queries=1)
+        # Written elsewhere; the authenticated user object still has the old value
+        User.objects.filter(id=self.user.id).update(best_score=90)
+        response = self.client.get('/api/games/me_summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['best_score']), (200, 90))
+        self._revalidate('/api/auth/profile/', queries=1)
+        other = User.objects.create_user(username='viewed', email='viewed@example.com')
+        self._revalidate(f'/api/profile/{other.id}/', queries=1)
+
+
+class FastSerializerTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/api/users/')
+        self.request.query_params = self.request.GET
+        self.users = [
+            User.objects.create_user(username=f'fast{i}', email=f'fast{i}@example.com', best_score=i * 10, bio='hi')
+            for i in range(3)
+        ]
+        User.objects.filter(id=self.users[0].id).update(profile_photo='profile_photos/a.png', last_activity=timezone.now())
+
+    def _same(self, serializer_class, instances, rows, context, **kwargs):
+        expected = json.loads(json.dumps(serializer_class(instances, many=True, context=context).data, cls=JSONEncoder))
+        for compiled_rows, dicts in ((instances, False), (rows, True)):
+            compiled = compile_serializer(serializer_class, context, dicts=dicts)
+            self.assertEqual(json.loads(json.dumps(compiled.serialize(compiled_rows, context), cls=JSONEncoder)), expected)
+        return compiled
+
+    def test_identical_output_from_instances_and_values_rows(self):
+        users = list(User.objects.order_by('id'))
+        for only_fields in (None, ['id', 'username', 'profile_photo_url', 'join_date_formatted']):
+            context = {'request': self.request, 'only_fields': only_fields}
+            compiled = compile_serializer(UserProfileSerializer, context, dicts=True)
+            rows = list(User.objects.order_by('id').values(*compiled.columns))
+            self._same(UserProfileSerializer, users, rows, context)
+        self.assertIs(compile_serializer(UserProfileSerializer, context, dicts=True), compiled)
+
+        for user in users:
+            HighScore.objects.create(user=user, score=user.best_score)
+        scores = list(HighScore.objects.select_related('user').order_by('id'))
+        context = {'request': self.request}
+        compiled = compile_serializer(HighScoreSerializer, context, dicts=True)
+        self._same(HighScoreSerializer, scores, list(HighScore.objects.order_by('id').values(*compiled.columns)), context)
+
+    def test_plain_and_method_fields_on_objects(self):
+        game = GameSession.objects.create(user=self.users[1], score=40)
+        players = [OnlinePlayer(user=user, last_ping=timezone.now(), current_game=game) for user in self.users]
+        context = {'request': self.request}
+        compiled = compile_serializer(OnlinePlayerSerializer, context)
+        self.assertEqual(compiled.serialize(players, context), OnlinePlayerSerializer(players, many=True, context=context).data)
+        entries = [{'rank': 1, 'user_id': 7, 'username': 'x', 'score': 5, 'profile_photo': 'profile_photos/b.png'}]
+        compiled = compile_serializer(LeaderboardEntrySerializer, context, dicts=True)
+        self.assertEqual(compiled.serialize(entries, context), LeaderboardEntrySerializer(entries, many=True, context=context).data)
+        self.assertEqual(compiled.serialize(entries, context)[0]['profile_photo_url'], 'http://testserver/media/profile_photos/b.png')
+        with self.assertRaises(TypeError):
+            compile_serializer(OnlinePlayerSerializer, context, dicts=True)
+
+
+class RendererTest(TestCase):
+    data = {
+        'when': timezone.now(),
+        'day': timezone.localdate(),
+        'price': Decimal('1.50'),
+        'id': uuid.UUID(int=7),
+        'label': gettext_lazy('Snake'),
+        'text': 'caf\u00e9\u2028line',
+        'list': [None, True, 2.5, {'nested': ('a', 'b')}],
+    }
+
+    def test_same_bytes_as_stock_renderer(self):
+        stock = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), stock)
+        self.assertIn(b'\\u2028', stock)
+        with override_settings(JSON_RENDERING={'BACKEND': 'json'}):
+            self.assertEqual(FastJSONRenderer().render(self.data), stock)
+        indented = 'application/json; indent=4'
+        self.assertEqual(FastJSONRenderer().render(self.data, indented), JSONRenderer().render(self.data, indented))
+        # What orjson refuses goes to the stock encoder
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render({1: 'one'}), b'{"1":"one"}')
+
+    def test_streamed_array_in_chunks(self):
+        rows = ({'n': n} for n in range(5))
+        response = StreamingJSONResponse(rows, transform=lambda chunk: [dict(row, double=row['n'] * 2) for row in chunk], chunk_size=2)
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks)), [{'n': n, 'double': n * 2} for n in range(5)])
+        self.assertEqual(b''.join(StreamingJSONResponse([]).streaming_content), b'[]')
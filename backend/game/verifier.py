@@ -0,0 +1,256 @@
+"""
+Vectorized re-simulation of finished games from their replays.
+
+``verify_batch`` steps thousands of games at once with NumPy: every piece
+of engine state (ring-buffer bodies, occupancy maps, heading, food) is a
+row in a 2-D array, so one tick of the whole batch is a handful of array
+operations instead of a Python loop per game. Each game is checked for:
+
+* the score the simulation reaches versus the stored score;
+* food placements, re-derived from the seed (``engine.food_hash``) and
+  compared with the ones in the log (play continues with the logged food);
+* that the game really ends on the replay's final tick.
+
+The rules match ``SnakeGame.step`` exactly, including the tail still
+counting as occupied on the tick it moves; ``Replay.verify`` is the
+single-game reference implementation the tests compare against.
+"""
+import numpy as np
+
+from .engine import _DX, _DY, _OPPOSITE, FOOD_ATTEMPTS, FOOD_POINTS, INITIAL_SNAKE, InvalidState, food_hash
+from .replay import END, FOOD, parse_header
+
+_C1, _C2, _C3, _C4 = (np.uint32(c) for c in (0x9E3779B1, 0x85EBCA77, 0x7FEB352D, 0x846CA68B))
+_DX_NP = np.array(_DX, dtype=np.int32)
+_DY_NP = np.array(_DY, dtype=np.int32)
+_OPPOSITE_NP = np.array(_OPPOSITE, dtype=np.int8)
+
+
+def food_hash_np(seed, n, attempt):
+    """``engine.food_hash`` over broadcast uint32 arrays"""
+    h = seed ^ (n * _C1) ^ (attempt * _C2)
+    h ^= h >> np.uint32(16)
+    h *= _C3
+    h ^= h >> np.uint32(15)
+    h *= _C4
+    h ^= h >> np.uint32(16)
+    return h
+
+
+class VerifiedGame:
+    """Outcome for one game of a batch"""
+    __slots__ = ('key', 'claimed_score', 'score', 'tick', 'game_over', 'food_ok', 'error')
+
+    def __init__(self, key, claimed_score):
+        self.key = key
+        self.claimed_score = claimed_score
+        self.score = None
+        self.tick = None
+        self.game_over = None
+        self.food_ok = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.food_ok is not False and self.score == self.claimed_score
+
+    def __repr__(self):
+        return f'<VerifiedGame {self.key} ok={self.ok} score={self.score}/{self.claimed_score}>'
+
+
+def decode_varints(buffer):
+    """
+    Decode a concatenation of LEB128 varints in one pass.
+
+    Returns ``(values, ends)``: each value and the offset of its last byte.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0:1] = 0
+    starts[1:] = ends[:-1] + 1
+    # Position of every byte inside its varint sets its shift
+    owner = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = (np.arange(len(data)) - starts[owner]) * 7
+    parts = (data & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts) if len(ends) else parts[:0], ends
+
+
+def _decode(bodies):
+    """
+    Split replay bodies into turns, food placements and final ticks.
+
+    Everything is array work over the whole batch. Telling food cells from
+    record headers looks sequential (a cell follows every ``FOOD`` header)
+    but only matters inside runs of ``FOOD``-coded tokens, which alternate
+    header, cell, header... from the start of the run.
+
+    Returns ``(game, tick, code)`` arrays for turns, ``(game, index, cell)``
+    arrays for food and each game's final tick (-1 if it has none).
+    """
+    values, ends = decode_varints(b''.join(bodies))
+    game = np.searchsorted(np.cumsum([len(body) for body in bodies]) - 1, ends)
+    position = np.arange(len(values))
+    first = np.ones(len(values), dtype=np.bool_)
+    first[1:] = game[1:] != game[:-1]
+
+    food_coded = (values & 7) == FOOD
+    after_food_coded = np.zeros(len(values), dtype=np.bool_)
+    after_food_coded[1:] = food_coded[:-1]
+    after_food_coded[first] = False
+    run_start = np.maximum.accumulate(np.where(food_coded & ~after_food_coded, position, -1))
+    is_cell = (food_coded | after_food_coded) & ((position - run_start) % 2 == 1)
+
+    headers = values[~is_cell]
+    header_game = game[~is_cell]
+    codes = headers & 7
+    # Per-game running tick: a global cumsum rebased at each game's first header
+    ticks = np.cumsum(headers >> 3)
+    game_start = np.searchsorted(header_game, header_game, side='left')
+    ticks = ticks - ticks[game_start] + (headers[game_start] >> 3)
+    turn = codes < FOOD
+    turns = (header_game[turn], ticks[turn], codes[turn].astype(np.int8))
+
+    cell_game = game[is_cell]
+    cell_index = np.arange(len(cell_game)) - np.searchsorted(cell_game, cell_game, side='left')
+    foods = (cell_game, cell_index, values[is_cell] - 1)
+
+    final_tick = np.full(len(bodies), -1, dtype=np.int64)
+    end = codes == END
+    ended, first_end = np.unique(header_game[end], return_index=True)
+    final_tick[ended] = ticks[end][first_end]
+    return turns, foods, final_tick
+
+
+def verify_batch(items):
+    """
+    Re-simulate ``(key, claimed_score, replay_bytes)`` items.
+
+    Returns a ``VerifiedGame`` per item, in order. All replays in a batch
+    must share one board size; unreadable replays come back with ``error``.
+    """
+    results = [VerifiedGame(key, claimed) for key, claimed, _ in items]
+    parsed = []
+    for result, (_, _, data) in zip(results, items):
+        try:
+            view = memoryview(data)
+            width, height, seed, offset = parse_header(view)
+        except InvalidState as e:
+            result.error = str(e)
+            continue
+        if view[-1] >= 0x80:
+            result.error = 'Truncated replay'
+            continue
+        parsed.append((result, view[offset:], width, height, seed))
+    if not parsed:
+        return results
+
+    width, height = parsed[0][2], parsed[0][3]
+    if any((w, h) != (width, height) for _, _, w, h, _ in parsed):
+        raise ValueError('All replays in a batch must use the same board size')
+    (turn_games, turn_ticks, turn_codes), (food_games, food_index, food_cells), final_tick = _decode(
+        [body for _, body, _, _, _ in parsed]
+    )
+    replays = []
+    for (result, _, _, _, seed), final in zip(parsed, final_tick.tolist()):
+        if final < 0:
+            result.error = 'Replay has no end record'
+        replays.append((result, seed))
+    size = width * height
+    count = len(replays)
+
+    # Games without an end record run zero ticks and keep their error
+    final_tick = np.maximum(final_tick, 0)
+    max_tick = int(final_tick.max())
+    turns = np.full((count, max_tick + 2), -1, dtype=np.int8)
+    turns[turn_games, np.minimum(turn_ticks, max_tick + 1)] = turn_codes
+    # -2 marks "no logged placement", which never matches a real cell or -1
+    logged = np.full((count, int(food_index.max(initial=0)) + 2), -2, dtype=np.int32)
+    logged[food_games, food_index] = food_cells
+    seeded = np.array([seed is not None for _, seed in replays])
+    seeds = np.array([seed or 0 for _, seed in replays], dtype=np.uint32)
+
+    rows = np.arange(count)
+    body = np.zeros((count, size), dtype=np.int32)
+    occupied = np.zeros((count, size), dtype=np.bool_)
+    for i, (x, y) in enumerate(reversed(INITIAL_SNAKE)):
+        body[:, i] = y * width + x
+        occupied[:, y * width + x] = True
+    head = np.full(count, len(INITIAL_SNAKE) - 1, dtype=np.int64)
+    length = np.full(count, len(INITIAL_SNAKE), dtype=np.int64)
+    direction = np.zeros(count, dtype=np.int8)
+    score = np.zeros(count, dtype=np.int64)
+    tick = np.zeros(count, dtype=np.int64)
+    game_over = np.zeros(count, dtype=np.bool_)
+    food = np.full(count, -1, dtype=np.int64)
+    next_food = np.zeros(count, dtype=np.int64)
+    food_ok = np.ones(count, dtype=np.bool_)
+
+    def spawn(games):
+        """Place the next food for ``games`` (indices) and check it against the log"""
+        recorded = logged[games, next_food[games]]
+        next_food[games] += 1
+        chosen = recorded.astype(np.int64)
+        check = games[seeded[games]]
+        if len(check):
+            n = (length[check] - len(INITIAL_SNAKE)).astype(np.uint32)
+            attempts = np.arange(FOOD_ATTEMPTS, dtype=np.uint32)
+            cells = (food_hash_np(seeds[check][:, None], n[:, None], attempts[None, :]) % np.uint32(size)).astype(np.int64)
+            free = ~occupied[check[:, None], cells]
+            found = free.any(axis=1)
+            placed = np.where(found, cells[np.arange(len(check)), free.argmax(axis=1)], -1)
+            # Crowded boards fall back to the engine's board-order pick
+            for j in np.nonzero(~found)[0]:
+                g = check[j]
+                if length[g] >= size:
+                    continue
+                k = food_hash(int(seeds[g]), int(length[g]) - len(INITIAL_SNAKE), FOOD_ATTEMPTS) % (size - int(length[g]))
+                placed[j] = np.flatnonzero(~occupied[g])[k]
+            placed[length[check] >= size] = -1
+            food_ok[check] &= placed == recorded[seeded[games]]
+        # Play on with the logged food, as Replay does, so scores agree
+        food[games] = chosen
+
+    spawn(rows)
+    for t in range(1, max_tick + 1):
+        games = rows[(~game_over) & (final_tick >= t)]
+        if not len(games):
+            break
+        wanted = turns[games, t]
+        turning = (wanted >= 0) & ((wanted != _OPPOSITE_NP[direction[games]]) | (length[games] == 1))
+        direction[games[turning]] = wanted[turning]
+
+        current = body[games, head[games]]
+        x = current % width + _DX_NP[direction[games]]
+        y = current // width + _DY_NP[direction[games]]
+        tick[games] = t
+        wall = (x < 0) | (x >= width) | (y < 0) | (y >= height)
+        cell = np.where(wall, 0, y * width + x)
+        dead = wall | occupied[games, cell]
+        game_over[games[dead]] = True
+
+        live = games[~dead]
+        cell = cell[~dead]
+        head[live] = (head[live] + 1) % size
+        body[live, head[live]] = cell
+        occupied[live, cell] = True
+        length[live] += 1
+
+        ate = cell == food[live]
+        eaters = live[ate]
+        score[eaters] += FOOD_POINTS
+        if len(eaters):
+            spawn(eaters)
+        movers = live[~ate]
+        tail = body[movers, (head[movers] - length[movers] + 1) % size]
+        occupied[movers, tail] = False
+        length[movers] -= 1
+
+    for g, (result, _) in enumerate(replays):
+        result.score = int(score[g])
+        result.tick = int(tick[g])
+        result.game_over = bool(game_over[g])
+        result.food_ok = bool(food_ok[g]) if seeded[g] else None
+        if result.error is None and tick[g] != final_tick[g]:
+            result.error = f'Game ended at tick {tick[g]}, replay runs to {final_tick[g]}'
+    return results
@@ -1,26 +1,56 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 from django.contrib.auth import login, logout
 from django.db.models import Q
+from django.http import Http404
 from django.utils import timezone
-from .models import User, GameSession, HighScore, OnlinePlayer
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from .models import User, UserStats, GameSession, ArchivedGameSession, ReplaySegment, HighScore, PeriodBest, OnlinePlayer
+from .engine import InvalidState
+from .leaderboard import PERIODS, leaderboard, period_start, update_profile, windows
+from .percentiles import score_distribution
+from .presence import presence
+from .pagination import KeysetPagination
+from .authentication import token_cache
+from .fastserializers import compile_serializer, serialize
+from .renderers import StreamingJSONResponse
+from .caching import get_setting as cache_setting, etag_matches, high_scores_cache, make_etag, online_players_cache
+from .buffers import session_buffer, activity_buffer
+from .gameplay import (
+    InputGap,
+    StateMismatch,
+    apply_input_events,
+    apply_posted_state,
+    snapshot,
+    ack_payload,
+    save_game,
+    finish_game,
+    new_game,
+    load_game
+)
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer, 
     UserProfileSerializer,
+    UserStatsSerializer,
     OnlinePlayerSerializer,
     GameSessionSerializer, 
+    ArchivedGameSessionSerializer,
     HighScoreSerializer, 
-    UpdateGameSerializer
+    UpdateGameSerializer,
+    InputEventsSerializer,
+    LeaderboardEntrySerializer
 )
+import logging
 import random
 
+logger = logging.getLogger(__name__)
+
 
 class UserRegistrationView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -50,10 +80,8 @@ class UserLoginView(APIView):
             # Mark user as online
             user.mark_online()
             
-            # Create or update online player record
-            online_player, created = OnlinePlayer.objects.get_or_create(user=user)
-            online_player.last_ping = timezone.now()
-            online_player.save()
+            # Track presence in memory; OnlinePlayer rows come from snapshots
+            presence.ping(user.id)
             
             return Response({
                 'user': UserProfileSerializer(user, context={'request': request}).data,
@@ -70,6 +98,7 @@ class UserLogoutView(APIView):
             request.user.mark_offline()
             
             # Remove from online players
+            presence.remove(request.user.id)
             OnlinePlayer.objects.filter(user=request.user).delete()
             
             # Delete token
@@ -92,28 +121,80 @@ class UserProfileView(APIView):
     def put(self, request):
         serializer = UserProfileSerializer(request.user, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            user = serializer.save()
+            update_profile(user.id, user.username, user.profile_photo.name or None)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _cache_key(request, user_id=None):
+    """Everything besides the data version that shapes a cached response"""
+    # Photo URLs are absolute, so the host matters too
+    params = tuple(sorted((name, tuple(values)) for name, values in request.query_params.lists()))
+    return request.get_host(), params, user_id
+
+
+def _revalidate(response, etag):
+    """Tag a polled response and have clients check it with If-None-Match each time"""
+    if etag is not None:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def _not_modified(etag):
+    return _revalidate(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def _profile_etag(request, user, fields, *extra):
+    """ETag from the user columns that ``fields`` render; no serialization"""
+    columns = UserProfileSerializer.columns_for(fields)
+    return make_etag(request.get_host(), fields, [getattr(user, column) for column in columns], *extra)
+
+
 class OnlinePlayersView(APIView):
     permission_classes = [permissions.AllowAny]
 
-    @method_decorator(cache_page(5))
     def get(self, request):
         # Only return online players if user is authenticated
         if request.user.is_authenticated:
-            online_players = OnlinePlayer.get_online_players()
-            # Minimal fields by default to reduce payload; override with ?fields=id,username,...
-            default_fields = ['id', 'username', 'best_score', 'total_games_played']
-            context = {'request': request, 'only_fields': default_fields}
-            serializer = OnlinePlayerSerializer(online_players, many=True, context=context)
-            return Response(serializer.data)
+            key, version = _cache_key(request), presence.version
+            # Live game scores aren't versioned, hence the max age
+            max_age = cache_setting('ONLINE_PLAYERS_MAX_AGE')
+            etag = online_players_cache.check(request, key, version, max_age)
+            if etag:
+                return _not_modified(etag)
+            data, etag = online_players_cache.fetch(key, version, lambda: self._serialize(request), max_age)
+            # A rebuild that found nothing changed keeps the tag
+            if etag_matches(request, etag):
+                return _not_modified(etag)
+            return _revalidate(Response(data), etag)
         else:
             # Return empty list for unauthenticated users
             return Response([])
 
+    def _serialize(self, request):
+        # Minimal fields by default to reduce payload; override with ?fields=id,username,...
+        default_fields = ['id', 'username', 'best_score', 'total_games_played']
+        context = {'request': request, 'only_fields': default_fields}
+        return serialize(OnlinePlayerSerializer, self._online_players(), context)
+
+    def _online_players(self):
+        """Unsaved OnlinePlayer rows built from the presence tracker with two queries"""
+        online = presence.online()
+        users = User.objects.in_bulk([user_id for user_id, _, _ in online])
+        game_ids = [game_id for _, _, game_id in online if game_id]
+        # Only what the serializer shows; not the game_data JSON or the replay
+        games = GameSession.objects.only('id', 'score', 'is_active').in_bulk(game_ids) if game_ids else {}
+        players = [
+            OnlinePlayer(user=users[user_id], last_ping=last_ping, current_game=games.get(game_id))
+            for user_id, last_ping, game_id in online
+            if user_id in users
+        ]
+        players.sort(key=lambda player: player.user.username)
+        return players
+
 
 class PingView(APIView):
     """Endpoint for keeping user online status updated"""
@@ -122,20 +203,17 @@ class PingView(APIView):
         user = request.user
         user.mark_online()
         
-        # Update online player record
-        online_player, created = OnlinePlayer.objects.get_or_create(user=user)
-        online_player.last_ping = timezone.now()
+        # Update presence in memory; no database write
+        presence.ping(user.id)
         
-        # Update current game if provided
-        current_game_id = request.data.get('current_game_id')
-        if current_game_id:
-            try:
-                game = GameSession.objects.get(id=current_game_id, user=user)
-                online_player.current_game = game
-            except GameSession.DoesNotExist:
-                pass
-                
-        online_player.save()
+        # Update current game if provided; only a change needs checking
+        try:
+            current_game_id = int(request.data.get('current_game_id') or 0)
+        except (TypeError, ValueError):
+            current_game_id = 0
+        if current_game_id and current_game_id != presence.current_game(user.id):
+            if GameSession.objects.filter(id=current_game_id, user=user).exists():
+                presence.set_game(user.id, current_game_id)
         
         return Response({'status': 'pong'})
 
@@ -144,7 +222,29 @@ class GameViewSet(viewsets.ModelViewSet):
     serializer_class = GameSessionSerializer
 
     def get_queryset(self):
-        return GameSession.objects.filter(user=self.request.user)
+        return GameSession.objects.filter(user=self.request.user).defer('replay')
+
+    def get_object(self):
+        # In-progress state may still be waiting in the write-behind buffer
+        return session_buffer.overlay(super().get_object())
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Older games live in the archive table (see game/archive.py)
+            queryset = ArchivedGameSession.objects.filter(user=request.user).select_related('user')
+            archived = get_object_or_404(queryset.defer('replay'), pk=kwargs['pk'])
+            return Response(ArchivedGameSessionSerializer(archived, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['get'])
+    def archived(self, request):
+        """The current user's archived games, newest first, as keyset pages"""
+        paginator = KeysetPagination(ordering=['-created_at', '-id'])
+        queryset = ArchivedGameSession.objects.filter(user=request.user).select_related('user').defer('replay')
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ArchivedGameSessionSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['post'])
     def start_game(self, request):
@@ -154,25 +254,22 @@ class GameViewSet(viewsets.ModelViewSet):
         # End any active games for this user
         GameSession.objects.filter(user=user, is_active=True).update(is_active=False)
         
-        # Initial game state
-        initial_state = {
-            'snake': [[10, 10], [10, 11], [10, 12]],
-            'food': [random.randint(0, 19), random.randint(0, 19)],
-            'direction': 'up',
-            'score': 0,
-            'game_over': False
-        }
+        # Initial game state comes from the server-side engine; the replay
+        # log's header is its first segment, game_data only tracks its length
+        game = new_game()
+        initial_state = game.to_state()
         
         game_session = GameSession.objects.create(
             user=user,
             score=0,
-            game_data=initial_state
+            seed=game.seed,
+            game_data=dict(initial_state, replay=game.recorder.to_state())
         )
+        offset, data = game.recorder.take()
+        ReplaySegment.objects.create(session=game_session, offset=offset, data=data)
         
         # Update online player's current game
-        online_player, created = OnlinePlayer.objects.get_or_create(user=user)
-        online_player.current_game = game_session
-        online_player.save()
+        presence.set_game(user.id, game_session.id)
         
         return Response({
             'game_id': game_session.id,
@@ -190,33 +287,37 @@ class GameViewSet(viewsets.ModelViewSet):
                     'error': 'Game session is not active'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
+            # Compact protocol: the client sends inputs, the engine advances
+            if 'events' in request.data:
+                return self._apply_input_events(request, game_session)
+
             serializer = UpdateGameSerializer(data=request.data)
             if serializer.is_valid():
-                game_data = serializer.validated_data['game_data']
-                score = serializer.validated_data['score']
-                
-                game_session.game_data = game_data
-                game_session.score = score
-                
-                # Check if game is over
-                if game_data.get('game_over', False):
-                    game_session.end_game()
-                    # Save high score if it's a new record
-                    self._save_high_score(request.user, score)
-                    
-                    # Clear current game from online player
-                    try:
-                        online_player = OnlinePlayer.objects.get(user=request.user)
-                        online_player.current_game = None
-                        online_player.save()
-                    except OnlinePlayer.DoesNotExist:
-                        pass
-                
-                game_session.save()
+                # The engine steps the stored game to the posted board, so
+                # the score and food come from the server's own state
+                try:
+                    game = load_game(game_session.game_data)
+                    current = apply_posted_state(game, serializer.validated_data['game_data'])
+                except InvalidState as e:
+                    return Response({
+                        'error': str(e)
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                except StateMismatch as e:
+                    # Hand back the stored state for the client to resync from
+                    return Response({
+                        'error': str(e),
+                        'game_state': load_game(game_session.game_data).to_state()
+                    }, status=status.HTTP_409_CONFLICT)
+                game_data = game.to_state()
+                # A late post leaves the stored game as it is
+                if current:
+                    # Stored with the replay log's position; the client gets the board
+                    stored = dict(game_data, replay=game.recorder.to_state()) if game.recorder is not None else game_data
+                    save_game(request.user, game_session, game, stored)
                 
                 return Response({
                     'game_state': game_data,
-                    'score': score,
+                    'score': game.score,
                     'message': 'Game updated successfully'
                 }, status=status.HTTP_200_OK)
             
@@ -232,22 +333,18 @@ class GameViewSet(viewsets.ModelViewSet):
         """End a game session"""
         try:
             game_session = self.get_object()
-            game_session.end_game()
-            
-            # Save high score
-            self._save_high_score(request.user, game_session.score)
-            
-            # Clear current game from online player
+            finish_game(request.user, game_session)
             try:
-                online_player = OnlinePlayer.objects.get(user=request.user)
-                online_player.current_game = None
-                online_player.save()
-            except OnlinePlayer.DoesNotExist:
-                pass
+                percentile = self._percentile(game_session.score)
+            except Exception:
+                # The game is already over; don't fail the request over a nicety
+                logger.exception('Percentile lookup failed')
+                percentile = None
             
             return Response({
                 'message': 'Game ended successfully',
-                'final_score': game_session.score
+                'final_score': game_session.score,
+                'percentile': percentile
             }, status=status.HTTP_200_OK)
             
         except GameSession.DoesNotExist:
@@ -256,64 +353,212 @@ class GameViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
-    @method_decorator(cache_page(10))
     def high_scores(self, request):
-        """Get top 10 high scores - one per user"""
-        # Get highest score for each user, ordered by score descending
-        from django.db.models import Max
-        
-        # Get the best score for each user
-        user_best_scores = HighScore.objects.values('user').annotate(
-            best_score=Max('score')
-        ).order_by('-best_score')[:10]
-        
-        # Get the actual HighScore objects for these user/score combinations
-        high_scores = []
-        for item in user_best_scores:
-            high_score = HighScore.objects.filter(
-                user=item['user'], 
-                score=item['best_score']
-            ).first()
-            if high_score:
-                high_scores.append(high_score)
-        
-        # Minimal fields for leaderboard
+        """
+        Get top high scores - one per user, served from the leaderboard index.
+
+        ?window=day|week ranks only the current day's or week's games;
+        ?around=<user_id|me>&k=5 returns the k entries above and below a user;
+        ?cursor= / ?page_size= switch to keyset pages over (score, date, id).
+
+        Responses are cached until the board's version changes and carry an
+        ETag; a matching If-None-Match gets a 304 (game/caching.py).
+        """
+        window = request.query_params.get('window', 'all')
+        if window != 'all' and window not in PERIODS:
+            return Response({'error': 'Invalid window'}, status=status.HTTP_400_BAD_REQUEST)
+        board = self._leaderboard(window)
+        user_id = request.user.id if request.query_params.get('around') == 'me' else None
+        key, version = _cache_key(request, user_id), board.version
+        etag = high_scores_cache.check(request, key, version)
+        if etag:
+            return _not_modified(etag)
+        # (data, status) so error responses are cached along with the rest
+        (data, code), etag = high_scores_cache.fetch(
+            key, version, lambda: self._high_scores(request, window, board)
+        )
+        if code != status.HTTP_200_OK:
+            return Response(data, status=code)
+        if etag_matches(request, etag):
+            return _not_modified(etag)
+        return _revalidate(Response(data), etag)
+
+    def _high_scores(self, request, window, board):
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            return self._high_scores_page(request, window), status.HTTP_200_OK
+
+        around = request.query_params.get('around')
+        if around:
+            user_id = request.user.id if around == 'me' else around
+            try:
+                user_id = int(user_id)
+                k = min(max(int(request.query_params.get('k', 5)), 0), 50)
+            except (TypeError, ValueError):
+                return {'error': 'Invalid around or k'}, status.HTTP_400_BAD_REQUEST
+            entries = board.around(user_id, k)
+            if entries is None:
+                return {'error': 'User has no high score'}, status.HTTP_404_NOT_FOUND
+        else:
+            try:
+                limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+            except ValueError:
+                limit = 10
+            entries = board.top(limit)
+        return serialize(LeaderboardEntrySerializer, entries, {'request': request}, dicts=True), status.HTTP_200_OK
+
+    def _leaderboard(self, window):
+        """The loaded all-time index, or the live bucket for a day/week window"""
+        if window == 'all':
+            leaderboard.ensure_loaded()
+            return leaderboard
+        return windows.get(window)
+
+    def _high_scores_page(self, request, window='all'):
+        ordering = ['-score', '-date_achieved', '-id']
+        paginator = KeysetPagination(ordering=ordering)
         default_fields = ['user_id', 'username', 'score', 'profile_photo_url']
-        serializer = HighScoreSerializer(high_scores, many=True, context={'request': request, 'only_fields': default_fields})
-        return Response(serializer.data)
+        context = {'request': request, 'only_fields': default_fields}
+        compiled = compile_serializer(HighScoreSerializer, context, dicts=True)
+        if window == 'all':
+            queryset = HighScore.objects.all()
+        else:
+            starts_on = period_start(window, timezone.now())
+            queryset = PeriodBest.objects.filter(period=window, starts_on=starts_on)
+        # values() rows: no model instances for the page or the user join
+        columns = dict.fromkeys(compiled.columns + [name.lstrip('-') for name in ordering])
+        page = paginator.paginate_queryset(queryset.values(*columns), request, view=self)
+        return paginator.get_paginated_response(compiled.serialize(page, context)).data
+
+    @action(detail=False, methods=['get'])
+    def rank(self, request):
+        """Leaderboard position of ?user_id= (defaults to the current user), optionally in ?window="""
+        try:
+            user_id = int(request.query_params.get('user_id', request.user.id))
+        except ValueError:
+            return Response({'error': 'Invalid user_id'}, status=status.HTTP_400_BAD_REQUEST)
+        window = request.query_params.get('window', 'all')
+        if window != 'all' and window not in PERIODS:
+            return Response({'error': 'Invalid window'}, status=status.HTTP_400_BAD_REQUEST)
+        board = self._leaderboard(window)
+        rank = board.rank(user_id)
+        if rank is None:
+            return Response({'error': 'User has no high score'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'user_id': user_id,
+            'rank': rank,
+            'score': board.score(user_id),
+            'total': len(board)
+        })
+
+    @action(detail=False, methods=['get'])
+    def percentile(self, request):
+        """
+        Share of all finished games that ?score= (default: your best) beats.
+
+        Answered from the streaming sketch in game/percentiles.py; ``error``
+        is its rank error in percentage points (99% confidence).
+        """
+        try:
+            score = int(request.query_params.get('score', request.user.best_score))
+        except ValueError:
+            return Response({'error': 'Invalid score'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'score': score,
+            'percentile': self._percentile(score),
+            'games': score_distribution.count,
+            'error': round(score_distribution.error_bound * 100, 2)
+        })
+
+    def _percentile(self, score):
+        fraction = score_distribution.percentile(score)
+        return round(fraction * 100, 1) if fraction is not None else None
 
     @action(detail=False, methods=['get'])
     def me_summary(self, request):
         """Lightweight user summary for header widgets"""
         fields = request.query_params.get('fields')
         default_fields = ['id', 'username', 'best_score', 'total_games_played', 'is_online']
+        requested = {f.strip() for f in fields.split(',') if f.strip()} if fields else set(default_fields)
+        rendered = [name for name in UserProfileSerializer.readable_fields() if name in requested]
+        # request.user may be a token-cache copy; tag and render the current row
+        user = User.objects.only(*UserProfileSerializer.columns_for(rendered)).get(id=request.user.id)
+        etag = _profile_etag(request, user, rendered)
+        if etag_matches(request, etag):
+            return _not_modified(etag)
         context = {'request': request}
         if not fields:
             context['only_fields'] = default_fields
-        serializer = UserProfileSerializer(request.user, context=context)
-        return Response(serializer.data)
+        serializer = UserProfileSerializer(user, context=context)
+        return _revalidate(Response(serializer.data), etag)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def auth_stats(self, request):
+        """Token cache hit rate and estimated DB time saved"""
+        return Response(token_cache.stats())
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def buffer_stats(self, request):
+        """Write-behind buffer counters for tuning flush budgets"""
+        return Response({
+            'game_session': session_buffer.stats(),
+            'user_activity': activity_buffer.stats()
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Hit, stale-serve and rebuild counters of the versioned response caches"""
+        return Response({
+            'high_scores': high_scores_cache.stats(),
+            'online_players': online_players_cache.stats()
+        })
 
     @action(detail=False, methods=['get'])
     def generate_food(self, request):
-        """Generate random food position"""
+        """
+        Current food of the active game.
+
+        Kept for older clients: food now follows the session's seed, which
+        start_game returns in game_state, so clients can place it locally.
+        """
+        game_session = GameSession.objects.filter(user=request.user, is_active=True).defer('replay').first()
+        if game_session is not None:
+            try:
+                game = load_game(session_buffer.overlay(game_session).game_data)
+            except InvalidState:
+                game = None
+            if game is not None and game.food >= 0:
+                return Response({'food': [game.food % game.width, game.food // game.width], 'seed': game.seed})
         x = random.randint(0, 19)  # Assuming 20x20 grid
         y = random.randint(0, 19)
         return Response({'food': [x, y]})
 
-    def _save_high_score(self, user, score):
-        """Save high score - only keep the best score per user"""
-        # Get or create high score for this user
-        existing_score = HighScore.objects.filter(user=user).first()
-        
-        if existing_score:
-            # Update only if new score is higher
-            if score > existing_score.score:
-                existing_score.score = score
-                existing_score.date_achieved = timezone.now()
-                existing_score.save()
-        else:
-            # Create new high score for this user
-            HighScore.objects.create(user=user, score=score)
+    def _apply_input_events(self, request, game_session):
+        """Advance the session from client input events and ack them"""
+        serializer = InputEventsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            game = load_game(game_session.game_data)
+            acked = apply_input_events(
+                game,
+                game_session.game_data.get('seq', 0),
+                serializer.validated_data['seq'],
+                serializer.validated_data['events'],
+                serializer.validated_data.get('tick')
+            )
+        except InputGap as e:
+            # A batch went missing; ask the client to resend from the ack
+            return Response({
+                'error': 'Missing input events',
+                'seq': e.acked
+            }, status=status.HTTP_409_CONFLICT)
+        except InvalidState as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        save_game(request.user, game_session, game, snapshot(game, acked))
+
+        return Response(ack_payload(game, acked), status=status.HTTP_200_OK)
 
 
 class UserProfileView(APIView):
@@ -321,23 +566,34 @@ class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, user_id=None):
-        """Get user profile - own profile or another user's profile"""
-        if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            user = request.user
-        
+        """
+        Get user profile - own profile or another user's profile.
+
+        The ETag covers the profile columns, and the stats through
+        total_games_played (both change in finish_game's transaction) and
+        today's date (the streak). Revalidating takes the one lookup of the
+        row, your own too: request.user may be a token-cache copy up to
+        ``TOKEN_CACHE['TTL']`` seconds old.
+        """
+        try:
+            user = User.objects.get(id=user_id or request.user.id)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = _profile_etag(request, user, UserProfileSerializer.readable_fields(), timezone.localdate())
+        if etag_matches(request, etag):
+            return _not_modified(etag)
         serializer = UserProfileSerializer(user, context={'request': request})
-        return Response(serializer.data)
+        # Running aggregates kept by game/stats.py; empty until the first game
+        stats = UserStats.objects.filter(user_id=user.id).first() or UserStats(user_id=user.id)
+        return _revalidate(Response(dict(serializer.data, stats=UserStatsSerializer(stats).data)), etag)
 
     def put(self, request):
         """Update own profile"""
         serializer = UserProfileSerializer(request.user, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            user = serializer.save()
+            update_profile(user.id, user.username, user.profile_photo.name or None)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -354,6 +610,7 @@ class ProfilePhotoUploadView(APIView):
         user = request.user
         user.profile_photo = request.FILES['profile_photo']
         user.save()
+        update_profile(user.id, user.username, user.profile_photo.name or None)
         
         serializer = UserProfileSerializer(user, context={'request': request})
         return Response({
@@ -363,10 +620,40 @@ class ProfilePhotoUploadView(APIView):
 
 
 class AllUsersView(APIView):
-    """Get all users for browsing profiles"""
+    """
+    Get all users for browsing profiles.
+
+    ?fields= limits both the output and the columns loaded. With ?page_size=
+    or ?cursor= the response is a keyset page; otherwise the whole list is
+    streamed as a JSON array in chunks read from a server-side cursor.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ['-best_score', '-total_games_played', 'id']
+    stream_chunk_size = 500
 
     def get(self, request):
-        users = User.objects.all().order_by('-best_score', '-total_games_played')
-        serializer = UserProfileSerializer(users, many=True, context={'request': request})
-        return Response(serializer.data)
+        fields = self._requested_fields(request)
+        context = {'request': request, 'only_fields': fields}
+        compiled = compile_serializer(UserProfileSerializer, context, dicts=True)
+        columns = dict.fromkeys(compiled.columns + [name.lstrip('-') for name in self.ordering])
+        users = User.objects.values(*columns)
+
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            paginator = KeysetPagination(ordering=self.ordering)
+            page = paginator.paginate_queryset(users, request, view=self)
+            return paginator.get_paginated_response(compiled.serialize(page, context))
+
+        return StreamingJSONResponse(
+            users.order_by(*self.ordering).iterator(chunk_size=self.stream_chunk_size),
+            transform=lambda rows: compiled.serialize(rows, context),
+            chunk_size=self.stream_chunk_size,
+        )
+
+    def _requested_fields(self, request):
+        readable = UserProfileSerializer.readable_fields()
+        param = request.query_params.get('fields')
+        if not param:
+            return readable
+        requested = {f.strip() for f in param.split(',') if f.strip()}
+        return [name for name in readable if name in requested] or readable
+
@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'game.middleware.QueryInspectorMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -169,22 +170,89 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'game.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'game.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'game.pagination.DefaultPagination',
     'PAGE_SIZE': 20,
 }
 
+# JSON encoder behind FastJSONRenderer and streamed lists (see game/renderers.py);
+# 'json' selects DRF's stock encoder, as does a missing orjson package
+JSON_RENDERING = {
+    'BACKEND': os.getenv('JSON_BACKEND', 'orjson'),
+    'STREAM_CHUNK_SIZE': int(os.getenv('JSON_STREAM_CHUNK_SIZE', '500')),
+}
+
 # Google OAuth2 settings
 GOOGLE_OAUTH2_CLIENT_ID = os.getenv('GOOGLE_OAUTH2_CLIENT_ID')
 GOOGLE_OAUTH2_CLIENT_SECRET = os.getenv('GOOGLE_OAUTH2_CLIENT_SECRET')
 
-# Enable ETag support to help clients use conditional requests (304 Not Modified)
-USE_ETAGS = True
+# Conditional GET: polled endpoints set ETags from data versions (see game/caching.py);
+# Django stopped reading USE_ETAGS in 2.1
+
+# WebSocket game channel: seconds between state saves for a connected game
+GAME_SOCKET_PERSIST_INTERVAL = float(os.getenv('GAME_SOCKET_PERSIST_INTERVAL', '2.0'))
+
+# Write-behind buffer for in-progress game state (see game/buffers.py)
+GAME_WRITE_BEHIND = {
+    'ENABLED': os.getenv('GAME_WRITE_BEHIND', 'True').lower() == 'true',
+    'FLUSH_INTERVAL': float(os.getenv('GAME_WRITE_BEHIND_INTERVAL', '1.0')),
+    'ACTIVITY_FLUSH_INTERVAL': float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '5.0')),
+    'MAX_PENDING': int(os.getenv('GAME_WRITE_BEHIND_MAX_PENDING', '256')),
+}
+
+# Seconds between delta syncs of the in-process leaderboard index
+LEADERBOARD_SYNC_INTERVAL = float(os.getenv('LEADERBOARD_SYNC_INTERVAL', '5.0'))
+
+# In-memory presence tracking (see game/presence.py)
+PRESENCE = {
+    'TTL': int(os.getenv('PRESENCE_TTL', '120')),
+    'SNAPSHOT_INTERVAL': float(os.getenv('PRESENCE_SNAPSHOT_INTERVAL', '30.0')),
+}
+
+# Token -> user cache used by CachedTokenAuthentication
+TOKEN_CACHE = {
+    'TTL': float(os.getenv('TOKEN_CACHE_TTL', '30')),
+    'MAX_SIZE': int(os.getenv('TOKEN_CACHE_MAX_SIZE', '10000')),
+}
+
+# Version-keyed caches for polled leaderboard/online responses (see game/caching.py)
+RESPONSE_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+    'BUILD_TIMEOUT': float(os.getenv('RESPONSE_CACHE_BUILD_TIMEOUT', '5.0')),
+    'ONLINE_PLAYERS_MAX_AGE': float(os.getenv('RESPONSE_CACHE_ONLINE_MAX_AGE', '5.0')),
+}
+
+# Per-request query count, DB time and N+1 logging (see game/middleware.py)
+QUERY_INSPECTOR = {
+    'ENABLED': os.getenv('QUERY_INSPECTOR', 'False').lower() == 'true',
+    'SLOW_REQUEST_MS': float(os.getenv('QUERY_INSPECTOR_SLOW_REQUEST_MS', '200')),
+    'SLOW_QUERY_MS': float(os.getenv('QUERY_INSPECTOR_SLOW_QUERY_MS', '50')),
+    'MAX_QUERIES': int(os.getenv('QUERY_INSPECTOR_MAX_QUERIES', '30')),
+    'N_PLUS_ONE_THRESHOLD': int(os.getenv('QUERY_INSPECTOR_N_PLUS_ONE', '5')),
+}
+
+# Hot/cold archival of ended game sessions (see game/archive.py)
+GAME_ARCHIVE = {
+    'AFTER_DAYS': int(os.getenv('GAME_ARCHIVE_AFTER_DAYS', '30')),
+    'BATCH_SIZE': int(os.getenv('GAME_ARCHIVE_BATCH_SIZE', '1000')),
+}
+
+# Streaming score percentiles (see game/percentiles.py)
+SCORE_SKETCH = {
+    'K': int(os.getenv('SCORE_SKETCH_K', '200')),
+    'PERSIST_INTERVAL': float(os.getenv('SCORE_SKETCH_PERSIST_INTERVAL', '30.0')),
+}
+
+# Day/week leaderboard buckets kept after they finish (see game/leaderboard.py)
+LEADERBOARD_WINDOWS = {
+    'KEEP_DAYS': int(os.getenv('LEADERBOARD_KEEP_DAYS', '7')),
+    'KEEP_WEEKS': int(os.getenv('LEADERBOARD_KEEP_WEEKS', '4')),
+}
@@ -113,21 +113,22 @@ function App() {
         game_data: newGameState,
         score: newGameState.score
       }, authToken);
-      
-      if (newGameState.game_over) {
-        // End the game session and save high score
-        try {
-          await gameAPI.endGame(gameId, authToken);
-        } catch (error) {
-          console.error('End game error:', error);
-        }
-        
-        setGameStatus('gameOver');
-        loadHighScores(); // Refresh high scores
-      }
     } catch (error) {
       console.error('Update game error:', error);
     }
+
+    if (newGameState.game_over) {
+      // End the game session and save high score, even if the last update
+      // was refused: the server finishes the game from its own board
+      try {
+        await gameAPI.endGame(gameId, authToken);
+      } catch (error) {
+        console.error('End game error:', error);
+      }
+      
+      setGameStatus('gameOver');
+      loadHighScores(); // Refresh high scores
+    }
   };
 
   const restartGame = async () => {
@@ -1,4 +1,5 @@
 import React, { useEffect, useCallback, useRef, useState } from 'react';
+import { nextFood } from '../utils/food';
 
 const BOARD_SIZE = 20;
 
@@ -88,13 +89,17 @@ const GameBoard = ({ gameState, setGameState, gameStatus, onUpdateGame, playerNa
     // Check food collision
     if (head[0] === gameState.food[0] && head[1] === gameState.food[1]) {
       newScore += 10;
-      // Generate new food position
-      do {
-        newFood = [
-          Math.floor(Math.random() * BOARD_SIZE),
-          Math.floor(Math.random() * BOARD_SIZE)
-        ];
-      } while (newSnake.some(segment => segment[0] === newFood[0] && segment[1] === newFood[1]));
+      // Same placement as the server: derived from the session seed
+      if (gameState.seed !== undefined && gameState.seed !== null) {
+        newFood = nextFood(gameState.seed, newSnake, BOARD_SIZE);
+      } else {
+        do {
+          newFood = [
+            Math.floor(Math.random() * BOARD_SIZE),
+            Math.floor(Math.random() * BOARD_SIZE)
+          ];
+        } while (newSnake.some(segment => segment[0] === newFood[0] && segment[1] === newFood[1]));
+      }
     } else {
       newSnake.pop(); // Remove tail if no food eaten
     }
@@ -0,0 +1,42 @@
+// Deterministic food placement, mirroring backend/game/engine.py
+// (food_hash and SnakeGame.spawn_food). Given the session seed from
+// start_game, client and server agree on every food without a round trip.
+
+const INITIAL_LENGTH = 3;
+const FOOD_ATTEMPTS = 32;
+
+export const foodHash = (seed, n, attempt) => {
+  let h = (seed ^ Math.imul(n, 0x9e3779b1) ^ Math.imul(attempt, 0x85ebca77)) >>> 0;
+  h ^= h >>> 16;
+  h = Math.imul(h, 0x7feb352d) >>> 0;
+  h ^= h >>> 15;
+  h = Math.imul(h, 0x846ca68b) >>> 0;
+  h ^= h >>> 16;
+  return h >>> 0;
+};
+
+// Next food for a snake (head first, [x, y] pairs) that has just grown.
+// Returns null when the board is full.
+export const nextFood = (seed, snake, boardSize) => {
+  const size = boardSize * boardSize;
+  if (snake.length >= size) return null;
+
+  const occupied = new Uint8Array(size);
+  snake.forEach(([x, y]) => { occupied[y * boardSize + x] = 1; });
+
+  const n = snake.length - INITIAL_LENGTH;
+  for (let attempt = 0; attempt < FOOD_ATTEMPTS; attempt++) {
+    const cell = foodHash(seed, n, attempt) % size;
+    if (!occupied[cell]) return [cell % boardSize, Math.floor(cell / boardSize)];
+  }
+
+  // Crowded board: pick among the free cells in board order
+  let k = foodHash(seed, n, FOOD_ATTEMPTS) % (size - snake.length);
+  for (let cell = 0; cell < size; cell++) {
+    if (!occupied[cell]) {
+      if (k === 0) return [cell % boardSize, Math.floor(cell / boardSize)];
+      k -= 1;
+    }
+  }
+  return null;
+};